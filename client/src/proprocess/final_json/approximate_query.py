@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+"""
+Approximate Query Engine
+Answers simple aggregate proposition queries from a stratified sample of a large table,
+scaling COUNT/SUM estimates by stratum weights and attaching confidence intervals.
+"""
+
+import re
+import sqlite3
+import numpy as np
+import pandas as pd
+from typing import List, Dict, Any, Optional, Tuple
+
+from dictionary_encoding import row_source
+from sql_parsing import QUERY_SHAPE, split_top_level
+
+# Default: stratify the synthetic crime table by borough and month
+DEFAULT_STRATA = {'crime_data': ['borough_name', 'date']}
+
+AGGREGATE_ITEM = re.compile(r'^(COUNT|SUM|AVG)\s*\(\s*(.+?)\s*\)$', re.IGNORECASE | re.DOTALL)
+UNSUPPORTED = re.compile(r'\b(JOIN|UNION|HAVING|OVER|DISTINCT|MIN|MAX)\b|\(\s*SELECT\b', re.IGNORECASE)
+Z_SCORES = {0.90: 1.645, 0.95: 1.96, 0.99: 2.576}
+
+
+class ApproximateQueryEngine:
+    """Maintains stratified samples and answers eligible aggregate queries from them"""
+
+    def __init__(self, conn: sqlite3.Connection, strata: Optional[Dict[str, List[str]]] = None,
+                 sample_fraction: float = 0.01, min_per_stratum: int = 2, confidence: float = 0.95,
+                 seed: int = 42):
+        self.conn = conn
+        self.strata = strata if strata is not None else DEFAULT_STRATA
+        self.sample_fraction = sample_fraction
+        self.min_per_stratum = min_per_stratum
+        self.confidence = confidence
+        self.z = Z_SCORES.get(confidence, 1.96)
+        self.seed = seed
+        self.sampled_tables: Dict[str, Dict[str, Any]] = {}
+
+    def build_samples(self):
+        """(Re)build the stratified sample for every configured table"""
+        for table_name in self.strata:
+            self.refresh(table_name)
+
+    def refresh(self, table_name: str):
+        """Rebuild one table's sample and stratum statistics"""
+        strata_cols = self.strata.get(table_name, [])
+        try:
+            key_select = ', '.join(f'"{c}"' for c in strata_cols) if strata_cols else "'all' AS _all"
+            keys = pd.read_sql_query(f'SELECT _rowid, {key_select} FROM {row_source(self.conn, table_name)}', self.conn)
+        except Exception as e:
+            print(f"    ⚠️  Cannot sample {table_name}: {e}")
+            return
+
+        if keys.empty:
+            return
+
+        key_cols = strata_cols or ['_all']
+        stratum = keys[key_cols[0]].astype(str)
+        for col in key_cols[1:]:
+            stratum = stratum + '|' + keys[col].astype(str)
+        keys['_stratum'] = stratum
+
+        # Proportional allocation with a floor so every stratum has a variance estimate
+        rng = np.random.default_rng(self.seed)
+        sizes = keys.groupby('_stratum').size()
+        targets = np.minimum(sizes, np.maximum(self.min_per_stratum, np.ceil(sizes * self.sample_fraction))).astype(int)
+        order = rng.permutation(len(keys))
+        shuffled = keys.iloc[order]
+        shuffled = shuffled.assign(_rank=shuffled.groupby('_stratum').cumcount())
+        sample_keys = shuffled[shuffled['_rank'] < shuffled['_stratum'].map(targets)][['_rowid', '_stratum']]
+
+        sample_table = f'{table_name}__sample'
+        strata_table = f'{table_name}__strata'
+        sample_keys.to_sql('_sample_keys', self.conn, if_exists='replace', index=False)
+        self.conn.execute(f'DROP TABLE IF EXISTS "{sample_table}"')
+        self.conn.execute(
+            f'CREATE TABLE "{sample_table}" AS SELECT t.*, k._stratum AS _stratum '
+            f'FROM {row_source(self.conn, table_name)} t JOIN _sample_keys k ON t._rowid = k._rowid'
+        )
+        self.conn.execute('DROP TABLE _sample_keys')
+
+        pd.DataFrame({'_stratum': sizes.index, 'stratum_rows': sizes.values, 'sampled_rows': targets.values}).to_sql(
+            strata_table, self.conn, if_exists='replace', index=False
+        )
+
+        self.sampled_tables[table_name] = {
+            'sample_table': sample_table,
+            'strata_table': strata_table,
+            'population_rows': int(sizes.sum()),
+            'sample_rows': int(targets.sum()),
+            'strata': len(sizes),
+        }
+        print(f"    🎯 Sampled {table_name}: {int(targets.sum())} of {int(sizes.sum())} rows "
+              f"across {len(sizes)} strata ({', '.join(strata_cols) or 'uniform'})")
+
+    def parse(self, sql_query: str) -> Optional[Dict[str, Any]]:
+        """Return the query's structure if it can be answered from a sample, else None"""
+        if UNSUPPORTED.search(sql_query):
+            return None
+        match = QUERY_SHAPE.match(sql_query.strip())
+        if not match or match.group('table') not in self.sampled_tables:
+            return None
+
+        keys, aggregates, outputs = [], [], []
+        for item in split_top_level(match.group('select')):
+            as_match = re.match(r'^(.+?)\s+AS\s+"?(\w+)"?$', item, re.IGNORECASE | re.DOTALL)
+            expr, alias = (as_match.group(1).strip(), as_match.group(2)) if as_match else (item, item)
+            outputs.append((expr, alias))
+            agg_match = AGGREGATE_ITEM.match(expr)
+            if agg_match:
+                func, arg = agg_match.group(1).upper(), agg_match.group(2)
+                aggregates.append({'alias': alias, 'func': func, 'arg': arg})
+            elif re.search(r'\b(COUNT|SUM|AVG)\s*\(', expr, re.IGNORECASE):
+                return None  # aggregate buried in an expression (e.g. ratios)
+            else:
+                keys.append({'alias': alias, 'expr': expr})
+
+        group_by = match.group('group')
+        if not aggregates or (keys and not group_by):
+            return None
+        order = self._resolve_order(match.group('order'), outputs)
+        if order is None:
+            return None
+
+        return {
+            'table': match.group('table'),
+            'keys': keys,
+            'aggregates': aggregates,
+            'where': match.group('where'),
+            'group_by': group_by,
+            'order': order,
+            'limit': int(match.group('limit')) if match.group('limit') else None,
+        }
+
+    def execute(self, sql_query: str, max_rows: int = 100) -> Optional[Tuple[List[Dict[str, Any]], Dict[str, Any]]]:
+        """Estimate an eligible query from the sample; returns (rows, approximation info) or None"""
+        plan = self.parse(sql_query)
+        if plan is None:
+            return None
+
+        info = self.sampled_tables[plan['table']]
+        select_items = [f"{k['expr']} AS \"{k['alias']}\"" for k in plan['keys']] + ['_stratum', 'COUNT(*) AS __c']
+        for i, agg in enumerate(plan['aggregates']):
+            if agg['func'] == 'COUNT':
+                if agg['arg'] == '*':
+                    continue
+                y = f"CASE WHEN {agg['arg']} IS NOT NULL THEN 1 ELSE 0 END"
+            else:
+                y = f"CAST({agg['arg']} AS REAL)"
+            select_items += [f'SUM({y}) AS __s1_{i}', f'SUM(({y}) * ({y})) AS __s2_{i}']
+
+        group_by = f"{plan['group_by']}, _stratum" if plan['group_by'] else '_stratum'
+        stratum_sql = f'SELECT {", ".join(select_items)} FROM "{info["sample_table"]}"'
+        if plan['where']:
+            stratum_sql += f" WHERE {plan['where']}"
+        stratum_sql += f' GROUP BY {group_by}'
+
+        try:
+            per_stratum = pd.read_sql_query(stratum_sql, self.conn)
+        except Exception as e:
+            print(f"    ⚠️  Approximate execution failed, using exact mode: {e}")
+            return None
+
+        strata = pd.read_sql_query(f'SELECT * FROM "{info["strata_table"]}"', self.conn)
+        df = per_stratum.merge(strata, on='_stratum', how='left')
+        df['__w'] = df['stratum_rows'] / df['sampled_rows']
+        df['__v'] = np.where(
+            df['sampled_rows'] > 1,
+            df['stratum_rows'] ** 2 * (1 - df['sampled_rows'] / df['stratum_rows']) / df['sampled_rows'] / (df['sampled_rows'] - 1).clip(lower=1),
+            0.0
+        )
+
+        key_aliases = [k['alias'] for k in plan['keys']]
+        group_cols = key_aliases or ['__all']
+        if not key_aliases:
+            df['__all'] = 0
+
+        def total_and_variance(s1: pd.Series, s2: pd.Series) -> pd.DataFrame:
+            """Stratified estimate of a total and its variance per output group"""
+            frame = df[group_cols].copy()
+            frame['t'] = df['__w'] * s1
+            frame['v'] = df['__v'] * (s2 - s1 ** 2 / df['sampled_rows'])
+            return frame.groupby(group_cols, dropna=False, sort=False)[['t', 'v']].sum()
+
+        c = df['__c'].astype(float)
+        count_est = total_and_variance(c, c)
+        result = pd.DataFrame(index=count_est.index)
+
+        for i, agg in enumerate(plan['aggregates']):
+            alias = agg['alias']
+            if agg['func'] == 'COUNT' and agg['arg'] == '*':
+                est = count_est
+            else:
+                s1, s2 = df[f'__s1_{i}'].fillna(0.0), df[f'__s2_{i}'].fillna(0.0)
+                est = total_and_variance(s1, s2)
+
+            if agg['func'] == 'AVG':
+                # Ratio estimator with linearized variance: z = y - R * 1[row in group]
+                estimate = est['t'] / count_est['t'].replace(0, np.nan)
+                r = df[group_cols].merge(estimate.rename('R').reset_index(), on=group_cols, how='left')['R'].values
+                z = total_and_variance(s1 - r * c, s2 - 2 * r * s1 + r ** 2 * c)
+                std_err = np.sqrt(z['v'].clip(lower=0)) / count_est['t'].replace(0, np.nan)
+            else:
+                estimate = est['t']
+                std_err = np.sqrt(est['v'].clip(lower=0))
+
+            result[alias] = estimate
+            result[f'__lo_{alias}'] = estimate - self.z * std_err
+            result[f'__hi_{alias}'] = estimate + self.z * std_err
+
+        result = result.reset_index()
+        result = self._apply_order_and_limit(result, plan, max_rows)
+
+        rows, intervals = [], []
+        for record in result.to_dict('records'):
+            row = {k: record[k] for k in key_aliases}
+            bounds = {}
+            for agg in plan['aggregates']:
+                alias = agg['alias']
+                row[alias] = self._format_estimate(record[alias], agg['func'])
+                bounds[alias] = [self._format_estimate(record[f'__lo_{alias}'], agg['func']),
+                                 self._format_estimate(record[f'__hi_{alias}'], agg['func'])]
+            rows.append(row)
+            intervals.append(bounds)
+
+        approximation = {
+            'method': 'stratified_sample',
+            'table': plan['table'],
+            'strata': self.strata.get(plan['table'], []),
+            'sample_rows': info['sample_rows'],
+            'population_rows': info['population_rows'],
+            'confidence': self.confidence,
+            'intervals': intervals,
+        }
+        print(f"    ≈ Approximate result from {info['sample_rows']} sampled rows "
+              f"({info['sample_rows'] / max(1, info['population_rows']):.1%} of {plan['table']})")
+        return rows, approximation
+
+    @staticmethod
+    def _resolve_order(order_by: Optional[str], outputs: List[Tuple[str, str]]) -> Optional[List[Tuple[str, bool]]]:
+        """(output alias, ascending) per ORDER BY item; None if an item is not a SELECT item
+
+        outputs are the (expression, alias) SELECT items in order. ORDER BY items may name an
+        alias, repeat an expression (COUNT(*), an un-aliased group column) or give a position;
+        anything else cannot be sorted on after estimation, so the query runs exactly.
+        """
+        if not order_by:
+            return []
+
+        def normalize(expr: str) -> str:
+            return re.sub(r'\s+', '', expr).replace('"', '').lower()
+
+        targets = {normalize(expr): alias for expr, alias in reversed(outputs)}
+        # Aliases win over expressions, as in SQLite
+        targets.update({normalize(alias): alias for _, alias in outputs})
+
+        order = []
+        for term in split_top_level(order_by):
+            term_match = re.match(r'^(.+?)(?:\s+(ASC|DESC))?$', term.strip(), re.IGNORECASE | re.DOTALL)
+            expr = term_match.group(1)
+            if expr.isdigit():
+                alias = outputs[int(expr) - 1][1] if 1 <= int(expr) <= len(outputs) else None
+            else:
+                alias = targets.get(normalize(expr))
+            if alias is None:
+                return None
+            order.append((alias, (term_match.group(2) or 'ASC').upper() == 'ASC'))
+        return order
+
+    def _apply_order_and_limit(self, result: pd.DataFrame, plan: Dict[str, Any], max_rows: int) -> pd.DataFrame:
+        """Apply the resolved ORDER BY, then LIMIT"""
+        if plan['order']:
+            columns = [alias for alias, _ in plan['order']]
+            ascending = [asc for _, asc in plan['order']]
+            result = result.sort_values(columns, ascending=ascending, kind='mergesort')
+        limit = plan['limit'] if plan['limit'] is not None else max_rows
+        return result.head(limit)
+
+    def _format_estimate(self, value: Any, func: str) -> Any:
+        """Counts as integers, other estimates rounded for JSON"""
+        if value is None or (isinstance(value, float) and np.isnan(value)):
+            return None
+        if func == 'COUNT':
+            return int(round(float(value)))
+        return round(float(value), 4)
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Async SQL Query Executor
+asyncio front end for SQLQueryExecutor, for event-loop services (web handlers, the async
+validation pipeline). Calls run on a bounded thread pool whose threads each query their own
+copy of the loaded database; a call that times out or is cancelled has its running SQLite
+statement interrupted, so the worker is freed instead of finishing work nobody will read.
+"""
+
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional, AsyncIterator, Callable
+
+from execute_sql_queries import SQLQueryExecutor
+
+
+class _Call:
+    """One submitted call: which worker connection it is running on, so it can be interrupted"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.conn = None
+        self.abandoned = False
+
+    def interrupt(self):
+        """Stop the call's running statement (no-op if it has not started or has finished)"""
+        with self.lock:
+            self.abandoned = True
+            if self.conn is not None:
+                self.conn.interrupt()
+
+
+class AsyncSQLQueryExecutor:
+    """Awaitable execute / process / process_stream over an SQLQueryExecutor
+
+    Usage:
+        async with AsyncSQLQueryExecutor(max_workers=4) as executor:
+            rows = await executor.execute('SELECT ...', timeout=5)
+            async for result in executor.process_stream(propositions, timeout=30):
+                ...
+    """
+
+    def __init__(self, executor: Optional[SQLQueryExecutor] = None, max_workers: int = 4, **executor_kwargs):
+        """Wrap an existing executor, or build one from executor_kwargs
+
+        Args:
+            executor (SQLQueryExecutor): Loaded executor to share (its database is copied once per worker)
+            max_workers (int): Pool threads, i.e. the most calls running at once; further calls queue
+        """
+        self.executor = executor or SQLQueryExecutor(**executor_kwargs)
+        self.max_workers = max_workers
+        self._pool = ThreadPoolExecutor(max_workers=max_workers,
+                                        initializer=self.executor._init_worker_connection,
+                                        thread_name_prefix='async-sql')
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def close(self):
+        """Wait for running calls, then release the pool and its database copies"""
+        await asyncio.get_running_loop().run_in_executor(None, self._pool.shutdown, True)
+        self.executor._close_worker_connections()
+
+    async def _run(self, call: Callable[[], Any], timeout: Optional[float]):
+        """Run call on the pool; on timeout or cancellation interrupt it and re-raise"""
+        state = _Call()
+
+        def job():
+            with state.lock:
+                if state.abandoned:
+                    raise asyncio.CancelledError()
+                state.conn = self.executor.query_conn
+            try:
+                return call()
+            finally:
+                with state.lock:
+                    state.conn = None
+
+        future = asyncio.wrap_future(self._pool.submit(job))
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            # wait_for cancels the future, which only stops calls still queued; running ones need the interrupt
+            state.interrupt()
+            raise
+
+    async def execute(self, sql_query: str, max_rows: int = 100,
+                      timeout: Optional[float] = None) -> Any:
+        """Rows of sql_query (or an error dict, as execute_sql_query returns); errors on timeout as well"""
+        try:
+            return await self._run(lambda: self.executor.execute_sql_query(sql_query, max_rows), timeout)
+        except asyncio.TimeoutError:
+            return {"error": f"Query timed out after {timeout}s"}
+
+    async def process(self, proposition: Dict[str, Any],
+                      timeout: Optional[float] = None) -> Dict[str, Any]:
+        """process_proposition result for one proposition; timeouts become error results"""
+        try:
+            return await self._run(lambda: self.executor.process_proposition(proposition), timeout)
+        except asyncio.TimeoutError:
+            return self._error_result(proposition, f"Timed out after {timeout}s")
+        except Exception as e:
+            return self._error_result(proposition, str(e))
+
+    async def process_stream(self, propositions: List[Dict[str, Any]], timeout: Optional[float] = None,
+                             ordered: bool = False) -> AsyncIterator[Dict[str, Any]]:
+        """Results as each proposition finishes (input order if ordered)
+
+        At most max_workers propositions run at once. Closing the iterator early cancels the rest.
+        """
+        tasks = [asyncio.ensure_future(self.process(proposition, timeout)) for proposition in propositions]
+        try:
+            for next_result in (tasks if ordered else asyncio.as_completed(tasks)):
+                yield await next_result
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _error_result(self, proposition: Dict[str, Any], error: str) -> Dict[str, Any]:
+        """Error result in the same shape process_all_propositions records"""
+        print(f"❌ Error processing proposition {proposition.get('proposition_id')}: {error}")
+        return {
+            "proposition_id": proposition.get('proposition_id'),
+            "error": error,
+            "dataset_version": self.executor.dataset_version
+        }
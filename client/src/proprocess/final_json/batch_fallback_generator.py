@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""
+Batch Fallback Data Generator
+Rule-based fallback data for chart propositions, generated in vectorized NumPy passes.
+Propositions are grouped by (generation strategy, dataset) so each group costs one draw.
+"""
+
+import numpy as np
+from collections import defaultdict
+from typing import List, Dict, Any, Optional, Tuple
+
+# Hardcoded categories used when metadata has no usable categorical column
+DEFAULT_CATEGORIES = {
+    'crime-rates': (['violent-crime', 'theft', 'burglary', 'anti-social-behaviour', 'drug-offences'], (100, 1500)),
+    'country-of-births': (['United Kingdom', 'India', 'Poland', 'Ireland', 'Nigeria', 'Bangladesh'], (500, 5000)),
+    'ethnicity': (['White British', 'Asian', 'Black', 'Mixed', 'Other'], (10000, 100000)),
+    'income': (['Westminster', 'Kensington and Chelsea', 'Camden', 'Tower Hamlets', 'Hackney'], (25000, 65000)),
+}
+
+# Value ranges applied when categories come from metadata
+METADATA_VALUE_RANGES = {
+    'crime-rates': (100, 1500),
+    'population': (10000, 100000),
+    'income': (25000, 65000),
+}
+
+TIME_SERIES_SPECS = {
+    'crime-rates': (['2022-01', '2022-06', '2022-12', '2023-01', '2023-06', '2023-12'], (500, 2000)),
+    'population': (['2001', '2006', '2011', '2016', '2021'], (200000, 500000)),
+}
+
+GROWTH_WORDS = ('increase', 'surge', 'rise', 'growth')
+CATEGORY_KEYWORDS = ('name', 'category', 'type', 'group', 'borough')
+
+Item = Tuple[Dict[str, Any], Dict[str, Any]]
+
+
+class PendingFallback(list):
+    """Placeholder result list filled in place when a deferred batch is flushed"""
+    pass
+
+
+class BatchFallbackGenerator:
+    """Generates rule-based fallback data for many propositions at once"""
+
+    def __init__(self, metadata_index: Dict[str, Dict[str, Any]], dataset_names: List[str], seed: Optional[int] = None):
+        self.metadata_index = metadata_index
+        # Longest names first so prefix matching picks the most specific dataset
+        self.dataset_names = sorted(dataset_names, key=len, reverse=True)
+        self.rng = np.random.default_rng(seed)
+        self._categorical_specs: Dict[Optional[str], Tuple[List[str], Tuple[int, int], bool]] = {}
+
+    def dataset_for(self, prop_id: str) -> Optional[str]:
+        """Dataset name (e.g. 'crime-rates') from a proposition ID prefix"""
+        for ds_name in self.dataset_names:
+            if prop_id.startswith(ds_name):
+                return ds_name
+        return None
+
+    def generate(self, items: List[Item]) -> List[List[Dict[str, Any]]]:
+        """Generate fallback rows for (proposition, requirements) pairs, preserving order"""
+        groups = defaultdict(list)
+        for index, (proposition, requirements) in enumerate(items):
+            dataset_name = self.dataset_for(proposition.get('proposition_id', ''))
+            groups[(requirements['data_generation_strategy'], dataset_name)].append(index)
+
+        results: List[List[Dict[str, Any]]] = [[] for _ in items]
+        for (strategy, dataset_name), indices in groups.items():
+            generator = getattr(self, f'_batch_{strategy}', self._batch_categorical)
+            group_items = [items[i] for i in indices]
+
+            context = f" ({dataset_name})" if dataset_name else ""
+            print(f"    🎲 Generating {strategy} data for {len(indices)} proposition(s){context}")
+            if dataset_name in self.metadata_index:
+                print(f"    📊 Using metadata context for {dataset_name}")
+
+            for index, rows in zip(indices, generator(dataset_name, group_items)):
+                results[index] = rows
+
+        return results
+
+    def _batch_time_series(self, dataset_name: Optional[str], items: List[Item]) -> List[List[Dict[str, Any]]]:
+        """Trend series: base * trend**t + noise, one (k, m) draw per group"""
+        min_records = [req['min_records'] for _, req in items]
+        m = max(min_records)
+        if dataset_name in TIME_SERIES_SPECS:
+            time_values, base_range = TIME_SERIES_SPECS[dataset_name]
+        else:
+            time_values, base_range = [f"2022-{i:02d}" for i in range(1, m + 1)], (100, 1000)
+
+        k = len(items)
+        width = min(m, len(time_values))
+        base = self.rng.integers(base_range[0], base_range[1] + 1, size=k)
+        trend = np.array([
+            1.1 if any(w in prop.get('proposition_description', '').lower() for w in GROWTH_WORDS) else 0.95
+            for prop, _ in items
+        ])
+        noise = self.rng.integers(-50, 51, size=(k, width))
+        values = (base[:, None] * trend[:, None] ** np.arange(width) + noise).astype(int)
+        values = np.maximum(0, values).tolist()
+
+        return [
+            [{'time': t, 'value': v} for t, v in zip(time_values[:n], row[:n])]
+            for n, row in zip(min_records, values)
+        ]
+
+    def _categorical_spec(self, dataset_name: Optional[str]) -> Tuple[List[str], Tuple[int, int], bool]:
+        """(categories, value range, is_generic) for a dataset, cached after first lookup"""
+        if dataset_name in self._categorical_specs:
+            return self._categorical_specs[dataset_name]
+
+        categories, base_range = [], (50, 500)
+        metadata = self.metadata_index.get(dataset_name) if dataset_name else None
+        if metadata and metadata.get('files'):
+            value_examples = metadata['files'][0].get('file_summary', {}).get('value_examples', {})
+            for col_name, values in value_examples.items():
+                if isinstance(values, list) and len(values) > 1:
+                    if any(keyword in col_name.lower() for keyword in CATEGORY_KEYWORDS):
+                        categories = values
+                        break
+            base_range = METADATA_VALUE_RANGES.get(dataset_name, base_range)
+
+        if not categories and dataset_name in DEFAULT_CATEGORIES:
+            categories, base_range = DEFAULT_CATEGORIES[dataset_name]
+
+        spec = (categories, base_range, not categories)
+        self._categorical_specs[dataset_name] = spec
+        return spec
+
+    def _batch_categorical(self, dataset_name: Optional[str], items: List[Item]) -> List[List[Dict[str, Any]]]:
+        """Category/value pairs from metadata or default categories"""
+        categories, base_range, is_generic = self._categorical_spec(dataset_name)
+        min_records = [req['min_records'] for _, req in items]
+        m = max(min_records)
+        if is_generic:
+            categories = [f'Category_{i+1}' for i in range(m)]
+
+        values = self.rng.integers(base_range[0], base_range[1] + 1, size=(len(items), m)).tolist()
+        return [
+            [{'category': c, 'value': v} for c, v in zip(categories[:n], row)]
+            for n, row in zip(min_records, values)
+        ]
+
+    def _batch_distribution(self, dataset_name: Optional[str], items: List[Item]) -> List[List[Dict[str, Any]]]:
+        """Heatmap/histogram cells over an x/y bin grid"""
+        if dataset_name == 'crime-rates':
+            x_bins = ['violent-crime', 'theft', 'burglary', 'drug-offences']
+            y_bins = ['Westminster', 'Camden', 'Hackney', 'Tower Hamlets']
+        else:
+            x_bins = [f'X_Bin_{i+1}' for i in range(4)]
+            y_bins = [f'Y_Bin_{i+1}' for i in range(4)]
+
+        cells = [(x, y) for x in x_bins for y in y_bins]
+        min_records = [req['min_records'] for _, req in items]
+        counts = self.rng.integers(5, 101, size=(len(items), len(cells))).tolist()
+        return [
+            [{'x_bin': x, 'y_bin': y, 'count': c} for (x, y), c in zip(cells[:n], row)]
+            for n, row in zip(min_records, counts)
+        ]
+
+    def _batch_multi_dimensional(self, dataset_name: Optional[str], items: List[Item]) -> List[List[Dict[str, Any]]]:
+        """Category x dimension grid with values"""
+        if dataset_name == 'crime-rates':
+            categories = ['violent-crime', 'theft', 'burglary']
+            dimensions = ['Westminster', 'Camden', 'Hackney']
+        elif dataset_name == 'ethnicity':
+            categories = ['White British', 'Asian', 'Black']
+            dimensions = ['Inner London', 'Outer London']
+        else:
+            categories = [f'Cat_{i+1}' for i in range(3)]
+            dimensions = [f'Dim_{i+1}' for i in range(3)]
+
+        cells = [(c, d) for c in categories for d in dimensions]
+        min_records = [req['min_records'] for _, req in items]
+        values = self.rng.integers(100, 1001, size=(len(items), len(cells))).tolist()
+        return [
+            [{'category': c, 'value': v, 'dimension': d} for (c, d), v in zip(cells[:n], row)]
+            for n, row in zip(min_records, values)
+        ]
+
+    def _batch_divergent(self, dataset_name: Optional[str], items: List[Item]) -> List[List[Dict[str, Any]]]:
+        """Positive/negative value pairs per category"""
+        min_records = [req['min_records'] for _, req in items]
+        m = max(min_records)
+        if dataset_name == 'crime-rates':
+            categories = ['violent-crime', 'theft', 'burglary', 'drug-offences']
+        elif dataset_name == 'income':
+            categories = ['Westminster', 'Kensington and Chelsea', 'Camden', 'Tower Hamlets']
+        else:
+            categories = [f'Category_{i+1}' for i in range(m)]
+
+        positive = self.rng.integers(50, 301, size=(len(items), m)).tolist()
+        negative = self.rng.integers(0, 101, size=(len(items), m)).tolist()
+        return [
+            [{'category': c, 'positive_value': p, 'negative_value': q}
+             for c, p, q in zip(categories[:n], pos_row, neg_row)]
+            for n, pos_row, neg_row in zip(min_records, positive, negative)
+        ]
+
+    def _batch_combo(self, dataset_name: Optional[str], items: List[Item]) -> List[List[Dict[str, Any]]]:
+        """Bar and line values per category"""
+        min_records = [req['min_records'] for _, req in items]
+        m = max(min_records)
+        if dataset_name == 'crime-rates':
+            categories = ['Westminster', 'Camden', 'Hackney', 'Tower Hamlets', 'Lambeth']
+        else:
+            categories = [f'Area_{i+1}' for i in range(m)]
+
+        bars = self.rng.integers(100, 801, size=(len(items), m)).tolist()
+        lines = self.rng.integers(50, 201, size=(len(items), m)).tolist()
+        return [
+            [{'category': c, 'bar_value': b, 'line_value': l}
+             for c, b, l in zip(categories[:n], bar_row, line_row)]
+            for n, bar_row, line_row in zip(min_records, bars, lines)
+        ]
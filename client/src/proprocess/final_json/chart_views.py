@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+Chart-Shape Views
+Materializes the result shapes that recur across propositions (value by borough for a period,
+value over time for a borough, totals over time, top categories) once per dataset, and serves
+structurally matching proposition queries from them without touching the base tables.
+"""
+
+import re
+import sqlite3
+from typing import List, Dict, Any, Optional
+
+from sql_parsing import QUERY_SHAPE, split_top_level, split_conjuncts, query_template
+
+# Which column plays each role in the long-format datasets; roles without a column are skipped
+CHART_VIEW_SPECS = {
+    'crime_data': {
+        'borough': 'borough_name', 'period': 'year', 'time': 'date', 'category': 'crime_category',
+        'measures': [],
+    },
+    'birth_country_data': {
+        'borough': 'Area_Name', 'period': 'Year', 'time': 'Year', 'category': 'Broad_group',
+        'measures': ['Estimate'],
+    },
+    'house_price_data': {
+        'borough': 'Area', 'period': 'Year', 'time': 'Year', 'category': 'Measure',
+        'measures': ['Value'],
+    },
+    'gym_data': {
+        'borough': 'borough_name', 'category': 'gym_type',
+        'measures': ['facility_count', 'population'],
+    },
+}
+
+# Canonical shapes: parameter roles are fixed by equality filters, output roles are grouped on
+CHART_SHAPES = {
+    'value_by_borough': {'params': ['period'], 'outputs': ['borough']},
+    'value_over_time': {'params': ['borough'], 'outputs': ['time']},
+    'total_over_time': {'params': [], 'outputs': ['time']},
+    'category_totals': {'params': [], 'outputs': ['category']},
+    'borough_totals': {'params': [], 'outputs': ['borough']},
+}
+
+VIEW_AGGREGATES = ('SUM', 'AVG', 'MIN', 'MAX')
+IDENTIFIER = re.compile(r'^"?([A-Za-z_]\w*)"?$')
+AGGREGATE_ITEM = re.compile(r'^(COUNT|SUM|AVG|MIN|MAX)\s*\(\s*"?([\w*]+)"?\s*\)$', re.IGNORECASE)
+LITERAL = r"(?:'(?:[^']|'')*'|-?\d+(?:\.\d+)?)"
+EQUALITY = re.compile(rf'^"?(\w+)"?\s*=\s*{LITERAL}$')
+RANGE = re.compile(rf'^"?(\w+)"?\s*(?:BETWEEN\s+{LITERAL}\s+AND\s+{LITERAL}|(?:<=|>=|<|>)\s*{LITERAL})$', re.IGNORECASE)
+UNSUPPORTED = re.compile(r'\b(JOIN|UNION|HAVING|OVER|DISTINCT|OR|LIKE|IN)\b|\(\s*SELECT\b', re.IGNORECASE)
+
+
+class ChartViewManager:
+    """Builds chart-shape views and rewrites matching queries to read from them"""
+
+    def __init__(self, conn: sqlite3.Connection, specs: Optional[Dict[str, Dict[str, Any]]] = None,
+                 shapes: Optional[Dict[str, Dict[str, List[str]]]] = None):
+        self.conn = conn
+        self.specs = specs if specs is not None else CHART_VIEW_SPECS
+        self.shapes = shapes if shapes is not None else CHART_SHAPES
+        self.views: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        # Structural match result per literal-free query template, so re-runs skip matching
+        self.template_registry: Dict[str, Optional[Dict[str, Any]]] = {}
+
+    def build(self):
+        """Materialize every view whose base table is loaded"""
+        for table_name in self.specs:
+            self.refresh(table_name)
+
+    def refresh(self, table_name: str):
+        """(Re)build one table's views from its current rows"""
+        base_columns = {c.lower(): c for c in self._table_columns(table_name)}
+        if not base_columns:
+            return
+
+        spec = self.specs[table_name]
+        measures = [m for m in spec.get('measures', []) if m.lower() in base_columns]
+        aggregates = ['COUNT(*) AS "n_rows"'] + [
+            f'{func}("{m}") AS "{func.lower()}_{m}"' for m in measures for func in VIEW_AGGREGATES
+        ]
+
+        self.views[table_name] = {}
+        self.template_registry.clear()
+        for shape_name, shape in self.shapes.items():
+            roles = shape['params'] + shape['outputs']
+            if not all(spec.get(role, '').lower() in base_columns for role in roles):
+                continue
+
+            dims = list(dict.fromkeys(spec[role] for role in roles))
+            view_table = f'{table_name}__view_{shape_name}'
+            dim_sql = ', '.join(f'"{c}"' for c in dims)
+            self.conn.execute(f'DROP TABLE IF EXISTS "{view_table}"')
+            self.conn.execute(
+                f'CREATE TABLE "{view_table}" AS '
+                f'SELECT {dim_sql}, {", ".join(aggregates)} FROM "{table_name}" GROUP BY {dim_sql}'
+            )
+            if shape['params']:
+                param_sql = ', '.join(f'"{spec[role]}"' for role in shape['params'])
+                self.conn.execute(f'CREATE INDEX "idx_{view_table}" ON "{view_table}" ({param_sql})')
+
+            view_rows = self.conn.execute(f'SELECT COUNT(*) FROM "{view_table}"').fetchone()[0]
+            self.views[table_name][shape_name] = {
+                'view_table': view_table,
+                'params': {spec[role].lower() for role in shape['params']},
+                'outputs': {spec[role].lower() for role in shape['outputs']},
+                'measures': {m.lower(): m for m in measures},
+                'view_rows': view_rows,
+            }
+
+        if self.views[table_name]:
+            print(f"    🗂️  Materialized {len(self.views[table_name])} chart views for {table_name}: "
+                  f"{', '.join(self.views[table_name])}")
+
+    def _table_columns(self, table_name: str) -> List[str]:
+        """Column names of a loaded table, empty if it does not exist"""
+        return [row[1] for row in self.conn.execute(f'PRAGMA table_info("{table_name}")').fetchall()]
+
+    def rewrite(self, sql_query: str) -> Optional[Dict[str, str]]:
+        """Return {'sql', 'chart_view', 'shape'} if a materialized view answers the query, else None"""
+        template = query_template(sql_query)
+        if template not in self.template_registry:
+            self.template_registry[template] = self._match(sql_query)
+        plan = self.template_registry[template]
+        if plan is None:
+            return None
+
+        # Literals vary between propositions sharing a template, so clauses come from this query
+        match = QUERY_SHAPE.match(sql_query.strip())
+        rewritten = f'SELECT {", ".join(plan["select"])} FROM "{plan["view_table"]}"'
+        if match.group('where'):
+            rewritten += f" WHERE {match.group('where')}"
+        if match.group('order'):
+            rewritten += f" ORDER BY {match.group('order')}"
+        if match.group('limit'):
+            rewritten += f" LIMIT {match.group('limit')}"
+        return {'sql': rewritten, 'chart_view': plan['view_table'], 'shape': plan['shape']}
+
+    def _match(self, sql_query: str) -> Optional[Dict[str, Any]]:
+        """Find the view whose grain equals the query's, mapping each SELECT item onto view columns"""
+        if UNSUPPORTED.search(re.sub(r"'(?:[^']|'')*'", "''", sql_query)):
+            return None
+        match = QUERY_SHAPE.match(sql_query.strip())
+        if not match or match.group('table') not in self.views or not match.group('group'):
+            return None
+        if match.group('order') and '(' in match.group('order'):
+            return None
+
+        group_by = set()
+        for item in split_top_level(match.group('group')):
+            column = IDENTIFIER.match(item)
+            if not column:
+                return None
+            group_by.add(column.group(1).lower())
+
+        equalities, ranges = set(), set()
+        for conjunct in split_conjuncts(match.group('where') or ''):
+            if not conjunct:
+                continue
+            equality, bounded = EQUALITY.match(conjunct), RANGE.match(conjunct)
+            if equality:
+                equalities.add(equality.group(1).lower())
+            elif bounded:
+                ranges.add(bounded.group(1).lower())
+            else:
+                return None
+
+        for shape_name, view in self.views[match.group('table')].items():
+            # Same grain: no re-aggregation, so every view row is exactly one result row
+            if group_by != view['outputs'] or not view['params'] <= equalities:
+                continue
+            if not (equalities | ranges) <= view['params'] | view['outputs']:
+                continue
+            select = self._map_select(match.group('select'), view)
+            if select is not None:
+                return {'view_table': view['view_table'], 'shape': shape_name, 'select': select}
+        return None
+
+    def _map_select(self, select_clause: str, view: Dict[str, Any]) -> Optional[List[str]]:
+        """SELECT items rewritten onto view columns, preserving output names; None if unmappable"""
+        mapped = []
+        for item in split_top_level(select_clause):
+            as_match = re.match(r'^(.+?)\s+AS\s+"?(\w+)"?$', item, re.IGNORECASE | re.DOTALL)
+            expr, alias = (as_match.group(1).strip(), as_match.group(2)) if as_match else (item, item)
+
+            column = IDENTIFIER.match(expr)
+            aggregate = AGGREGATE_ITEM.match(expr)
+            if column and column.group(1).lower() in view['outputs'] | view['params']:
+                mapped.append(f'"{column.group(1)}" AS "{alias if as_match else column.group(1)}"')
+            elif aggregate:
+                func, arg = aggregate.group(1).upper(), aggregate.group(2).lower()
+                if func == 'COUNT' and arg in ('*', '1'):
+                    source = 'n_rows'
+                elif func in VIEW_AGGREGATES and arg in view['measures']:
+                    source = f'{func.lower()}_{view["measures"][arg]}'
+                else:
+                    return None
+                mapped.append(f'"{source}" AS "{alias}"')
+            else:
+                return None
+        return mapped
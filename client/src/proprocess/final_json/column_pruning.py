@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+"""
+Column Pruning
+Loads only the columns the proposition SQL references (plus the key columns geographic
+dimensions, rollups, chart views and samples are built on), so ingest time and memory follow
+what is queried rather than how wide the source files are. Columns left out are appended to the
+table from its CSV the first time a query needs them.
+"""
+
+import re
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import List, Dict, Any, Optional, Callable, Iterable
+
+import pandas as pd
+
+from approximate_query import DEFAULT_STRATA
+from chart_views import CHART_VIEW_SPECS
+from dataset_version import file_sha256
+from dictionary_encoding import create_decoding_views
+from geo_dimensions import GEO_IDENTIFIERS
+from rollup_tables import ROLLUP_SPECS
+
+STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+TABLE_REFERENCE = re.compile(r'\b(?:FROM|JOIN)\s+"?(\w+)"?', re.IGNORECASE)
+# Quoted identifiers ("1999_00", "Unnamed:_0") and bare words
+IDENTIFIER_TOKEN = re.compile(r'"([^"]+)"|`([^`]+)`|\[([^\]]+)\]|([A-Za-z_][\w:]*)')
+SELECT_STAR = re.compile(r'(?:\bSELECT\s+(?:DISTINCT\s+)?|,\s*|\.)\*', re.IGNORECASE)
+
+
+def key_columns(table_name: str) -> List[str]:
+    """Columns the load-time structures of a table are built on, kept whatever the queries use"""
+    keys = []
+    for code_col, name_col in GEO_IDENTIFIERS.get(table_name, {}).values():
+        keys += [c for c in (code_col, name_col) if c]
+    spec = ROLLUP_SPECS.get(table_name, {})
+    keys += spec.get('grain', []) + spec.get('dependent', [])
+    spec = CHART_VIEW_SPECS.get(table_name, {})
+    keys += [v for role, v in spec.items() if role != 'measures'] + spec.get('measures', [])
+    keys += DEFAULT_STRATA.get(table_name, [])
+    return list(dict.fromkeys(keys))
+
+
+class ColumnPruner:
+    """Decides which CSV columns to load per table and appends the rest on demand"""
+
+    def __init__(self, dataset_paths: Dict[str, str], clean_columns: Callable[[Iterable[str]], List[str]],
+                 sql_queries: List[str], fingerprints: Optional[Dict[str, Dict[str, Any]]] = None):
+        self.dataset_paths = dataset_paths
+        self.clean_columns = clean_columns
+        # Table -> fingerprint pinned at load time; restores read only a source that still matches it
+        self.fingerprints = fingerprints if fingerprints is not None else {}
+        # Table -> lower-cased identifiers appearing in queries that read it (None: SELECT *)
+        self.referenced: Dict[str, Optional[set]] = {}
+        for sql_query in sql_queries:
+            for table_name, identifiers in self._query_identifiers(sql_query).items():
+                if table_name in self.referenced and self.referenced[table_name] is None:
+                    continue
+                if identifiers is None:
+                    self.referenced[table_name] = None
+                else:
+                    self.referenced.setdefault(table_name, set()).update(identifiers)
+        self.headers: Dict[str, List[str]] = {}
+        self.stats: Dict[str, Dict[str, Any]] = {}
+        self._frames: Dict[str, pd.DataFrame] = {}
+        self._lock = threading.Lock()
+
+    def _query_identifiers(self, sql_query: str) -> Dict[str, Optional[set]]:
+        """Per table named in the query, the identifiers it may read from it (None if it selects *)"""
+        code = STRING_LITERAL.sub("''", sql_query or '')
+        tables = [t for t in TABLE_REFERENCE.findall(code) if t in self.dataset_paths]
+        if not tables:
+            return {}
+        star = bool(SELECT_STAR.search(code))
+        identifiers = {''.join(g for g in m.groups() if g).lower() for m in IDENTIFIER_TOKEN.finditer(code)}
+        return {table_name: None if star else identifiers for table_name in tables}
+
+    def header(self, table_name: str) -> List[str]:
+        """Cleaned column names of a table's CSV, in file order"""
+        if table_name not in self.headers:
+            raw = pd.read_csv(self.dataset_paths[table_name], nrows=0).columns
+            self.headers[table_name] = self.clean_columns(raw)
+        return self.headers[table_name]
+
+    def load_positions(self, table_name: str) -> Optional[List[int]]:
+        """CSV column positions to load for a table, None to load all of them"""
+        header = self.header(table_name)
+        referenced = self.referenced.get(table_name, set())
+        if referenced is None:
+            keep = list(range(len(header)))
+        else:
+            wanted = referenced | {c.lower() for c in key_columns(table_name)}
+            keep = [i for i, column in enumerate(header) if column.lower() in wanted]
+        self.stats[table_name] = {
+            'columns_loaded': len(keep),
+            'columns_total': len(header),
+            'lazy_loaded': [],
+        }
+        return None if len(keep) == len(header) else keep
+
+    def restore(self, conn: sqlite3.Connection, sql_queries: Iterable[str]) -> List[str]:
+        """Append every pruned column these queries reference to the connection's tables; returns them
+
+        Raises RuntimeError if a table's columns cannot be restored from the data it was loaded from.
+        """
+        missing: Dict[str, List[str]] = {}
+        for sql_query in sql_queries:
+            for table_name, identifiers in self._query_identifiers(sql_query).items():
+                if table_name not in self.stats:
+                    continue
+                loaded = {row[1].lower() for row in conn.execute(f'PRAGMA table_info("{table_name}")').fetchall()}
+                for column in self.header(table_name):
+                    if column.lower() not in loaded and (identifiers is None or column.lower() in identifiers):
+                        if column not in missing.setdefault(table_name, []):
+                            missing[table_name].append(column)
+
+        restored = []
+        for table_name, columns in missing.items():
+            if columns:
+                self._append_columns(conn, table_name, columns)
+                restored += [f'{table_name}.{column}' for column in columns]
+        return restored
+
+    def _append_columns(self, conn: sqlite3.Connection, table_name: str, columns: List[str]):
+        """Add columns from the CSV to the table's storage, aligned on rowid (rows are stored in file order)"""
+        encoded = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (f'{table_name}__encoded',)
+        ).fetchone()
+        storage = f'{table_name}__encoded' if encoded else table_name
+        frame = self._source_columns(table_name, columns)
+
+        count, first, last = conn.execute(f'SELECT COUNT(*), MIN(rowid), MAX(rowid) FROM "{storage}"').fetchone()
+        if (count, first or 1, last or 0) != (len(frame), 1, len(frame)):
+            raise RuntimeError(f"Cannot restore pruned columns of {table_name}: stored rows no longer follow the CSV")
+
+        staging = f'{table_name}__restore'
+        with _writable(conn):
+            frame.to_sql(staging, conn, if_exists='replace', index=False)
+            types = {row[1]: row[2] for row in conn.execute(f'PRAGMA table_info("{staging}")').fetchall()}
+            for column in columns:
+                conn.execute(f'ALTER TABLE "{storage}" ADD COLUMN "{column}" {types[column]}')
+            quoted = ', '.join(f'"{column}"' for column in columns)
+            conn.execute(
+                f'UPDATE "{storage}" SET ({quoted}) = '
+                f'(SELECT {quoted} FROM "{staging}" s WHERE s.rowid = "{storage}".rowid)'
+            )
+            conn.execute(f'DROP TABLE "{staging}"')
+            if encoded:
+                create_decoding_views(conn, table_name)
+            conn.commit()
+
+        with self._lock:
+            lazy_loaded = self.stats[table_name]['lazy_loaded']
+            lazy_loaded += [column for column in columns if column not in lazy_loaded]
+        print(f"    📥 Loaded pruned columns of {table_name}: {', '.join(columns)}")
+
+    def _source_columns(self, table_name: str, columns: List[str]) -> pd.DataFrame:
+        """The given columns read from the table's CSV (cached, so each worker does not re-read the file)"""
+        with self._lock:
+            cached = self._frames.get(table_name)
+            needed = [c for c in columns if cached is None or c not in cached.columns]
+            if needed:
+                self._check_source(table_name)
+                header = self.header(table_name)
+                positions = [header.index(c) for c in needed]
+                frame = pd.read_csv(self.dataset_paths[table_name], usecols=positions)
+                frame.columns = [header[i] for i in sorted(positions)]
+                cached = frame if cached is None else pd.concat([cached, frame], axis=1)
+                self._frames[table_name] = cached
+            return cached[columns]
+
+
+    def _check_source(self, table_name: str):
+        """Raise unless the table's CSV still has the content its pinned fingerprint describes"""
+        pinned = self.fingerprints.get(table_name)
+        if pinned is None:
+            return
+        if file_sha256(self.dataset_paths[table_name]) != pinned['source_sha256']:
+            raise RuntimeError(f"Cannot restore pruned columns of {table_name}: "
+                               f"{self.dataset_paths[table_name]} changed since it was loaded")
+
+
+@contextmanager
+def _writable(conn: sqlite3.Connection):
+    """Lift write_guard's protection for a schema extension
+
+    The only write made while a run is guarded: it adds columns read from a source file that
+    still matches its pinned fingerprint, and leaves the existing values unchanged.
+    """
+    query_only = conn.execute('PRAGMA query_only').fetchone()[0]
+    if query_only:
+        conn.execute('PRAGMA query_only = OFF')
+    try:
+        yield conn
+    finally:
+        if query_only:
+            conn.execute('PRAGMA query_only = ON')
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Query Cost Model
+Predicts each proposition's runtime from its SQL shape (tables scanned, joins, GROUP BY
+cardinality from table statistics), refined by timings recorded on earlier runs, and orders
+work longest-first so parallel runs are not dominated by a few slow stragglers.
+Recorded seconds are thread CPU time: I/O and lock waits are excluded, so the schedule does not
+account for them.
+"""
+
+import heapq
+import json
+import os
+import re
+import sqlite3
+import statistics
+from typing import List, Dict, Any, Optional, Tuple
+
+from sql_parsing import QUERY_SHAPE, split_top_level, query_template
+
+# Shape-model constants, rescaled by the median measured/estimated ratio once timings exist
+ROW_SECONDS = 2e-7
+GROUP_SECONDS = 2e-6
+JOIN_FACTOR = 3.0
+BASE_SECONDS = 0.002
+# Weight of the newest timing in the per-proposition / per-template moving averages
+HISTORY_WEIGHT = 0.5
+
+TABLE_REFERENCE = re.compile(r'\b(?:FROM|JOIN)\s+"?(\w+)"?', re.IGNORECASE)
+IDENTIFIER = re.compile(r'^"?([A-Za-z_]\w*)"?$')
+
+
+class QueryCostModel:
+    """Runtime estimates per proposition, backed by a JSON history of measured timings"""
+
+    def __init__(self, conn: sqlite3.Connection, history_path: Optional[str] = None):
+        self.conn = conn
+        self.history_path = history_path
+        self.history: Dict[str, Any] = {'propositions': {}, 'templates': {}}
+        if history_path and os.path.exists(history_path):
+            try:
+                with open(history_path, 'r') as f:
+                    self.history = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"    ⚠️  Ignoring unreadable timing history {history_path}: {e}")
+        self._row_counts: Dict[str, int] = {}
+        self._distinct: Dict[Tuple[str, str], int] = {}
+        self.scale = self._calibrate()
+
+    def _calibrate(self) -> float:
+        """How far the shape model is off on this machine, from earlier runs"""
+        ratios = [entry['seconds'] / entry['shape_seconds']
+                  for entry in self.history['propositions'].values() if entry.get('shape_seconds')]
+        return statistics.median(ratios) if ratios else 1.0
+
+    def table_rows(self, table_name: str) -> Optional[int]:
+        """Row count of a loaded table or view, None if it does not exist"""
+        if table_name not in self._row_counts:
+            try:
+                self._row_counts[table_name] = self.conn.execute(f'SELECT COUNT(*) FROM "{table_name}"').fetchone()[0]
+            except sqlite3.Error:
+                self._row_counts[table_name] = None
+        return self._row_counts[table_name]
+
+    def distinct_values(self, table_name: str, column: str) -> Optional[int]:
+        """Distinct values of a column, None if the column does not exist"""
+        key = (table_name, column.lower())
+        if key not in self._distinct:
+            try:
+                self._distinct[key] = self.conn.execute(
+                    f'SELECT COUNT(DISTINCT "{column}") FROM "{table_name}"'
+                ).fetchone()[0]
+            except sqlite3.Error:
+                self._distinct[key] = None
+        return self._distinct[key]
+
+    def shape_seconds(self, sql_query: Optional[str]) -> float:
+        """Runtime predicted from the query alone; queries that fail or are answered from cache cost the base"""
+        if not sql_query:
+            return BASE_SECONDS
+        tables = [t for t in TABLE_REFERENCE.findall(sql_query) if self.table_rows(t) is not None]
+        if not tables:
+            return BASE_SECONDS
+
+        rows = sum(self.table_rows(t) for t in tables)
+        joins = len(re.findall(r'\bJOIN\b', sql_query, re.IGNORECASE))
+        seconds = rows * ROW_SECONDS * JOIN_FACTOR ** joins
+
+        match = QUERY_SHAPE.match(sql_query.strip())
+        if match and match.group('group'):
+            groups = 1
+            for item in split_top_level(match.group('group')):
+                column = IDENTIFIER.match(item)
+                distinct = self.distinct_values(tables[0], column.group(1)) if column else None
+                groups *= distinct or 1
+            seconds += min(groups, rows) * GROUP_SECONDS
+        return BASE_SECONDS + seconds
+
+    def estimate(self, proposition_id: str, sql_query: Optional[str]) -> float:
+        """Predicted seconds: this proposition's last timings, else its template's, else the scaled shape model"""
+        if proposition_id in self.history['propositions']:
+            return self.history['propositions'][proposition_id]['seconds']
+        template = query_template(sql_query) if sql_query else ''
+        if template in self.history['templates']:
+            return self.history['templates'][template]['seconds']
+        return self.shape_seconds(sql_query) * self.scale
+
+    def record(self, proposition_id: str, sql_query: Optional[str], seconds: float):
+        """Fold a measured runtime into the history"""
+        def blend(entries: Dict[str, Any], key: str, **extra):
+            previous = entries.get(key)
+            runs = previous['runs'] + 1 if previous else 1
+            value = seconds if not previous else \
+                HISTORY_WEIGHT * seconds + (1 - HISTORY_WEIGHT) * previous['seconds']
+            entries[key] = {'seconds': value, 'runs': runs, **extra}
+
+        blend(self.history['propositions'], proposition_id, shape_seconds=self.shape_seconds(sql_query))
+        blend(self.history['templates'], query_template(sql_query) if sql_query else '')
+
+    def save(self):
+        """Write the timing history for the next run"""
+        if not self.history_path:
+            return
+        with open(self.history_path, 'w') as f:
+            json.dump(self.history, f, indent=2)
+
+
+def schedule_longest_first(costs: List[float], workers: int) -> Dict[str, Any]:
+    """Longest-processing-time-first order and the makespan it predicts on `workers` workers
+
+    Submitting in this order to a pool whose idle workers take the next item gives the same
+    assignment as greedily placing each job on the least-loaded worker.
+    """
+    order = sorted(range(len(costs)), key=lambda i: costs[i], reverse=True)
+    loads = [(0.0, worker) for worker in range(max(1, workers))]
+    for i in order:
+        load, worker = heapq.heappop(loads)
+        heapq.heappush(loads, (load + costs[i], worker))
+    total = sum(costs)
+    return {
+        'order': order,
+        'predicted_total_seconds': total,
+        'predicted_makespan_seconds': max(load for load, _ in loads),
+        'ideal_makespan_seconds': total / max(1, workers),
+    }
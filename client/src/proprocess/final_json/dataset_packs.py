@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Dataset Packs
+Datasets beyond the built-in London tables, described by a JSON manifest. Each pack is built
+once into its own SQLite file and ATTACHed under its name only when a query references one of
+its schema-qualified tables (e.g. `hr.employee_attrition`), so startup cost and memory follow
+the packs a run actually uses.
+"""
+
+import json
+import os
+import re
+import sqlite3
+import threading
+from typing import List, Dict, Any, Optional, Callable
+
+import pandas as pd
+
+from dataset_version import file_sha256, table_fingerprint
+
+STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+QUALIFIED_TABLE = re.compile(r'\b(?:FROM|JOIN)\s+"?(\w+)"?\s*\.\s*"?(\w+)"?', re.IGNORECASE)
+PACK_META_TABLE = '_pack_meta'
+
+
+class DatasetPackManager:
+    """Builds pack databases from a manifest and attaches them to connections on first use"""
+
+    def __init__(self, manifest_path: str, cache_dir: Optional[str] = None,
+                 clean_columns: Optional[Callable[[List[str]], List[str]]] = None):
+        self.manifest_path = manifest_path
+        base_dir = os.path.dirname(os.path.abspath(manifest_path))
+        self.cache_dir = cache_dir or os.path.join(base_dir, 'dataset_packs')
+        self.clean_columns = clean_columns or (lambda columns: list(columns))
+        self.packs: Dict[str, Dict[str, Any]] = {}
+        # Fingerprints of every pack attached during this process, for run metadata
+        self.attached: Dict[str, Dict[str, Any]] = {}
+        self._build_lock = threading.Lock()
+
+        if os.path.exists(manifest_path):
+            with open(manifest_path, 'r') as f:
+                manifest = json.load(f)
+            for name, pack in manifest.get('packs', {}).items():
+                tables = {
+                    table_name: os.path.join(base_dir, table['path'])
+                    for table_name, table in pack.get('tables', {}).items()
+                }
+                self.packs[name] = {'description': pack.get('description', ''), 'tables': tables}
+
+    def referenced_packs(self, sql_query: str) -> List[str]:
+        """Packs whose tables the query names as <pack>.<table>"""
+        code = STRING_LITERAL.sub("''", sql_query)
+        return list(dict.fromkeys(
+            schema for schema, table in QUALIFIED_TABLE.findall(code)
+            if schema in self.packs and table in self.packs[schema]['tables']
+        ))
+
+    def attach_referenced(self, conn: sqlite3.Connection, sql_query: str) -> List[str]:
+        """Attach every pack the query references that this connection does not have yet"""
+        names = self.referenced_packs(sql_query)
+        if names:
+            attached = {row[1] for row in conn.execute('PRAGMA database_list').fetchall()}
+            for name in names:
+                if name not in attached:
+                    self.attach(conn, name)
+        return names
+
+    def attach(self, conn: sqlite3.Connection, name: str):
+        """ATTACH a pack's database (building it first if needed) under the pack name"""
+        db_path = self.build(name)
+        # ATTACH is not allowed inside an open transaction
+        if conn.in_transaction:
+            conn.commit()
+        conn.execute('ATTACH DATABASE ? AS ?', (db_path, name))
+        print(f"    🧩 Attached dataset pack '{name}' ({', '.join(self.packs[name]['tables'])})")
+
+    def attach_all_known(self, conn: sqlite3.Connection):
+        """Attach the packs already in use elsewhere (e.g. to a fresh worker connection)"""
+        for name in self.attached:
+            self.attach(conn, name)
+
+    def build(self, name: str) -> str:
+        """Path of the pack's database, (re)built from its CSVs when missing or out of date"""
+        with self._build_lock:
+            pack = self.packs[name]
+            db_path = os.path.join(self.cache_dir, f'{name}.sqlite')
+            sources = {table_name: file_sha256(path) for table_name, path in pack['tables'].items()}
+
+            if self._stored_sources(db_path) != sources:
+                self._build_database(name, db_path)
+            self.attached[name] = {
+                'db_path': db_path,
+                'tables': self._stored_fingerprints(db_path),
+            }
+            return db_path
+
+    def _stored_sources(self, db_path: str) -> Optional[Dict[str, str]]:
+        """Source hashes a built pack database was made from, None if absent or unreadable"""
+        fingerprints = self._stored_fingerprints(db_path)
+        if fingerprints is None:
+            return None
+        return {table_name: fingerprint['source_sha256'] for table_name, fingerprint in fingerprints.items()}
+
+    @staticmethod
+    def _stored_fingerprints(db_path: str) -> Optional[Dict[str, Dict[str, Any]]]:
+        """Per-table fingerprints recorded in a pack database"""
+        if not os.path.exists(db_path):
+            return None
+        try:
+            with sqlite3.connect(db_path) as conn:
+                rows = conn.execute(f'SELECT table_name, fingerprint FROM {PACK_META_TABLE}').fetchall()
+        except sqlite3.Error:
+            return None
+        return {table_name: json.loads(fingerprint) for table_name, fingerprint in rows}
+
+    def _build_database(self, name: str, db_path: str):
+        """Load the pack's CSVs into a fresh database file, swapped in only once complete"""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        building_path = f'{db_path}.building'
+        if os.path.exists(building_path):
+            os.remove(building_path)
+
+        print(f"  🧩 Building dataset pack '{name}' -> {db_path}")
+        conn = sqlite3.connect(building_path)
+        try:
+            conn.execute(f'CREATE TABLE {PACK_META_TABLE} (table_name TEXT PRIMARY KEY, fingerprint TEXT)')
+            for table_name, csv_path in self.packs[name]['tables'].items():
+                # Excel exports such as HR-Employee-Attrition.csv start with a byte-order mark
+                df = pd.read_csv(csv_path, encoding='utf-8-sig')
+                df.columns = self.clean_columns(df.columns)
+                df.to_sql(table_name, conn, if_exists='replace', index=False)
+                fingerprint = table_fingerprint(csv_path, list(df.columns), len(df))
+                conn.execute(f'INSERT INTO {PACK_META_TABLE} VALUES (?, ?)', (table_name, json.dumps(fingerprint)))
+                print(f"    ✅ {name}.{table_name}: {len(df)} rows, {len(df.columns)} columns")
+            conn.commit()
+        finally:
+            conn.close()
+        os.replace(building_path, db_path)
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Dataset Versioning
+Content-addressed fingerprints for the loaded tables and a guard against accidental writes during
+executor runs, so every result can be tied to the exact data it was computed from.
+"""
+
+import hashlib
+import os
+import sqlite3
+from contextlib import contextmanager
+from typing import List, Dict, Any, Tuple
+
+_CHUNK_SIZE = 1 << 20
+_file_digests: Dict[str, Tuple[Tuple[int, int], str]] = {}
+
+
+def file_sha256(path: str) -> str:
+    """SHA-256 of a source file's bytes, rehashed only when its size or modification time changes
+
+    Tables loaded from the same file share one digest.
+    """
+    real_path = os.path.realpath(path)
+    stat = os.stat(real_path)
+    stat_key = (stat.st_size, stat.st_mtime_ns)
+    cached = _file_digests.get(real_path)
+    if cached is None or cached[0] != stat_key:
+        digest = hashlib.sha256()
+        with open(real_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(_CHUNK_SIZE), b''):
+                digest.update(chunk)
+        _file_digests[real_path] = (stat_key, digest.hexdigest())
+    return _file_digests[real_path][1]
+
+
+def table_fingerprint(csv_path: str, columns: List[str], row_count: int) -> Dict[str, Any]:
+    """Fingerprint of one loaded table: source content plus the schema the loader produced"""
+    return {
+        'source_sha256': file_sha256(csv_path),
+        'columns': list(columns),
+        'rows': int(row_count),
+    }
+
+
+def combine_fingerprints(fingerprints: Dict[str, Dict[str, Any]]) -> str:
+    """Dataset version id over all loaded tables, independent of load order"""
+    digest = hashlib.sha256()
+    for table_name in sorted(fingerprints):
+        fingerprint = fingerprints[table_name]
+        digest.update(f"{table_name}\0{fingerprint['source_sha256']}\0"
+                      f"{','.join(fingerprint['columns'])}\0{fingerprint['rows']}\n".encode())
+    return f"ds-{digest.hexdigest()[:16]}"
+
+
+@contextmanager
+def write_guard(conn: sqlite3.Connection):
+    """Guard a run against accidental writes: inside the block, writes on conn raise
+
+    This is not an isolated snapshot. PRAGMA query_only is a per-connection flag that code
+    holding the connection can turn off; ColumnPruner does so to append pruned columns mid-run.
+    What keeps results tied to the version id is that the tables live in an in-memory database
+    loaded once from the CSVs, and that ColumnPruner restores a column only from a source file
+    whose SHA-256 still matches the pinned fingerprint.
+    """
+    conn.commit()
+    conn.execute('PRAGMA query_only = ON')
+    try:
+        yield conn
+    finally:
+        conn.execute('PRAGMA query_only = OFF')
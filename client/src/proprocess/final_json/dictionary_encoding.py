@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+"""
+Dictionary Encoding
+Stores low-cardinality text columns of the loaded tables as integer codes plus per-column lookup
+tables. A view under the original table name decodes them, so any proposition SQL keeps working;
+rewrite() moves simple single-table queries onto the coded storage so SQLite filters, groups and
+sorts on indexed integers.
+"""
+
+import re
+import sqlite3
+from typing import List, Dict, Any, Optional
+
+from sql_parsing import QUERY_SHAPE, split_top_level
+
+STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+LITERAL = r"(?:'(?:[^']|'')*'|-?\d+(?:\.\d+)?)"
+UNSUPPORTED = re.compile(r'\b(JOIN|UNION|INTERSECT|EXCEPT|OVER|HAVING)\b|\(\s*SELECT\b|(?:^|[\s,.])\*(?!\s*\))',
+                         re.IGNORECASE)
+
+
+def row_source(conn: sqlite3.Connection, table_name: str) -> str:
+    """FROM-clause relation over table_name exposing the storage rowid as _rowid
+
+    Views have no rowid, so row-addressed reads (stride samples, sample joins) on an encoded
+    table go through its {table}__rows view instead.
+    """
+    rows_view = f'{table_name}__rows'
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'view' AND name = ?", (rows_view,)
+    ).fetchone()
+    if exists:
+        return f'"{rows_view}"'
+    return f'(SELECT rowid AS _rowid, * FROM "{table_name}")'
+
+
+def create_decoding_views(conn: sqlite3.Connection, table_name: str):
+    """(Re)create the {table} and {table}__rows views over {table}__encoded from its current schema
+
+    Every "<column>__code" storage column with a {table}__dict_<column> lookup is decoded; other
+    storage columns (including ones added after encoding) pass through.
+    """
+    storage = f'{table_name}__encoded'
+    tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'").fetchall()}
+    view_items = []
+    for row in conn.execute(f'PRAGMA table_info("{storage}")').fetchall():
+        column = row[1]
+        source = column[:-len('__code')]
+        lookup = f'{table_name}__dict_{source}'
+        if column.endswith('__code') and lookup in tables:
+            view_items.append(f'(SELECT value FROM "{lookup}" WHERE code = e."{column}") AS "{source}"')
+        else:
+            view_items.append(f'e."{column}"')
+
+    # Scalar lookups are only evaluated for the columns a query actually reads
+    conn.execute(f'DROP VIEW IF EXISTS "{table_name}"')
+    conn.execute(f'CREATE VIEW "{table_name}" AS SELECT {", ".join(view_items)} FROM "{storage}" e')
+    conn.execute(f'DROP VIEW IF EXISTS "{table_name}__rows"')
+    conn.execute(
+        f'CREATE VIEW "{table_name}__rows" AS SELECT e.rowid AS _rowid, {", ".join(view_items)} FROM "{storage}" e'
+    )
+
+
+class DictionaryEncoder:
+    """Replaces eligible tables with {table}__encoded storage, {table}__dict_<column> lookups and a decoding view"""
+
+    def __init__(self, conn: sqlite3.Connection, tables: Optional[List[str]] = None, min_rows: int = 1000,
+                 max_cardinality: int = 1000, max_distinct_ratio: float = 0.05):
+        self.conn = conn
+        self.tables = tables
+        self.min_rows = min_rows
+        self.max_cardinality = max_cardinality
+        self.max_distinct_ratio = max_distinct_ratio
+        self.encoded: Dict[str, Dict[str, Any]] = {}
+
+    def encode_all(self):
+        """Encode every eligible base table and report the size change"""
+        size_before = self._database_bytes()
+        tables = self.tables if self.tables is not None else [
+            row[0] for row in self.conn.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE '%\\_\\_%' ESCAPE '\\' "
+                "AND name NOT LIKE 'dim\\_%' ESCAPE '\\' AND name NOT LIKE 'sqlite\\_%' ESCAPE '\\'"
+            ).fetchall()
+        ]
+        for table_name in tables:
+            columns = self.candidate_columns(table_name)
+            if columns:
+                self.encode_table(table_name, columns)
+        self.conn.commit()
+
+        if self.encoded:
+            # Dropped tables leave free pages behind until the database is vacuumed
+            self.conn.execute('VACUUM')
+            size_after = self._database_bytes()
+            summary = ', '.join(f"{t} ({', '.join(info['columns'])})" for t, info in self.encoded.items())
+            print(f"    🔤 Dictionary-encoded {summary}")
+            print(f"    🔤 Database size {size_before / 1e6:.1f} MB -> {size_after / 1e6:.1f} MB")
+
+    def _database_bytes(self) -> int:
+        """Current database size in bytes"""
+        page_count = self.conn.execute('PRAGMA page_count').fetchone()[0]
+        page_size = self.conn.execute('PRAGMA page_size').fetchone()[0]
+        return page_count * page_size
+
+    def candidate_columns(self, table_name: str) -> List[str]:
+        """TEXT columns whose distinct values are few relative to the table"""
+        table_info = self.conn.execute(f'PRAGMA table_info("{table_name}")').fetchall()
+        row_count = self.conn.execute(f'SELECT COUNT(*) FROM "{table_name}"').fetchone()[0]
+        if row_count < self.min_rows:
+            return []
+
+        limit = min(self.max_cardinality, int(row_count * self.max_distinct_ratio))
+        candidates = []
+        for _, name, declared_type, *_ in table_info:
+            if (declared_type or '').upper() != 'TEXT':
+                continue
+            # Stop counting as soon as the column proves too diverse
+            distinct = self.conn.execute(
+                f'SELECT COUNT(*) FROM (SELECT DISTINCT "{name}" FROM "{table_name}" LIMIT {limit + 1})'
+            ).fetchone()[0]
+            if distinct <= limit:
+                candidates.append(name)
+        return candidates
+
+    def encode_table(self, table_name: str, columns: List[str]):
+        """Move a table to coded storage and put a decoding view in its place"""
+        table_info = self.conn.execute(f'PRAGMA table_info("{table_name}")').fetchall()
+        all_columns = [row[1] for row in table_info]
+        indexes = self._index_columns(table_name)
+        storage = f'{table_name}__encoded'
+
+        storage_items, lookups = [], []
+        for i, column in enumerate(all_columns):
+            if column not in columns:
+                storage_items.append(f't."{column}"')
+                continue
+            # Codes follow value order, so ranges and ORDER BY on codes match the text semantics
+            lookup = f'{table_name}__dict_{column}'
+            self.conn.execute(f'DROP TABLE IF EXISTS "{lookup}"')
+            self.conn.execute(f'CREATE TABLE "{lookup}" (code INTEGER PRIMARY KEY, value TEXT UNIQUE)')
+            self.conn.execute(
+                f'INSERT INTO "{lookup}" (value) SELECT DISTINCT "{column}" FROM "{table_name}" ORDER BY "{column}"'
+            )
+            null_code = self.conn.execute(f'SELECT code FROM "{lookup}" WHERE value IS NULL').fetchone()
+            storage_items.append(f'COALESCE(l{i}.code, {null_code[0] if null_code else "NULL"}) AS "{column}__code"')
+            lookups.append(f'LEFT JOIN "{lookup}" l{i} ON l{i}.value = t."{column}"')
+
+        self.conn.execute(f'DROP TABLE IF EXISTS "{storage}"')
+        self.conn.execute(
+            f'CREATE TABLE "{storage}" AS SELECT {", ".join(storage_items)} FROM "{table_name}" t {" ".join(lookups)} '
+            f'ORDER BY t.rowid'
+        )
+        self.conn.execute(f'DROP TABLE "{table_name}"')
+        create_decoding_views(self.conn, table_name)
+
+        for column in columns:
+            self.conn.execute(f'CREATE INDEX "idx_{storage}_{column}" ON "{storage}" ("{column}__code")')
+        # Indexes that lived on the original table move to the storage table
+        for index_name, index_columns in indexes.items():
+            storage_columns = ', '.join(f'"{c}__code"' if c in columns else f'"{c}"' for c in index_columns)
+            self.conn.execute(f'CREATE INDEX IF NOT EXISTS "{index_name}" ON "{storage}" ({storage_columns})')
+
+        self.encoded[table_name] = {
+            'storage_table': storage,
+            'columns': columns,
+            'lookups': {column.lower(): (column, f'{table_name}__dict_{column}') for column in columns},
+        }
+
+    def _index_columns(self, table_name: str) -> Dict[str, List[str]]:
+        """Explicitly created indexes on a table and their columns"""
+        indexes = {}
+        for _, index_name, _, origin, *_ in self.conn.execute(f'PRAGMA index_list("{table_name}")').fetchall():
+            if origin == 'c':
+                indexes[index_name] = [row[2] for row in self.conn.execute(f'PRAGMA index_info("{index_name}")')]
+        return indexes
+
+    def rewrite(self, sql_query: str) -> str:
+        """Run a single-table query on an encoded table against its coded storage
+
+        Filters on encoded columns become code-set lookups, GROUP BY / ORDER BY items that are bare
+        encoded columns use the codes and selected columns are decoded through their lookup. Queries outside that shape (or touching
+        an encoded column in any other way) are returned unchanged and go through the view.
+        """
+        match = QUERY_SHAPE.match(sql_query.strip())
+        if not match or match.group('table') not in self.encoded:
+            return sql_query
+        if UNSUPPORTED.search(STRING_LITERAL.sub("''", sql_query)):
+            return sql_query
+
+        info = self.encoded[match.group('table')]
+        lookups = info['lookups']
+        names = '|'.join(re.escape(column) for column in lookups)
+        token = re.compile(rf'(?<![\w."])"?({names})"?(?![\w"])', re.IGNORECASE)
+        predicate = re.compile(
+            rf'(?<![\w."])"?({names})"?\s*'
+            rf'((?:==|=|!=|<>|<=|>=|<|>)\s*{LITERAL}'
+            rf'|(?:NOT\s+)?IN\s*\(\s*{LITERAL}(?:\s*,\s*{LITERAL})*\s*\)'
+            rf'|(?:NOT\s+)?BETWEEN\s+{LITERAL}\s+AND\s+{LITERAL}'
+            rf'|(?:NOT\s+)?LIKE\s+{LITERAL}'
+            rf'|IS\s+(?:NOT\s+)?NULL)',
+            re.IGNORECASE
+        )
+
+        def code_column(name: str) -> str:
+            return f'"{lookups[name.lower()][0]}__code"'
+
+        def decoded(name: str) -> str:
+            column, lookup = lookups[name.lower()]
+            return f'(SELECT value FROM "{lookup}" WHERE code = "{column}__code")'
+
+        def references_encoded(clause: str) -> bool:
+            return bool(token.search(STRING_LITERAL.sub("''", clause)))
+
+        select_items = []
+        for item in split_top_level(match.group('select')):
+            as_match = re.match(r'^(.+?)\s+AS\s+("?\w+"?)$', item, re.IGNORECASE | re.DOTALL)
+            expr, alias = (as_match.group(1).strip(), as_match.group(2)) if as_match else (item, None)
+            bare = token.fullmatch(expr)
+            # ORDER BY / GROUP BY names resolve to output aliases, so an alias may not shadow another encoded column
+            if alias and alias.strip('"').lower() in lookups and not (bare and bare.group(1).lower() == alias.strip('"').lower()):
+                return sql_query
+            if not references_encoded(expr):
+                select_items.append(item)
+            elif bare:
+                output_name = alias or f'"{lookups[bare.group(1).lower()][0]}"'
+                select_items.append(f'{decoded(bare.group(1))} AS {output_name}')
+            elif alias:
+                select_items.append(f'{token.sub(lambda m: decoded(m.group(1)), expr)} AS {alias}')
+            else:
+                return sql_query  # the expression text is the output column name
+
+        where = match.group('where')
+        if where:
+            subqueries = []
+
+            def code_filter(m: re.Match) -> str:
+                subqueries.append(f'{code_column(m.group(1))} IN (SELECT code FROM "{lookups[m.group(1).lower()][1]}" '
+                                  f'WHERE value {m.group(2)})')
+                return f'\0{len(subqueries) - 1}\0'
+
+            where = predicate.sub(code_filter, where)
+            if references_encoded(where):
+                return sql_query
+            where = re.sub(r'\0(\d+)\0', lambda m: subqueries[int(m.group(1))], where)
+
+        def code_items(clause: str) -> Optional[str]:
+            """Bare encoded columns of a GROUP BY / ORDER BY list as codes; None if one is used otherwise"""
+            items = []
+            for item in split_top_level(clause):
+                term = re.match(r'^(.+?)(\s+(?:ASC|DESC))?$', item, re.IGNORECASE | re.DOTALL)
+                bare = token.fullmatch(term.group(1).strip())
+                if bare:
+                    items.append(code_column(bare.group(1)) + (term.group(2) or ''))
+                elif references_encoded(item):
+                    return None  # e.g. substr(date, 1, 4): codes do not carry the text
+                else:
+                    items.append(item)
+            return ', '.join(items)
+
+        group = code_items(match.group('group')) if match.group('group') else None
+        order = code_items(match.group('order')) if match.group('order') else None
+        if (match.group('group') and group is None) or (match.group('order') and order is None):
+            return sql_query
+
+        rewritten = f'SELECT {", ".join(select_items)} FROM "{info["storage_table"]}"'
+        if where:
+            rewritten += f' WHERE {where}'
+        if group:
+            rewritten += f' GROUP BY {group}'
+        if order:
+            rewritten += f' ORDER BY {order}'
+        if match.group('limit'):
+            rewritten += f" LIMIT {match.group('limit')}"
+        return rewritten
@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""
+Chart-Aware Downsampling
+Thins oversized query results to the number of points a chart can show: Largest-Triangle-
+Three-Buckets (or min/max per bucket) for line and area series, stratified sampling for
+scatter plots. The first and last point of every series are kept, so the full range stays visible.
+"""
+
+import warnings
+import zlib
+import numpy as np
+import pandas as pd
+from typing import List, Dict, Any, Optional, Tuple
+
+# Points each chart family is reduced to (split across series for multi-line / 3D charts)
+CHART_POINT_TARGETS = {
+    'line': 150,
+    'area': 150,
+    'scatter': 300,
+}
+CHART_FAMILIES = (
+    ('multilinechart', 'line'),
+    ('linechart', 'line'),
+    ('areachart', 'area'),
+    ('scatterplot', 'scatter'),
+)
+# Rows fetched for reducible charts, in place of the LIMIT other charts get
+POINT_FETCH_LIMIT = 20000
+MIN_SERIES_POINTS = 10
+SCATTER_STRATA = 10
+
+X_NAME_HINTS = ('time', 'date', 'year', 'month', 'period', 'x')
+Y_NAME_HINTS = ('value', 'y', 'count', 'total', 'amount')
+
+
+def chart_family(chart_type: str) -> Optional[str]:
+    """'line', 'area' or 'scatter' for charts whose points can be thinned, else None"""
+    chart_type = (chart_type or '').lower()
+    for prefix, family in CHART_FAMILIES:
+        if chart_type.startswith(prefix):
+            return family
+    return None
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, target: int) -> List[int]:
+    """Largest-Triangle-Three-Buckets over points sorted by x; returns the kept positions"""
+    n = len(x)
+    if target >= n or target < 3:
+        return list(range(n))
+
+    every = (n - 2) / (target - 2)
+    kept = [0]
+    a = 0
+    for i in range(target - 2):
+        # Average of the next bucket is the third triangle corner
+        next_start = int((i + 1) * every) + 1
+        next_end = min(int((i + 2) * every) + 1, n)
+        avg_x, avg_y = x[next_start:next_end].mean(), y[next_start:next_end].mean()
+
+        start, end = int(i * every) + 1, int((i + 1) * every) + 1
+        areas = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a]))
+        a = start + int(np.argmax(areas))
+        kept.append(a)
+    kept.append(n - 1)
+    return kept
+
+
+def min_max_indices(y: np.ndarray, target: int) -> List[int]:
+    """Minimum and maximum of each of target/2 equal-width buckets, plus both ends"""
+    n = len(y)
+    if target >= n or target < 4:
+        return list(range(n))
+
+    kept = {0, n - 1}
+    for bucket in np.array_split(np.arange(1, n - 1), (target - 2) // 2):
+        if len(bucket):
+            kept.add(int(bucket[np.argmin(y[bucket])]))
+            kept.add(int(bucket[np.argmax(y[bucket])]))
+    return sorted(kept)
+
+
+def stratified_indices(strata: np.ndarray, target: int, rng: np.random.Generator) -> List[int]:
+    """Random sample with each stratum represented in proportion to its size (at least one point each)"""
+    n = len(strata)
+    if target >= n:
+        return list(range(n))
+
+    labels, counts = np.unique(strata, return_counts=True)
+    quotas = counts * target / n
+    allocation = np.maximum(np.floor(quotas).astype(int), 1)
+    # Hand the remaining points to the largest remainders
+    for i in np.argsort(quotas - np.floor(quotas))[::-1][:max(0, target - allocation.sum())]:
+        allocation[i] += 1
+    allocation = np.minimum(allocation, counts)
+
+    kept = []
+    for label, size in zip(labels, allocation):
+        members = np.flatnonzero(strata == label)
+        kept.extend(rng.choice(members, size=size, replace=False).tolist())
+    return sorted(kept)
+
+
+def _to_numbers(values: pd.Series) -> pd.Series:
+    """Numeric view of a column; text numbers with thousands separators (e.g. '105,000') included"""
+    if not pd.api.types.is_numeric_dtype(values):
+        values = values.astype(str).str.replace(',', '', regex=False)
+    return pd.to_numeric(values, errors='coerce')
+
+
+def _is_numeric(values: pd.Series) -> bool:
+    """At least 90% of the non-null values are numbers"""
+    present = values.dropna()
+    return len(present) > 0 and _to_numbers(present).notna().mean() >= 0.9
+
+
+def _numeric_axis(values: pd.Series) -> np.ndarray:
+    """x values as floats: numbers as-is, parseable dates as timestamps, other labels in query order
+
+    Labels such as 'Year ending Dec 1995' neither parse nor sort correctly as text, so they keep
+    the order the query returned them in (its ORDER BY).
+    """
+    numeric = _to_numbers(values)
+    if numeric.notna().all():
+        return numeric.to_numpy(dtype=float)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', UserWarning)
+        dates = pd.to_datetime(values.astype(str), errors='coerce')
+    if dates.notna().all():
+        return dates.astype('int64').to_numpy(dtype=float)
+    return pd.factorize(values)[0].astype(float)
+
+
+def _axes(frame: pd.DataFrame, family: str) -> Tuple[Optional[str], Optional[str], List[str]]:
+    """(x column, y column, series columns) of a result set
+
+    Text columns are series keys only when each value repeats enough to form a line; a label
+    per point (e.g. one LSOA per scatter dot) is carried along, not grouped on.
+    """
+    columns = list(frame.columns)
+    numeric = [c for c in columns if _is_numeric(frame[c])]
+
+    x_col = next((c for c in columns if c.lower() in X_NAME_HINTS), None)
+    if x_col is None:
+        x_col = numeric[0] if family == 'scatter' and numeric else columns[0]
+    y_col = next((c for c in columns if c != x_col and c.lower() in Y_NAME_HINTS and c in numeric), None)
+    if y_col is None:
+        y_col = next((c for c in numeric if c != x_col), None)
+    series = [c for c in columns if c not in (x_col, y_col) and c not in numeric
+              and frame[c].nunique(dropna=False) * MIN_SERIES_POINTS <= len(frame)]
+    return x_col, y_col, series
+
+
+def reduce_points(rows: List[Dict[str, Any]], chart_type: str, method: str = 'lttb', seed: int = 42,
+                  proposition_id: str = '') -> Tuple[List[Dict[str, Any]], Optional[Dict[str, Any]]]:
+    """Thin rows to the chart type's point target; returns (rows, info) with info None if untouched
+
+    The target is split across series, at least MIN_SERIES_POINTS each. When there are more series
+    than that allows, only the longest are kept, or, if the series are shorter than
+    MIN_SERIES_POINTS anyway, all points are thinned as one series. Kept rows are returned in their
+    original order.
+    """
+    family = chart_family(chart_type)
+    if not family or not isinstance(rows, list):
+        return rows, None
+    target = CHART_POINT_TARGETS[family]
+    if len(rows) <= target:
+        return rows, None
+
+    frame = pd.DataFrame(rows)
+    x_col, y_col, series = _axes(frame, family)
+    if y_col is None:
+        return rows, None
+
+    groups = list(frame.groupby(series, sort=False, dropna=False).indices.values()) if series \
+        else [np.arange(len(frame))]
+    series_count = len(groups)
+    max_series = max(1, target // MIN_SERIES_POINTS)
+    if len(groups) > max_series:
+        if len(frame) / len(groups) < MIN_SERIES_POINTS:
+            # Series too short to draw as lines: thin all points together in x order
+            groups = [np.arange(len(frame))]
+        else:
+            # Keep the longest series, so the total stays within the target at MIN_SERIES_POINTS each
+            groups = sorted(groups, key=len, reverse=True)[:max_series]
+    per_series = target // len(groups)
+
+    rng = np.random.default_rng([seed, zlib.crc32(proposition_id.encode('utf-8'))])
+    kept = []
+    for positions in groups:
+        group = frame.iloc[positions]
+        x = _numeric_axis(group[x_col])
+        y = _to_numbers(group[y_col]).to_numpy(dtype=float)
+        valid = ~np.isnan(y)
+        order = np.argsort(x[valid], kind='stable')
+        candidates = positions[valid][order]
+
+        if family == 'scatter':
+            # Strata: the series itself, split into x-quantile bins so the whole x range is covered
+            bins = np.minimum((np.arange(len(candidates)) * SCATTER_STRATA) // max(1, len(candidates)),
+                              SCATTER_STRATA - 1)
+            chosen = stratified_indices(bins, per_series, rng)
+        elif method == 'minmax':
+            chosen = min_max_indices(y[valid][order], per_series)
+        else:
+            chosen = lttb_indices(x[valid][order], y[valid][order], per_series)
+        kept.extend(candidates[chosen].tolist())
+
+    if len(kept) == len(rows):
+        return rows, None
+    kept.sort()
+    return [rows[i] for i in kept], {
+        'method': 'stratified' if family == 'scatter' else method,
+        'original_points': len(rows),
+        'returned_points': len(kept),
+        'series': series_count,
+        'dropped_series': series_count - len(groups) if len(groups) > 1 else 0,
+        'x': x_col,
+        'y': y_col,
+    }
@@ -5,6 +5,7 @@ Executes SQL queries from validated propositions and generates final JSON with a
 """
 
 import os
+import sys
 import json
 import pandas as pd
 import sqlite3
@@ -13,11 +14,81 @@ from datetime import datetime
 import argparse
 from pathlib import Path
 import random
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Dict, Any, Optional
 
+from local_data_synthesizer import LocalDataSynthesizer
+from batch_fallback_generator import BatchFallbackGenerator, PendingFallback
+from approximate_query import ApproximateQueryEngine
+from rollup_tables import RollupManager
+from chart_views import ChartViewManager
+from geo_dimensions import GeoDimensionBuilder
+from dictionary_encoding import DictionaryEncoder
+from query_fusion import QueryFusion
+from cost_model import QueryCostModel, schedule_longest_first
+from downsampling import reduce_points, chart_family, POINT_FETCH_LIMIT
+from dataset_packs import DatasetPackManager
+from column_pruning import ColumnPruner
+from dataset_version import table_fingerprint, combine_fingerprints, write_guard
+
+# Instructions shared by every LLM fallback request; the user prompt carries only the proposition
+FALLBACK_SYSTEM_PROMPT = """You are a data generator for London demographic and crime visualization.
+Generate realistic sample data for the requested chart:
+1. Generate exactly the requested number of records
+2. Use column names that match the expected output columns
+3. Make data values realistic for London (boroughs, crime types, population ranges, etc.)
+4. Include proper data types (numbers for counts, strings for categories)
+5. Ensure data supports the chart type
+Return only a valid JSON array of objects with no additional text or markdown formatting."""
+# Tokens of dataset context sent per fallback request (LLM_CONTEXT_TOKENS or --llm-context-tokens override it)
+DEFAULT_FALLBACK_CONTEXT_TOKENS = 300
+# GPT-4o client helpers (token counting, usage log, repair loop) live with the SQL validators
+VANNA_SQL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'vanna_sql')
+
+
+def add_vanna_sql_path():
+    """Make the vanna_sql modules importable"""
+    if VANNA_SQL_DIR not in sys.path:
+        sys.path.append(VANNA_SQL_DIR)
+
 class SQLQueryExecutor:
-    def __init__(self):
-        """Initialize the SQL Query Executor"""
+    def __init__(self, synthesizer_seed=42, use_llm_fallback=False, approximate=False, sample_fraction=0.01,
+                 use_rollups=True, use_chart_views=False, ingest_chunk_size=None, dictionary_encode=False,
+                 fuse_queries=True, downsample='lttb', pack_manifest=None, prune_columns_for=None,
+                 llm_base_url=None, repair_attempts=0, geo_dimensions=False, llm_context_tokens=None):
+        """Initialize the SQL Query Executor
+
+        Args:
+            synthesizer_seed (int): Seed for the local fallback data synthesizer
+            use_llm_fallback (bool): Also try GPT-4o fallback data when local synthesis fails
+            approximate (bool): Answer eligible aggregate queries from stratified samples
+            sample_fraction (float): Fraction of each stratum kept in approximate mode
+            use_rollups (bool): Route eligible COUNT queries to pre-aggregated rollups, each built the
+                first time a query can use it
+            use_chart_views (bool): Materialize common chart-shape views and serve matching queries from them
+                (off by default: building them adds startup time)
+            ingest_chunk_size (int): Stream each CSV into SQLite in chunks of this many rows
+                (peak memory bounded by the chunk, not the file); None loads each file in one read
+            dictionary_encode (bool): Store low-cardinality text columns as integer codes behind decoding views
+                (off by default: encoding and reads through the views add startup time)
+            fuse_queries (bool): Run propositions that differ only in one filter literal as a single query
+            downsample (str): 'lttb' or 'minmax' to thin line/area results (scatter is sampled by stratum)
+                to each chart type's point target instead of truncating at max_rows; None keeps LIMIT 100
+            pack_manifest (str): JSON manifest of extra dataset packs, attached on first reference as
+                <pack>.<table> [default: dataset_packs.json next to this script]
+            prune_columns_for (str | list): Propositions JSON file (or list of SQL queries) whose referenced
+                columns, plus key columns, are the only ones loaded; others load on first use. None loads all
+            llm_base_url (str): OpenAI-compatible endpoint for the LLM fallback, e.g. openai_standin.py
+                [default: LLM_BASE_URL, else the OpenAI API]
+            repair_attempts (int): Rounds of execute-error-repair for queries that fail or return no rows
+                (the SQLite error and table schema go to GPT-4o, the fix is executed again); 0 disables it
+            geo_dimensions (bool): Build dim_borough / dim_msoa / dim_lsoa, an indexed {table}__keys table and a
+                {table}__geo view with integer *_key columns per table (loaded tables are unchanged)
+            llm_context_tokens (int): Dataset-context budget of an LLM fallback prompt
+                [default: LLM_CONTEXT_TOKENS, else 300]
+        """
         # Dataset file mappings (from vanna_setup.py)
         self.dataset_paths = {
             'crime_data': '../../../public/dataset/london/crime-rates/london_crime_data_2022_2023.csv',
@@ -54,13 +125,97 @@ class SQLQueryExecutor:
         
         # Load London metadata for better data generation
         self.london_metadata = self._load_london_metadata()
+        self.metadata_index = {category['name']: category for category in self.london_metadata.get('categories', [])}
         
-        # Create in-memory SQLite database
-        self.conn = sqlite3.connect(':memory:')
+        # Rule-based fallback generation (batched runs queue propositions here)
+        self.fallback_generator = BatchFallbackGenerator(self.metadata_index, list(self.dataset_to_table.keys()))
+        self._pending_fallbacks = None
+        
+        # Create in-memory SQLite database (shared with worker threads in parallel runs)
+        self.conn = sqlite3.connect(':memory:', check_same_thread=False)
+        self._worker_state = threading.local()
+        self._worker_connections = []
+        self._worker_lock = threading.Lock()
         self.conn.execute("PRAGMA table_info=json1")  # Enable JSON1 extension if available
         
-        # Load all datasets into SQLite
+        # Load all datasets into SQLite (fingerprinting each source so results can be tied to a data version)
+        self.ingest_chunk_size = ingest_chunk_size
+        self.table_fingerprints = {}
+        self.ingest_stats = {}
+        
+        # Column pruning: only columns the given propositions' SQL reads are loaded up front; the rest
+        # are restored on demand from sources that still match their pinned fingerprints
+        self.column_pruner = None
+        if prune_columns_for:
+            self.column_pruner = ColumnPruner(self.dataset_paths, self._clean_column_names,
+                                              self._pruning_queries(prune_columns_for), self.table_fingerprints)
+        
         self.load_datasets()
+        self.dataset_version = combine_fingerprints(self.table_fingerprints)
+        print(f"🔖 Dataset version: {self.dataset_version}")
+        
+        # Extra datasets live in their own database files and are only attached when a query names them
+        self.dataset_packs = DatasetPackManager(
+            pack_manifest or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'dataset_packs.json'),
+            clean_columns=self._clean_column_names
+        )
+        if self.dataset_packs.packs:
+            print(f"🧩 Dataset packs available: {', '.join(self.dataset_packs.packs)}")
+        
+        # Low-cardinality text columns become integer codes; views under the original names decode them
+        self.dictionary_encoder = None
+        if dictionary_encode:
+            print("🔤 Dictionary-encoding low-cardinality text columns...")
+            self.dictionary_encoder = DictionaryEncoder(self.conn)
+            self.dictionary_encoder.encode_all()
+        
+        # Canonical borough / MSOA / LSOA dimensions; {table}__geo views add integer *_key columns for joins
+        # (built after encoding: the keys are stored by the rowid of each table's final storage)
+        self.geo_dimensions = None
+        if geo_dimensions:
+            print("🗺️  Building geographic dimensions...")
+            self.geo_dimensions = GeoDimensionBuilder(
+                self.conn, lookup_path='../../../public/dataset/london/lsoa/land-area-population-density-lsoa11.csv'
+            )
+            self.geo_dimensions.build()
+        
+        # Pre-aggregated rollups (crime counts by borough x month x category), built on the first eligible query
+        self.rollups = RollupManager(self.conn) if use_rollups else None
+        
+        # Materialized chart-shape views (value by borough, value over time, top categories)
+        self.chart_views = None
+        if use_chart_views:
+            print("🗂️  Materializing chart-shape views...")
+            self.chart_views = ChartViewManager(self.conn)
+            self.chart_views.build()
+        
+        self.downsample = downsample
+        
+        # Offline fallback data fitted on the loaded tables (replaces the per-proposition LLM call)
+        self.use_llm_fallback = use_llm_fallback
+        self.use_direct_openai = False
+        self.openai_client = None
+        if use_llm_fallback:
+            self._init_llm_client(llm_base_url or os.getenv('LLM_BASE_URL'))
+        self.llm_base_url = llm_base_url
+        self.repair_attempts = repair_attempts
+        self.llm_context_tokens = llm_context_tokens or int(os.getenv('LLM_CONTEXT_TOKENS', DEFAULT_FALLBACK_CONTEXT_TOKENS))
+        self.repair_stats = None
+        self.synthesizer = LocalDataSynthesizer(self.conn, seed=synthesizer_seed)
+        
+        # Approximate mode: stratified samples (borough x month for crime) with confidence intervals
+        self.approximate_engine = None
+        if approximate:
+            print("🎯 Building stratified samples for approximate mode...")
+            self.approximate_engine = ApproximateQueryEngine(self.conn, sample_fraction=sample_fraction, seed=synthesizer_seed)
+            self.approximate_engine.build_samples()
+        
+        # Propositions sharing a query template are prefetched together at the start of each run
+        self.query_fusion = None
+        if fuse_queries:
+            self.query_fusion = QueryFusion(
+                self.conn, rewrite=self.dictionary_encoder.rewrite if self.dictionary_encoder else None
+            )
     
     def _load_london_metadata(self) -> Dict[str, Any]:
         """Load London dataset metadata for better data generation"""
@@ -75,6 +230,13 @@ class SQLQueryExecutor:
             print(f"⚠️  Failed to load London metadata: {e}")
             return {"categories": []}
     
+    def _pruning_queries(self, source):
+        """Cleaned SQL of a propositions JSON file, or of a list of queries"""
+        if isinstance(source, str):
+            with open(source, 'r') as f:
+                source = [p.get('sql_query', '') for p in json.load(f).get('consolidated_propositions', [])]
+        return [self.clean_sql_query(sql_query) for sql_query in source if sql_query]
+    
     def load_datasets(self):
         """Load all CSV datasets into SQLite database"""
         print("📂 Loading datasets into SQLite database...")
@@ -83,16 +245,37 @@ class SQLQueryExecutor:
             try:
                 if os.path.exists(csv_path):
                     print(f"  Loading {table_name} from {csv_path}")
-                    df = pd.read_csv(csv_path)
-                    
-                    # Clean column names (replace spaces and special characters)
-                    df.columns = [col.strip().replace(' ', '_').replace('-', '_').replace('/', '_') 
-                                for col in df.columns]
+                    started = time.perf_counter()
+                    usecols = self.column_pruner.load_positions(table_name) if self.column_pruner else None
+                    if self.ingest_chunk_size:
+                        columns, row_count, chunks = self._load_csv_chunked(table_name, csv_path, usecols)
+                    else:
+                        df = pd.read_csv(csv_path, usecols=usecols)
+                        
+                        # Clean column names (replace spaces and special characters)
+                        df.columns = self._clean_column_names(df.columns)
+                        
+                        # Load into SQLite
+                        df.to_sql(table_name, self.conn, if_exists='replace', index=False)
+                        columns, row_count, chunks = list(df.columns), len(df), 1
                     
-                    # Load into SQLite
-                    df.to_sql(table_name, self.conn, if_exists='replace', index=False)
+                    elapsed = time.perf_counter() - started
+                    loaded_columns = len(columns)
+                    if usecols is not None:
+                        # The version describes the source data, whichever of its columns are loaded
+                        columns = self.column_pruner.header(table_name)
+                    self.table_fingerprints[table_name] = table_fingerprint(csv_path, columns, row_count)
+                    self.ingest_stats[table_name] = {
+                        'rows': row_count,
+                        'chunks': chunks,
+                        'seconds': round(elapsed, 3),
+                        'rows_per_second': int(row_count / elapsed) if elapsed > 0 else row_count,
+                    }
                     
-                    print(f"    ✅ Loaded {len(df)} rows, {len(df.columns)} columns")
+                    print(f"    ✅ Loaded {row_count} rows, {loaded_columns}"
+                          f"{f'/{len(columns)}' if usecols is not None else ''} columns "
+                          f"({self.ingest_stats[table_name]['rows_per_second']:,} rows/s"
+                          f"{f', {chunks} chunks' if self.ingest_chunk_size else ''})")
                 else:
                     print(f"    ❌ File not found: {csv_path}")
                     
@@ -101,6 +284,47 @@ class SQLQueryExecutor:
         
         print("✅ Dataset loading completed")
     
+    def _clean_column_names(self, columns):
+        """Replace spaces and special characters in CSV headers"""
+        return [col.strip().replace(' ', '_').replace('-', '_').replace('/', '_') for col in columns]
+    
+    def _load_csv_chunked(self, table_name, csv_path, usecols=None):
+        """Stream a CSV into SQLite chunk by chunk; returns (columns, row count, chunk count)
+
+        The first chunk fixes the table schema. Later chunks are converted to its column
+        types before the append, so per-chunk dtype inference cannot drift (e.g. an integer
+        column that only has gaps further down the file).
+        """
+        schema = None
+        row_count = chunks = 0
+        for chunk in pd.read_csv(csv_path, chunksize=self.ingest_chunk_size, usecols=usecols):
+            chunk.columns = self._clean_column_names(chunk.columns)
+            if schema is None:
+                schema = chunk.dtypes
+                chunk.to_sql(table_name, self.conn, if_exists='replace', index=False)
+            else:
+                for col, dtype in schema.items():
+                    if chunk[col].dtype == dtype:
+                        continue
+                    if pd.api.types.is_numeric_dtype(dtype):
+                        converted = pd.to_numeric(chunk[col], errors='coerce')
+                        # Only convert when no text value would be lost
+                        if converted.notna().sum() == chunk[col].notna().sum():
+                            chunk[col] = converted
+                    elif pd.api.types.is_object_dtype(dtype):
+                        chunk[col] = chunk[col].astype(object)
+                chunk.to_sql(table_name, self.conn, if_exists='append', index=False)
+            row_count += len(chunk)
+            chunks += 1
+        
+        if schema is None:
+            # Header-only file: create the empty table so downstream steps still find it
+            header = pd.read_csv(csv_path, nrows=0, usecols=usecols)
+            header.columns = self._clean_column_names(header.columns)
+            header.to_sql(table_name, self.conn, if_exists='replace', index=False)
+            schema = header.dtypes
+        return list(schema.index), row_count, chunks
+    
     def clean_sql_query(self, sql_query):
         """Clean and prepare SQL query for execution"""
         # Remove markdown code block markers
@@ -185,6 +409,28 @@ class SQLQueryExecutor:
         
         return None
     
+    @property
+    def query_conn(self):
+        """Connection for proposition queries: the worker's own database copy in parallel runs"""
+        return getattr(self._worker_state, 'conn', None) or self.conn
+    
+    def _init_worker_connection(self):
+        """Give a pool thread a private copy of the loaded database so its queries run in parallel"""
+        worker_conn = sqlite3.connect(':memory:', check_same_thread=False)
+        self.conn.backup(worker_conn)
+        worker_conn.execute('PRAGMA query_only = ON')
+        self.dataset_packs.attach_all_known(worker_conn)
+        self._worker_state.conn = worker_conn
+        with self._worker_lock:
+            self._worker_connections.append(worker_conn)
+    
+    def _close_worker_connections(self):
+        """Release the per-worker database copies after a parallel run"""
+        with self._worker_lock:
+            for worker_conn in self._worker_connections:
+                worker_conn.close()
+            self._worker_connections = []
+    
     def execute_sql_query(self, sql_query, max_rows=100):
         """Execute SQL query and return results as JSON"""
         try:
@@ -196,6 +442,25 @@ class SQLQueryExecutor:
             
             print(f"    🔍 Executing: {cleaned_sql[:100]}...")
             
+            # Schema-qualified pack tables (e.g. hr.employee_attrition) attach their pack on first use
+            self.dataset_packs.attach_referenced(self.query_conn, cleaned_sql)
+            
+            # Columns pruned at load time are appended before the query runs: SQLite would read a
+            # quoted name of a missing column ("2015_16") as a string literal instead of failing
+            if self.column_pruner:
+                self.column_pruner.restore(self.query_conn, [cleaned_sql])
+            
+            # Rows already fetched by this query's fused template group
+            if self.query_fusion:
+                fused_rows = self.query_fusion.take(cleaned_sql, max_rows)
+                if fused_rows is not None:
+                    print(f"    🔗 Answered from fused query, {len(fused_rows)} rows")
+                    return fused_rows
+            
+            # Filter, group and sort dictionary-encoded columns on their integer codes
+            if self.dictionary_encoder:
+                cleaned_sql = self.dictionary_encoder.rewrite(cleaned_sql)
+            
             # Execute query with row limit
             if 'LIMIT' not in cleaned_sql.upper():
                 if cleaned_sql.rstrip().endswith(';'):
@@ -204,7 +469,7 @@ class SQLQueryExecutor:
                     cleaned_sql += f' LIMIT {max_rows}'
             
             # Execute the query
-            result = pd.read_sql_query(cleaned_sql, self.conn)
+            result = pd.read_sql_query(cleaned_sql, self.query_conn)
             
             # Convert to JSON-serializable format
             result_dict = result.to_dict('records')
@@ -219,7 +484,9 @@ class SQLQueryExecutor:
             
             # Try to provide more helpful error messages
             if 'no such table' in error_msg.lower():
-                available_tables = [name[0] for name in self.conn.execute("SELECT name FROM sqlite_master WHERE type='table'").fetchall()]
+                available_tables = [name[0] for name in self.query_conn.execute("SELECT name FROM sqlite_master WHERE type='table'").fetchall()]
+                available_tables += [f'{name}.{table}' for name, pack in self.dataset_packs.packs.items()
+                                     for table in pack['tables']]
                 error_msg += f". Available tables: {', '.join(available_tables)}"
             
             return {"error": error_msg}
@@ -262,7 +529,7 @@ class SQLQueryExecutor:
                         
                         print(f"    🧮 Computing mean (direct): {mean_sql[:100]}...")
                         
-                        result = pd.read_sql_query(mean_sql, self.conn)
+                        result = pd.read_sql_query(mean_sql, self.query_conn)
                         mean_value = result.iloc[0]['mean_value'] if len(result) > 0 else None
                         
                         if mean_value is not None:
@@ -275,7 +542,7 @@ class SQLQueryExecutor:
                 
                 print(f"    🧮 Computing mean (subquery): {mean_sql[:100]}...")
                 
-                result = pd.read_sql_query(mean_sql, self.conn)
+                result = pd.read_sql_query(mean_sql, self.query_conn)
                 mean_value = result.iloc[0]['mean_value'] if len(result) > 0 else None
                 
                 if mean_value is not None:
@@ -360,223 +627,76 @@ class SQLQueryExecutor:
     def generate_realistic_data(self, proposition: Dict[str, Any], requirements: Dict[str, Any]) -> List[Dict[str, Any]]:
         """Generate realistic data based on proposition context and requirements using metadata"""
         
-        chart_type = proposition.get('chart_type', '')
-        prop_id = proposition.get('proposition_id', '')
-        description = proposition.get('proposition_description', '')
-        
-        # Determine dataset context from metadata
-        dataset_name = None
-        dataset_metadata = None
-        
-        for ds_name in self.dataset_to_table.keys():
-            if prop_id.startswith(ds_name):
-                dataset_name = ds_name
-                # Find corresponding metadata
-                for category in self.london_metadata.get('categories', []):
-                    if category['name'] == dataset_name:
-                        dataset_metadata = category
-                        break
-                break
+        # In batch mode, defer generation until the whole run has been collected
+        if self._pending_fallbacks is not None:
+            placeholder = PendingFallback()
+            self._pending_fallbacks.append((proposition, requirements, placeholder))
+            print(f"    🗂️  Queued {requirements['data_generation_strategy']} fallback for batch generation")
+            return placeholder
         
-        strategy = requirements['data_generation_strategy']
-        min_records = requirements['min_records']
-        
-        print(f"    🎲 Generating {strategy} data for {chart_type} (min: {min_records} records)")
-        if dataset_metadata:
-            print(f"    📊 Using metadata context for {dataset_name}")
-        
-        if strategy == 'time_series':
-            return self._generate_time_series_data(dataset_name, description, min_records, dataset_metadata)
-        elif strategy == 'categorical':
-            return self._generate_categorical_data(dataset_name, description, min_records, dataset_metadata)
-        elif strategy == 'distribution':
-            return self._generate_distribution_data(dataset_name, description, min_records, dataset_metadata)
-        elif strategy == 'multi_dimensional':
-            return self._generate_multi_dimensional_data(dataset_name, description, min_records, dataset_metadata)
-        elif strategy == 'divergent':
-            return self._generate_divergent_data(dataset_name, description, min_records, dataset_metadata)
-        elif strategy == 'combo':
-            return self._generate_combo_data(dataset_name, description, min_records, dataset_metadata)
-        else:
-            return self._generate_categorical_data(dataset_name, description, min_records, dataset_metadata)
+        print(f"    🎲 Generating data for {proposition.get('chart_type', '')} (min: {requirements['min_records']} records)")
+        return self.fallback_generator.generate([(proposition, requirements)])[0]
     
-    def _generate_time_series_data(self, dataset_name: str, description: str, min_records: int, metadata: Optional[Dict] = None) -> List[Dict[str, Any]]:
-        """Generate time series data using metadata for realistic values"""
-        data = []
-        
-        # Determine time range and pattern based on dataset
-        if dataset_name == 'crime-rates':
-            time_values = ['2022-01', '2022-06', '2022-12', '2023-01', '2023-06', '2023-12']
-            base_value = random.randint(500, 2000)
-        elif dataset_name == 'population':
-            time_values = ['2001', '2006', '2011', '2016', '2021']
-            base_value = random.randint(200000, 500000)
-        else:
-            # Generic time series
-            time_values = [f"2022-{i:02d}" for i in range(1, min_records + 1)]
-            base_value = random.randint(100, 1000)
-        
-        # Generate trend based on description
-        trend_factor = 1.1 if any(word in description.lower() for word in ['increase', 'surge', 'rise', 'growth']) else 0.95
-        
-        for i, time_val in enumerate(time_values[:min_records]):
-            value = int(base_value * (trend_factor ** i) + random.randint(-50, 50))
-            data.append({
-                'time': time_val,
-                'value': max(0, value)  # Ensure non-negative
-            })
-        
-        return data
+    def begin_fallback_batch(self):
+        """Start collecting propositions that need rule-based fallback data"""
+        self._pending_fallbacks = []
     
-    def _generate_categorical_data(self, dataset_name: str, description: str, min_records: int, metadata: Optional[Dict] = None) -> List[Dict[str, Any]]:
-        """Generate categorical data using metadata for realistic values"""
-        data = []
-        
-        # Use metadata to get realistic categories and values
-        categories = []
-        base_range = (50, 500)
-        
-        if metadata and metadata.get('files'):
-            # Extract categories from metadata
-            file_summary = metadata['files'][0].get('file_summary', {})
-            value_examples = file_summary.get('value_examples', {})
-            
-            # Try to find categorical columns
-            for col_name, values in value_examples.items():
-                if isinstance(values, list) and len(values) > 1:
-                    if any(keyword in col_name.lower() for keyword in ['name', 'category', 'type', 'group', 'borough']):
-                        categories = values[:min_records]
-                        break
-            
-            # Adjust value ranges based on dataset type
-            if dataset_name == 'crime-rates':
-                base_range = (100, 1500)
-            elif dataset_name == 'population':
-                base_range = (10000, 100000)
-            elif dataset_name == 'income':
-                base_range = (25000, 65000)
-        
-        # Fallback to hardcoded categories if metadata doesn't provide good ones
-        if not categories:
-            if dataset_name == 'crime-rates':
-                categories = ['violent-crime', 'theft', 'burglary', 'anti-social-behaviour', 'drug-offences']
-                base_range = (100, 1500)
-            elif dataset_name == 'country-of-births':
-                categories = ['United Kingdom', 'India', 'Poland', 'Ireland', 'Nigeria', 'Bangladesh']
-                base_range = (500, 5000)
-            elif dataset_name == 'ethnicity':
-                categories = ['White British', 'Asian', 'Black', 'Mixed', 'Other']
-                base_range = (10000, 100000)
-            elif dataset_name == 'income':
-                categories = ['Westminster', 'Kensington and Chelsea', 'Camden', 'Tower Hamlets', 'Hackney']
-                base_range = (25000, 65000)
-            else:
-                # Generic categories
-                categories = [f'Category_{i+1}' for i in range(min_records)]
-                base_range = (50, 500)
-        
-        # Generate data using categories
-        for i, category in enumerate(categories[:min_records]):
-            value = random.randint(*base_range)
-            data.append({
-                'category': category,
-                'value': value
-            })
+    def flush_fallback_batch(self) -> int:
+        """Generate all queued fallback data in grouped, vectorized passes and fill the placeholders"""
+        pending = self._pending_fallbacks or []
+        self._pending_fallbacks = None
         
-        return data
-    
-    def _generate_distribution_data(self, dataset_name: str, description: str, min_records: int, metadata: Optional[Dict] = None) -> List[Dict[str, Any]]:
-        """Generate distribution/heatmap data"""
-        data = []
+        if not pending:
+            return 0
         
-        if dataset_name == 'crime-rates':
-            x_bins = ['violent-crime', 'theft', 'burglary', 'drug-offences']
-            y_bins = ['Westminster', 'Camden', 'Hackney', 'Tower Hamlets']
-        else:
-            x_bins = [f'X_Bin_{i+1}' for i in range(4)]
-            y_bins = [f'Y_Bin_{i+1}' for i in range(4)]
-        
-        for x_bin in x_bins:
-            for y_bin in y_bins:
-                if len(data) >= min_records:
-                    break
-                count = random.randint(5, 100)
-                data.append({
-                    'x_bin': x_bin,
-                    'y_bin': y_bin,
-                    'count': count
-                })
+        print(f"\n🎲 Generating batched fallback data for {len(pending)} propositions...")
+        generated = self.fallback_generator.generate([(prop, req) for prop, req, _ in pending])
         
-        return data[:min_records]
-    
-    def _generate_multi_dimensional_data(self, dataset_name: str, description: str, min_records: int, metadata: Optional[Dict] = None) -> List[Dict[str, Any]]:
-        """Generate multi-dimensional data"""
-        data = []
-        
-        if dataset_name == 'crime-rates':
-            categories = ['violent-crime', 'theft', 'burglary']
-            dimensions = ['Westminster', 'Camden', 'Hackney']
-        elif dataset_name == 'ethnicity':
-            categories = ['White British', 'Asian', 'Black']
-            dimensions = ['Inner London', 'Outer London']
-        else:
-            categories = [f'Cat_{i+1}' for i in range(3)]
-            dimensions = [f'Dim_{i+1}' for i in range(3)]
-        
-        for category in categories:
-            for dimension in dimensions:
-                if len(data) >= min_records:
-                    break
-                value = random.randint(100, 1000)
-                data.append({
-                    'category': category,
-                    'value': value,
-                    'dimension': dimension
-                })
+        for (_, _, placeholder), rows in zip(pending, generated):
+            placeholder.extend(rows)
         
-        return data[:min_records]
+        return len(pending)
     
-    def _generate_divergent_data(self, dataset_name: str, description: str, min_records: int, metadata: Optional[Dict] = None) -> List[Dict[str, Any]]:
-        """Generate divergent bar chart data"""
-        data = []
-        
-        if dataset_name == 'crime-rates':
-            categories = ['violent-crime', 'theft', 'burglary', 'drug-offences']
-        elif dataset_name == 'income':
-            categories = ['Westminster', 'Kensington and Chelsea', 'Camden', 'Tower Hamlets']
-        else:
-            categories = [f'Category_{i+1}' for i in range(min_records)]
-        
-        for category in categories[:min_records]:
-            pos_val = random.randint(50, 300)
-            neg_val = random.randint(0, 100)
-            data.append({
-                'category': category,
-                'positive_value': pos_val,
-                'negative_value': neg_val
-            })
-        
-        return data
+    def generate_local_fallback_data(self, proposition: Dict[str, Any], requirements: Dict[str, Any]) -> Optional[List[Dict[str, Any]]]:
+        """Sample fallback data offline from distributions fitted on the loaded tables"""
+        try:
+            sql_query = self.clean_sql_query(proposition.get('sql_query', ''))
+            expected_columns = self._extract_sql_columns(sql_query)
+            table_name = self.detect_dataset_from_proposition(proposition)
+            
+            local_data = self.synthesizer.synthesize(
+                table_name,
+                sql_query,
+                expected_columns,
+                requirements['min_records'],
+                is_time_series=requirements['is_time_series'],
+                proposition_id=proposition.get('proposition_id', '')
+            )
+            
+            if local_data:
+                print(f"    🧪 Synthesized {len(local_data)} records locally from {table_name or 'query'} distributions")
+            return local_data
+            
+        except Exception as e:
+            print(f"    ⚠️  Local synthesis failed: {e}")
+            return None
     
-    def _generate_combo_data(self, dataset_name: str, description: str, min_records: int, metadata: Optional[Dict] = None) -> List[Dict[str, Any]]:
-        """Generate combo chart data (bar + line)"""
-        data = []
-        
-        if dataset_name == 'crime-rates':
-            categories = ['Westminster', 'Camden', 'Hackney', 'Tower Hamlets', 'Lambeth']
-        else:
-            categories = [f'Area_{i+1}' for i in range(min_records)]
-        
-        for category in categories[:min_records]:
-            bar_val = random.randint(100, 800)
-            line_val = random.randint(50, 200)
-            data.append({
-                'category': category,
-                'bar_value': bar_val,
-                'line_value': line_val
-            })
-        
-        return data
+    def _init_llm_client(self, base_url: Optional[str]):
+        """OpenAI client for the LLM fallback, pointed at base_url when given"""
+        api_key = os.getenv('OPENAI_API_KEY') or ('sk-standin' if base_url else None)
+        if not api_key:
+            print("⚠️  OPENAI_API_KEY not set; LLM fallback disabled")
+            return
+        try:
+            from openai import OpenAI
+        except ImportError:
+            print("⚠️  openai is not installed; LLM fallback disabled")
+            return
+        add_vanna_sql_path()
+        self.openai_client = OpenAI(api_key=api_key, base_url=base_url)
+        self.use_direct_openai = True
+        if base_url:
+            print(f"🧪 LLM fallback uses {base_url}")
     
     def generate_llm_fallback_data(self, proposition: Dict[str, Any], requirements: Dict[str, Any]) -> Optional[List[Dict[str, Any]]]:
         """Use OpenAI to generate realistic data when rule-based generation isn't sufficient"""
@@ -597,71 +717,49 @@ class SQLQueryExecutor:
             # Get relevant dataset metadata for context
             dataset_context = self._get_dataset_context_for_proposition(prop_id)
             
-            # Build comprehensive prompt with metadata context
-            prompt = f"""
-            Generate realistic sample data for a {chart_type} chart based on London demographic and crime data.
-            
-            Proposition: {description}
-            Expected columns: {expected_columns}
-            Minimum records needed: {requirements['min_records']}
-            
-            Dataset Context:
-            {dataset_context}
-            
-            Requirements:
-            1. Generate exactly {requirements['min_records']} records
-            2. Use column names that match the expected output: {expected_columns}
-            3. Make data values realistic for London (boroughs, crime types, population ranges, etc.)
-            4. Include proper data types (numbers for counts, strings for categories)
-            5. Ensure data supports the chart type ({chart_type})
-            
-            Return only a valid JSON array of objects with no additional text or markdown formatting.
-            """
-            
-            print(f"    🤖 Requesting LLM fallback data with dataset context...")
-            
-            if hasattr(self, 'openai_client') and self.openai_client:
-                response = self.openai_client.chat.completions.create(
-                    model="gpt-4o",
-                    messages=[
-                        {"role": "system", "content": "You are a data generator. Return only valid JSON arrays."},
-                        {"role": "user", "content": prompt}
-                    ],
-                    max_tokens=2000,
-                    temperature=0.3
-                )
-                
-                json_text = response.choices[0].message.content.strip()
-                # Clean up the response
-                json_text = re.sub(r'^```json\n?', '', json_text)
-                json_text = re.sub(r'\n?```$', '', json_text)
-                
-                llm_data = json.loads(json_text)
-                print(f"    ✅ LLM generated {len(llm_data)} records with metadata context")
-                
-                return llm_data
-                
-            else:
+            # Shared instructions are in the system prompt; whole context lines are kept, in order,
+            # while they fit the token budget
+            from token_usage import count_tokens, shared_usage_log
+            context_lines = []
+            for line in dataset_context.split('\n'):
+                if count_tokens('\n'.join(context_lines + [line])) > self.llm_context_tokens:
+                    break
+                context_lines.append(line)
+            prompt = (f"Chart type: {chart_type}\n"
+                      f"Proposition: {description}\n"
+                      f"Expected columns: {expected_columns}\n"
+                      f"Records needed: {requirements['min_records']}\n"
+                      f"Dataset context:\n" + '\n'.join(context_lines))
+            messages = [
+                {"role": "system", "content": FALLBACK_SYSTEM_PROMPT},
+                {"role": "user", "content": prompt}
+            ]
+            prompt_tokens = count_tokens(FALLBACK_SYSTEM_PROMPT) + count_tokens(prompt)
+            
+            print(f"    🤖 Requesting LLM fallback data with dataset context (~{prompt_tokens} prompt tokens)...")
+            
+            def request():
+                if hasattr(self, 'openai_client') and self.openai_client:
+                    return self.openai_client.chat.completions.create(
+                        model="gpt-4o", messages=messages, max_tokens=2000, temperature=0.3
+                    )
                 # Try legacy OpenAI format
                 import openai as openai_legacy
-                response = openai_legacy.ChatCompletion.create(
-                    model="gpt-4o",
-                    messages=[
-                        {"role": "system", "content": "You are a data generator for London demographic and crime visualization. Return only valid JSON arrays with realistic London data."},
-                        {"role": "user", "content": prompt}
-                    ],
-                    max_tokens=800,
-                    temperature=0.3
+                return openai_legacy.ChatCompletion.create(
+                    model="gpt-4o", messages=messages, max_tokens=2000, temperature=0.3
                 )
-                
-                json_text = response.choices[0].message.content.strip()
-                json_text = re.sub(r'^```json\n?', '', json_text)
-                json_text = re.sub(r'\n?```$', '', json_text)
-                
-                llm_data = json.loads(json_text)
-                print(f"    ✅ LLM generated {len(llm_data)} records with metadata context")
-                
-                return llm_data
+            
+            # Logged with the API's token counts in the validators' usage log (.llm_cache/usage.jsonl)
+            json_text = shared_usage_log().track('llm_fallback', 'gpt-4o', request)().strip()
+            
+            # Clean up the response
+            json_text = re.sub(r'^```json\n?', '', json_text)
+            json_text = re.sub(r'\n?```$', '', json_text)
+            
+            llm_data = json.loads(json_text)
+            print(f"    ✅ LLM generated {len(llm_data)} records with metadata context")
+            
+            return llm_data
                 
         except Exception as e:
             print(f"    ❌ LLM fallback failed: {e}")
@@ -686,47 +784,42 @@ class SQLQueryExecutor:
         """Get relevant dataset metadata context for a proposition"""
         
         # Determine which dataset this proposition relates to
-        dataset_name = None
-        for ds_name in self.dataset_to_table.keys():
-            if prop_id.startswith(ds_name):
-                dataset_name = ds_name
-                break
+        dataset_name = self.fallback_generator.dataset_for(prop_id)
         
-        if not dataset_name or not self.london_metadata.get('categories'):
+        if not dataset_name or not self.metadata_index:
             return "No specific dataset context available."
         
-        # Find matching category in metadata
-        for category in self.london_metadata['categories']:
-            if category['name'] == dataset_name:
-                # Build context from metadata
-                context_parts = [
-                    f"Dataset: {category['name']} - {category['description']}",
-                ]
+        category = self.metadata_index.get(dataset_name)
+        if category:
+            # Build context from metadata
+            context_parts = [
+                f"Dataset: {category['name']} - {category['description']}",
+            ]
+            
+            for file_info in category.get('files', [])[:1]:  # Use first file
+                summary = file_info.get('file_summary', {})
                 
-                for file_info in category.get('files', [])[:1]:  # Use first file
-                    summary = file_info.get('file_summary', {})
-                    
-                    # Column information
-                    columns = summary.get('column_names', [])
-                    if columns:
-                        context_parts.append(f"Available columns: {', '.join(columns[:8])}")  # Limit to first 8
-                    
-                    # Value examples for key columns
-                    value_examples = summary.get('value_examples', {})
-                    if value_examples:
-                        examples_text = []
-                        for col, values in list(value_examples.items())[:3]:  # First 3 columns
-                            if isinstance(values, list) and values:
-                                examples_text.append(f"{col}: {', '.join(map(str, values[:3]))}")
-                        if examples_text:
-                            context_parts.append(f"Example values: {'; '.join(examples_text)}")
-                    
-                    # Data sample
-                    data_sample = summary.get('data_sample', [])
-                    if data_sample:
-                        context_parts.append(f"Sample record: {str(data_sample[0])[:200]}...")
+                # Column information
+                columns = summary.get('column_names', [])
+                if columns:
+                    context_parts.append(f"Available columns: {', '.join(columns[:8])}")  # Limit to first 8
                 
-                return '\n'.join(context_parts)
+                # Value examples for key columns
+                value_examples = summary.get('value_examples', {})
+                if value_examples:
+                    examples_text = []
+                    for col, values in list(value_examples.items())[:3]:  # First 3 columns
+                        if isinstance(values, list) and values:
+                            examples_text.append(f"{col}: {', '.join(map(str, values[:3]))}")
+                    if examples_text:
+                        context_parts.append(f"Example values: {'; '.join(examples_text)}")
+                
+                # Data sample
+                data_sample = summary.get('data_sample', [])
+                if data_sample:
+                    context_parts.append(f"Sample record: {str(data_sample[0])[:200]}...")
+            
+            return '\n'.join(context_parts)
         
         return f"Dataset category '{dataset_name}' context not found in metadata."
     
@@ -738,15 +831,24 @@ class SQLQueryExecutor:
         
         print(f"    📊 Validating data for {chart_type} (min: {requirements['min_records']} records)")
         
-        # Case 1: Empty results - generate data
-        if not sql_result or len(sql_result) == 0:
-            print(f"    ⚠️  Empty results detected, generating data...")
+        # Case 1: Empty results or execution error - generate data
+        if not sql_result or len(sql_result) == 0 or isinstance(sql_result, dict):
+            if isinstance(sql_result, dict):
+                print(f"    ⚠️  Query failed ({sql_result.get('error', 'unknown error')[:80]}), generating data...")
+            else:
+                print(f"    ⚠️  Empty results detected, generating data...")
             
-            # Try LLM fallback first
-            generated_data = self.generate_llm_fallback_data(proposition, requirements)
+            # Try local statistical synthesis first (offline, seeded)
+            generated_data = self.generate_local_fallback_data(proposition, requirements)
             if generated_data and len(generated_data) >= requirements['min_records']:
                 return generated_data
             
+            # Optional LLM fallback
+            if self.use_llm_fallback:
+                generated_data = self.generate_llm_fallback_data(proposition, requirements)
+                if generated_data and len(generated_data) >= requirements['min_records']:
+                    return generated_data
+            
             # Fall back to rule-based generation
             return self.generate_realistic_data(proposition, requirements)
         
@@ -835,6 +937,34 @@ class SQLQueryExecutor:
         
         return extended_data
     
+    def route_query(self, cleaned_sql):
+        """Chart view and rollup rewrites for a cleaned query (at most one is set)"""
+        chart_view = self.chart_views.rewrite(cleaned_sql) if self.chart_views else None
+        if self.rollups and not chart_view and self.query_conn is self.conn:
+            # Worker copies only see rollups built before they were taken
+            self.rollups.prepare([cleaned_sql])
+        rollup = self.rollups.rewrite(cleaned_sql) if self.rollups and not chart_view else None
+        return chart_view, rollup
+    
+    def fetch_rows(self, proposition: Dict[str, Any]) -> int:
+        """Row cap for a proposition's query: point charts fetch the full series to be downsampled"""
+        if self.downsample and chart_family(proposition.get('chart_type', '')):
+            return POINT_FETCH_LIMIT
+        return 100
+    
+    def planned_query(self, proposition: Dict[str, Any]) -> Optional[str]:
+        """The cleaned SQL process_proposition will send to execute_query, or None if it sends none"""
+        sql_query = proposition.get('sql_query', '')
+        if not sql_query:
+            return None
+        cleaned_sql = self.clean_sql_query(sql_query)
+        chart_view, rollup = self.route_query(cleaned_sql)
+        if chart_view or rollup:
+            return self.clean_sql_query((chart_view or rollup)['sql'])
+        if self.approximate_engine and self.approximate_engine.parse(cleaned_sql):
+            return None
+        return cleaned_sql
+    
     def process_proposition(self, proposition: Dict[str, Any]) -> Dict[str, Any]:
         """Process a single proposition by executing its SQL query with error handling."""
         prop_id = proposition.get('proposition_id', 'Unknown')
@@ -853,12 +983,39 @@ class SQLQueryExecutor:
                 'has_mean': False, 
                 'mean_value': None, 
                 'has_threshold': False,
-                'data_source': 'generated'
+                'data_source': 'generated',
+                'dataset_version': self.dataset_version
             }
         
         try:
-            # Execute the SQL query
-            raw_query_result = self.execute_query(sql_query)
+            # Execute the SQL query (exact from a chart view or rollup, else from the stratified sample when approximate mode can answer it)
+            approximation = None
+            max_rows = self.fetch_rows(proposition)
+            cleaned_sql = self.clean_sql_query(sql_query)
+            chart_view, rollup = self.route_query(cleaned_sql)
+            if chart_view:
+                print(f"    🗂️  Answering from chart view {chart_view['chart_view']} ({chart_view['shape']})")
+                raw_query_result = self.execute_query(chart_view['sql'], max_rows)
+            elif rollup:
+                print(f"    📦 Answering from rollup {rollup['rollup_table']}")
+                raw_query_result = self.execute_query(rollup['sql'], max_rows)
+            elif self.approximate_engine:
+                approximate_result = self.approximate_engine.execute(cleaned_sql, max_rows)
+                if approximate_result:
+                    raw_query_result, approximation = approximate_result
+            if chart_view is None and rollup is None and approximation is None:
+                raw_query_result = self.execute_query(sql_query, max_rows)
+            
+            # Thin oversized line/area/scatter results to the chart's point target
+            downsampling = None
+            if self.downsample:
+                raw_query_result, downsampling = reduce_points(
+                    raw_query_result, chart_type, method=self.downsample, seed=self.synthesizer.seed,
+                    proposition_id=prop_id
+                )
+                if downsampling:
+                    print(f"    📉 Downsampled {downsampling['original_points']} -> "
+                          f"{downsampling['returned_points']} points ({downsampling['method']})")
             
             # Validate and enhance the data based on chart requirements
             validated_result = self.validate_and_enhance_data(raw_query_result, proposition)
@@ -870,30 +1027,45 @@ class SQLQueryExecutor:
             mean_value = self.compute_mean_value(sql_query, validated_result)
             has_mean = mean_value is not None
             
-            # Determine data source
+            # Determine data source (validation returns the SQL rows object itself when untouched)
             data_source = 'sql'
-            if validated_result != raw_query_result:
-                if not raw_query_result:
+            if validated_result is not raw_query_result:
+                if not raw_query_result or isinstance(raw_query_result, dict):
                     data_source = 'generated'
                 else:
                     data_source = 'enhanced'
+            elif approximation:
+                data_source = 'approximate'
             
             # Log results summary
-            print(f"    ✅ Final result: {len(validated_result)} rows ({data_source})")
+            if isinstance(validated_result, PendingFallback):
+                print(f"    ✅ Final result: pending batch fallback ({data_source})")
+            else:
+                print(f"    ✅ Final result: {len(validated_result)} rows ({data_source})")
             if has_mean:
                 print(f"    📊 Mean value: {mean_value}")
             if has_threshold:
                 print(f"    🎯 Threshold chart detected")
             
             # Return enhanced proposition
-            return {
+            result = {
                 **proposition,
                 'sql_result': validated_result,
                 'has_mean': has_mean,
                 'mean_value': mean_value,
                 'has_threshold': has_threshold,
-                'data_source': data_source
+                'data_source': data_source,
+                'dataset_version': self.dataset_version
             }
+            if data_source == 'approximate':
+                result['approximation'] = approximation
+            if chart_view:
+                result['chart_view'] = chart_view['chart_view']
+            if rollup:
+                result['rollup_table'] = rollup['rollup_table']
+            if downsampling:
+                result['downsampling'] = downsampling
+            return result
             
         except Exception as e:
             print(f"    ❌ Error processing {prop_id}: {e}")
@@ -911,7 +1083,8 @@ class SQLQueryExecutor:
                     'mean_value': None,
                     'has_threshold': False,
                     'error': str(e),
-                    'data_source': 'fallback'
+                    'data_source': 'fallback',
+                    'dataset_version': self.dataset_version
                 }
             except Exception as fallback_error:
                 print(f"    💥 Fallback generation failed: {fallback_error}")
@@ -922,15 +1095,137 @@ class SQLQueryExecutor:
                     'mean_value': None,
                     'has_threshold': False,
                     'error': f"SQL Error: {e}, Fallback Error: {fallback_error}",
-                    'data_source': 'failed'
+                    'data_source': 'failed',
+                    'dataset_version': self.dataset_version
                 }
     
-    def process_all_propositions(self, input_file, output_dir=None, specific_id=None):
-        """Process all propositions from the input file"""
+    def describe_table(self, table_name: str) -> str:
+        """Schema block of a loaded table for repair prompts: column names as loaded, types, two rows"""
+        info = self.conn.execute(f'PRAGMA table_info("{table_name}")').fetchall()
+        if not info:
+            return f"Table {table_name} is not loaded"
+        types = {row[1]: row[2] or 'TEXT' for row in info}
+        # Columns pruned at load time still exist for queries (they are appended on first use)
+        columns = self.column_pruner.header(table_name) if self.column_pruner and table_name in self.dataset_paths \
+            else list(types)
+        sample = self.conn.execute(f'SELECT * FROM "{table_name}" LIMIT 2').fetchall()
+        loaded = [row[1] for row in info]
+        column_list = ', '.join(f"{c} {types[c]}" if c in types else c for c in columns)
+        lines = [f"Table: {table_name}", f"Columns: {column_list}"]
+        for row in sample:
+            lines.append(' | '.join(f"{c}={str(v)[:40]}" for c, v in zip(loaded, row)))
+        return '\n'.join(lines)
+    
+    def _repair_check(self, sql_query: str) -> Optional[str]:
+        """None if a query runs and returns rows, else the error for the repair prompt"""
+        result = self.execute_sql_query(sql_query, max_rows=1)
+        if isinstance(result, dict):
+            # The prompt already has the SQL; internal tables (dictionaries, views) are not query targets
+            error = re.sub(r"^Execution failed on sql '.*?': ", '', result.get('error', 'unknown error'), flags=re.DOTALL)
+            message, _, tables = error.partition('. Available tables: ')
+            if tables:
+                message += f". Available tables: {', '.join(t for t in tables.split(', ') if '__' not in t)}"
+            return message
+        if not result:
+            return 'query returned no rows'
+        return None
+    
+    def repair_failing_queries(self, propositions: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Execute every query once and send the ones that fail (or return no rows) to the repair loop
+        
+        Repaired propositions get the working SQL as sql_query, the original as original_sql_query and
+        a sql_repair record; the rest are returned unchanged and fall back to generated data as before.
+        """
+        print(f"\n🩺 Checking {len(propositions)} proposition queries against the loaded data...")
+        failing = []
+        for proposition in propositions:
+            sql_query = proposition.get('sql_query', '')
+            if not sql_query:
+                continue
+            error = self._repair_check(sql_query)
+            if error:
+                failing.append({
+                    'proposition_id': proposition.get('proposition_id', ''),
+                    'dataset': self.detect_dataset_from_proposition(proposition) or '',
+                    'sql_query': sql_query,
+                    'error': error,
+                    'question': proposition.get('proposition_description', ''),
+                })
+        self.repair_stats = {'checked': len(propositions), 'failing': len(failing), 'repaired': 0}
+        if not failing:
+            print("✅ Every query runs and returns rows")
+            return propositions
+        
+        # The repair loop and its GPT-4o client live with the SQL validators
+        add_vanna_sql_path()
+        try:
+            from vanna_setup import VannaSQL
+            from sql_repair import SQLRepairLoop
+        except ImportError as e:
+            print(f"⚠️  SQL repair unavailable ({e}); {len(failing)} failing queries use fallback data")
+            return propositions
+        
+        repair_loop = SQLRepairLoop(VannaSQL(base_url=self.llm_base_url), self._repair_check,
+                                    schema=self.describe_table, max_attempts=self.repair_attempts)
+        outcomes = repair_loop.repair(failing)
+        repair_loop.print_summary()
+        
+        repaired = []
+        for proposition in propositions:
+            outcome = outcomes.get(proposition.get('proposition_id', ''))
+            if outcome is None:
+                repaired.append(proposition)
+            elif outcome['sql']:
+                repaired.append({**proposition, 'sql_query': outcome['sql'],
+                                 'original_sql_query': proposition['sql_query'],
+                                 'sql_repair': {'repaired': True, 'attempts': outcome['attempts']}})
+            else:
+                repaired.append({**proposition, 'sql_repair': {'repaired': False, 'attempts': outcome['attempts'],
+                                                               'error': outcome['error']}})
+        self.repair_stats['repaired'] = repair_loop.stats['repaired']
+        return repaired
+    
+    def _process_timed(self, index, total, proposition):
+        """process_proposition plus the CPU time its thread spent on it; errors become error results
+
+        The seconds are thread CPU time, not wall clock: time blocked on I/O or waiting for a lock
+        (including the GIL) is not counted, so the scheduler does not see those costs.
+        """
+        print(f"\n--- Processing {index+1}/{total} ---")
+        start = time.thread_time()
+        try:
+            result = self.process_proposition(proposition)
+        except Exception as e:
+            print(f"❌ Error processing proposition {proposition.get('proposition_id')}: {e}")
+            result = {
+                "proposition_id": proposition.get('proposition_id'),
+                "error": str(e),
+                "dataset_version": self.dataset_version
+            }
+        return result, time.thread_time() - start
+    
+    def process_all_propositions(self, input_file, output_dir=None, specific_id=None, batch_fallback=False,
+                                 expected_version=None, workers=1, timing_history=None):
+        """Process all propositions from the input file
+
+        Args:
+            batch_fallback (bool): Queue rule-based fallback data and generate it in one grouped pass at the end
+            expected_version (str): Refuse to run unless the loaded data has this dataset version
+                (lets split runs and cached results confirm they see the same data)
+            workers (int): Worker threads, each querying its own copy of the database; work is handed
+                out longest-first by predicted runtime
+            timing_history (str): JSON file of per-proposition timings used to predict runtimes and
+                updated after the run [default: proposition_timings.json in output_dir when workers > 1,
+                else none]
+        """
         
         if output_dir is None:
             output_dir = "."
         
+        if expected_version and expected_version != self.dataset_version:
+            print(f"❌ Dataset version mismatch: expected {expected_version}, loaded {self.dataset_version}")
+            return None
+        
         try:
             # Load input file
             print(f"📖 Loading propositions from: {input_file}")
@@ -948,29 +1243,106 @@ class SQLQueryExecutor:
                     return
                 print(f"🎯 Processing specific proposition: {specific_id}")
             
+            # Queries that fail against the data get bounded LLM repair before falling back to generated data
+            if self.repair_attempts:
+                propositions = self.repair_failing_queries(propositions)
+            
             # Process propositions
-            processed_results = []
+            processed_results = [None] * len(propositions)
+            durations = [0.0] * len(propositions)
+            # A single worker has no schedule to improve, so timings are only kept for parallel runs
+            # unless a history file is named
+            if not timing_history and workers > 1:
+                timing_history = os.path.join(output_dir, 'proposition_timings.json')
+            cost_model = QueryCostModel(self.conn, timing_history)
             
-            for i, proposition in enumerate(propositions):
-                print(f"\n--- Processing {i+1}/{len(propositions)} ---")
-                try:
-                    result = self.process_proposition(proposition)
-                    processed_results.append(result)
-                except Exception as e:
-                    print(f"❌ Error processing proposition {proposition.get('proposition_id')}: {e}")
-                    # Add error result
-                    processed_results.append({
-                        "proposition_id": proposition.get('proposition_id'),
-                        "error": str(e)
-                    })
+            if batch_fallback:
+                self.begin_fallback_batch()
+            
+            # Rollups this run's queries can use are built before the data is pinned and copied to workers
+            if self.rollups:
+                self.rollups.prepare([self.clean_sql_query(p['sql_query']) for p in propositions if p.get('sql_query')])
+            
+            # Writes during the run raise, except the pruner's restores of source columns
+            with write_guard(self.conn):
+                planned = [self.planned_query(p) for p in propositions]
+                # Packs are attached before fusion and before workers copy the database
+                for sql_query in planned:
+                    if sql_query:
+                        self.dataset_packs.attach_referenced(self.conn, sql_query)
+                # Likewise any pruned columns this run's queries need (propositions other than the pruning set)
+                if self.column_pruner:
+                    try:
+                        self.column_pruner.restore(self.conn, [q for q in planned if q])
+                    except RuntimeError as e:
+                        # Queries that need the columns report the error when they run
+                        print(f"⚠️  {e}")
+                if self.query_fusion:
+                    print(f"\n🔗 Fusing queries that share a template...")
+                    self.query_fusion.prefetch([q for q in planned if q],
+                                               [self.fetch_rows(p) for p, q in zip(propositions, planned) if q])
+                
+                # Prefetched queries cost no database time in the loop
+                costs = [
+                    cost_model.estimate(p.get('proposition_id', ''),
+                                        None if self.query_fusion and self.query_fusion.has(q, self.fetch_rows(p)) else q)
+                    for p, q in zip(propositions, planned)
+                ]
+                schedule = schedule_longest_first(costs, workers)
+                
+                run_start = time.perf_counter()
+                if workers > 1:
+                    print(f"\n⏱️  Scheduling longest-first on {workers} workers: predicted "
+                          f"{schedule['predicted_makespan_seconds']:.1f}s wall clock for "
+                          f"{schedule['predicted_total_seconds']:.1f}s of work")
+                    try:
+                        with ThreadPoolExecutor(max_workers=workers, initializer=self._init_worker_connection) as pool:
+                            futures = {
+                                i: pool.submit(self._process_timed, i, len(propositions), propositions[i])
+                                for i in schedule['order']
+                            }
+                            for i, future in futures.items():
+                                processed_results[i], durations[i] = future.result()
+                    finally:
+                        self._close_worker_connections()
+                else:
+                    for i, proposition in enumerate(propositions):
+                        processed_results[i], durations[i] = self._process_timed(i, len(propositions), proposition)
+                wall_clock = time.perf_counter() - run_start
+            
+            schedule_stats = {
+                "workers": workers,
+                "predicted_total_seconds": round(schedule['predicted_total_seconds'], 3),
+                "predicted_makespan_seconds": round(schedule['predicted_makespan_seconds'], 3),
+                "measured_total_seconds": round(sum(durations), 3),
+                "wall_clock_seconds": round(wall_clock, 3),
+            }
+            
+            fusion_stats = dict(self.query_fusion.stats) if self.query_fusion else None
+            if self.query_fusion:
+                self.query_fusion.clear()
+            
+            if batch_fallback:
+                self.flush_fallback_batch()
             
             # Save results
             output_data = {
                 "processing_metadata": {
                     "processed_at": datetime.now().isoformat(),
+                    "dataset_version": self.dataset_version,
+                    "table_fingerprints": self.table_fingerprints,
+                    "attached_packs": self.dataset_packs.attached,
+                    "column_pruning": self.column_pruner.stats if self.column_pruner else None,
                     "total_propositions": len(processed_results),
                     "successful_executions": len([r for r in processed_results if 'error' not in r]),
                     "failed_executions": len([r for r in processed_results if 'error' in r]),
+                    "execution_mode": "approximate" if self.approximate_engine else "exact",
+                    "rollup_propositions": [r['proposition_id'] for r in processed_results if r.get('rollup_table')],
+                    "chart_view_propositions": [r['proposition_id'] for r in processed_results if r.get('chart_view')],
+                    "downsampled_propositions": [r['proposition_id'] for r in processed_results if r.get('downsampling')],
+                    "query_fusion": fusion_stats,
+                    "sql_repair": self.repair_stats,
+                    "schedule": schedule_stats,
                     "source_file": input_file
                 },
                 "propositions_with_data": processed_results
@@ -988,6 +1360,15 @@ class SQLQueryExecutor:
             
             print(f"\n💾 Results saved to: {output_file}")
             
+            # The timing history only guides the next run's schedule; failing to write it loses no results
+            if timing_history:
+                try:
+                    for proposition, sql_query, seconds in zip(propositions, planned, durations):
+                        cost_model.record(proposition.get('proposition_id', ''), sql_query, seconds)
+                    cost_model.save()
+                except Exception as e:
+                    print(f"⚠️  Could not save query timing history: {e}")
+            
             # Summary
             successful = output_data["processing_metadata"]["successful_executions"]
             failed = output_data["processing_metadata"]["failed_executions"]
@@ -996,6 +1377,17 @@ class SQLQueryExecutor:
             print(f"Total Propositions: {len(processed_results)}")
             print(f"Successful: {successful}")
             print(f"Failed: {failed}")
+            print(f"Answered from rollups: {len(output_data['processing_metadata']['rollup_propositions'])}")
+            print(f"Answered from chart views: {len(output_data['processing_metadata']['chart_view_propositions'])}")
+            print(f"Wall clock: {wall_clock:.1f}s for {sum(durations):.1f}s of work on {workers} worker(s)")
+            if self.repair_stats:
+                print(f"Repaired failing queries: {self.repair_stats['repaired']} of {self.repair_stats['failing']}")
+            if self.use_direct_openai:
+                from token_usage import shared_usage_log
+                shared_usage_log().print_summary()
+            if fusion_stats:
+                print(f"Answered from fused queries: {fusion_stats['prefetched']} "
+                      f"({fusion_stats['database_queries']} database queries)")
             
             if failed > 0:
                 failed_ids = [r['proposition_id'] for r in processed_results if 'error' in r]
@@ -1020,6 +1412,50 @@ def main():
                        help='Specific proposition ID to process')
     parser.add_argument('--max-rows', type=int, default=100,
                        help='Maximum rows to return per query')
+    parser.add_argument('--seed', type=int, default=42,
+                       help='Seed for locally synthesized fallback data')
+    parser.add_argument('--llm-fallback', action='store_true',
+                       help='Also try GPT-4o fallback data when local synthesis fails')
+    parser.add_argument('--llm-base-url',
+                       help='OpenAI-compatible endpoint for --llm-fallback, e.g. the local stand-in '
+                            '(vanna_sql/openai_standin.py) [default: LLM_BASE_URL]')
+    parser.add_argument('--llm-context-tokens', type=int, default=None,
+                       help='Dataset-context token budget of an --llm-fallback prompt [default: LLM_CONTEXT_TOKENS, else 300]')
+    parser.add_argument('--approximate', action='store_true',
+                       help='Answer eligible aggregate queries from stratified samples with confidence intervals')
+    parser.add_argument('--sample-fraction', type=float, default=0.01,
+                       help='Fraction of each stratum sampled in approximate mode')
+    parser.add_argument('--no-rollups', action='store_true',
+                       help='Do not build rollup tables; scan base tables for every query')
+    parser.add_argument('--chart-views', action='store_true',
+                       help='Materialize chart-shape views at startup and serve matching queries from them')
+    parser.add_argument('--geo-dimensions', action='store_true',
+                       help='Build borough/MSOA/LSOA dimension tables and {table}__geo views with integer keys')
+    parser.add_argument('--chunk-size', type=int, default=None,
+                       help='Load CSVs in chunks of this many rows to bound memory on large sources')
+    parser.add_argument('--dictionary-encoding', action='store_true',
+                       help='Store low-cardinality text columns as integer codes with lookup tables (adds startup time)')
+    parser.add_argument('--no-query-fusion', action='store_true',
+                       help='Run every proposition query on its own instead of fusing shared templates')
+    parser.add_argument('--downsample', choices=['lttb', 'minmax', 'none'], default='lttb',
+                       help='Thin line/area results with LTTB or per-bucket min/max (scatter: stratified sample) '
+                            'instead of truncating; none keeps the plain row limit')
+    parser.add_argument('--pack-manifest',
+                       help='JSON manifest of extra dataset packs queried as <pack>.<table> [default: dataset_packs.json]')
+    parser.add_argument('--prune-columns', action='store_true',
+                       help='Load only the columns the input propositions reference (others load on first use)')
+    parser.add_argument('--workers', type=int, default=1,
+                       help='Process propositions on this many threads, longest predicted runtime first')
+    parser.add_argument('--timing-history',
+                       help='JSON file of recorded proposition timings [default: proposition_timings.json in the output directory '
+                            'when --workers > 1]')
+    parser.add_argument('--dataset-version',
+                       help='Only run if the loaded data has this dataset version id')
+    parser.add_argument('--repair-attempts', type=int, default=0,
+                       help='Before processing, send queries that fail or return no rows to GPT-4o with their SQLite '
+                            'error and re-execute the fix, up to this many rounds [default: 0, off]')
+    parser.add_argument('--batch-fallback', action='store_true',
+                       help='Generate rule-based fallback data for all failing propositions in one batched pass')
     
     args = parser.parse_args()
     
@@ -1027,13 +1463,34 @@ def main():
     print("=" * 60)
     
     # Initialize executor
-    executor = SQLQueryExecutor()
+    executor = SQLQueryExecutor(
+        synthesizer_seed=args.seed,
+        use_llm_fallback=args.llm_fallback,
+        approximate=args.approximate,
+        sample_fraction=args.sample_fraction,
+        use_rollups=not args.no_rollups,
+        use_chart_views=args.chart_views,
+        ingest_chunk_size=args.chunk_size,
+        dictionary_encode=args.dictionary_encoding,
+        fuse_queries=not args.no_query_fusion,
+        downsample=None if args.downsample == 'none' else args.downsample,
+        pack_manifest=args.pack_manifest,
+        prune_columns_for=args.input if args.prune_columns else None,
+        llm_base_url=args.llm_base_url,
+        repair_attempts=args.repair_attempts,
+        geo_dimensions=args.geo_dimensions,
+        llm_context_tokens=args.llm_context_tokens
+    )
     
     # Process propositions
     result_file = executor.process_all_propositions(
         input_file=args.input,
         output_dir=args.output,
-        specific_id=args.id
+        specific_id=args.id,
+        batch_fallback=args.batch_fallback,
+        expected_version=args.dataset_version,
+        workers=args.workers,
+        timing_history=args.timing_history
     )
     
     if result_file:
@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+"""
+Geographic Dimensions
+Builds canonical borough, MSOA and LSOA dimension tables with integer surrogate keys. Each loaded
+table gets a {table}__keys side table holding every row's keys once, by source rowid, with an index
+per key column, and a {table}__geo view that adds them to its rows with one rowid join. Cross-dataset
+propositions can then use integer equi-joins (e.g. FROM crime_data__geo JOIN dim_borough USING
+(borough_key)) instead of matching borough strings. The loaded tables themselves are not changed.
+"""
+
+import os
+import re
+import sqlite3
+import pandas as pd
+from typing import List, Dict, Any, Optional, Tuple
+
+from dictionary_encoding import row_source
+
+# Identifier columns per loaded table (after load_datasets' column cleaning), as (code column, name column)
+GEO_IDENTIFIERS = {
+    'crime_data': {'borough': (None, 'borough_name'), 'msoa': (None, 'area_name')},
+    'ethnicity_data': {'borough': ('local_authority_code', 'local_authority_name'), 'lsoa': ('LSOA_code', None)},
+    'birth_country_data': {'borough': ('Area_Code', 'Area_Name')},
+    'country_of_births': {'borough': ('Area_Code', 'Area_Name')},
+    'population_data': {'borough': (None, 'area')},
+    'income_data': {'borough': ('Unnamed:_0', 'Unnamed:_1')},
+    'house_price_data': {'borough': ('Code', 'Area')},
+    'house_prices': {'borough': ('Code', 'Area')},
+    'education_data': {'borough': (None, 'LANAME')},
+    'vehicle_data': {'borough': ('ONS_CHD_LA_Code', 'Local_Authority')},
+    'restaurant_data': {'borough': ('Area_code', 'Area_name')},
+    'rent_data': {'borough': ('Code', 'Area')},
+    'gym_data': {'borough': (None, 'borough_name'), 'msoa': (None, 'area_name')},
+    'library_data': {'borough': ('area', 'area_label')},
+}
+
+# Columns of the ONS LSOA lookup (land-area-population-density-lsoa11.csv) per level
+LOOKUP_COLUMNS = {
+    'borough': ('LAD11CD', 'LAD11NM'),
+    'msoa': ('MSOA11CD', 'MSOA11NM'),
+    'lsoa': ('LSOA11 Code', 'LSOA name'),
+}
+
+ONS_CODE = re.compile(r'^[EWSNK]\d{8}$')
+NAME_ALIASES = {'cityofwestminster': 'westminster', 'londonboroughofbarkinganddagenham': 'barkinganddagenham'}
+
+
+def normalize_name(name: Any) -> str:
+    """Comparable form of an area name: 'Kensington & Chelsea (London borough)' -> 'kensingtonandchelsea'"""
+    text = re.sub(r'\((?:london )?borough\)', '', str(name).lower()).replace('&', 'and')
+    key = re.sub(r'[^a-z0-9]', '', text)
+    return NAME_ALIASES.get(key, key)
+
+
+class GeoDimensionBuilder:
+    """Creates dim_borough / dim_msoa / dim_lsoa plus a {table}__keys table and {table}__geo view per loaded table"""
+
+    def __init__(self, conn: sqlite3.Connection, lookup_path: Optional[str] = None,
+                 identifiers: Optional[Dict[str, Dict[str, Tuple[Optional[str], Optional[str]]]]] = None):
+        self.conn = conn
+        self.lookup_path = lookup_path
+        self.identifiers = identifiers if identifiers is not None else GEO_IDENTIFIERS
+        # level -> {'codes': {code: key}, 'names': {normalized name: key}}
+        self.indexes: Dict[str, Dict[str, Dict[str, int]]] = {}
+        self.coverage: Dict[str, Dict[str, float]] = {}
+
+    def build(self):
+        """Build the dimension tables, then key and view every configured table that is loaded"""
+        lookup = self._load_lookup()
+        self._build_borough_dimension(lookup)
+        if lookup is not None:
+            self._build_area_dimensions(lookup)
+
+        for table_name, levels in self.identifiers.items():
+            columns = set(self._table_columns(table_name))
+            if not columns:
+                continue
+            mapped = {}
+            for level, (code_col, name_col) in levels.items():
+                if level not in self.indexes:
+                    continue
+                id_cols = [c for c in (code_col, name_col) if c and c in columns]
+                if id_cols:
+                    mapped[level] = id_cols
+            if mapped:
+                self._store_keys(table_name, mapped)
+                self._create_geo_view(table_name, list(mapped))
+        self.conn.commit()
+
+        summary = ', '.join(f"{t} {c.get('borough', 0):.0%}" for t, c in self.coverage.items())
+        print(f"    🗺️  Keyed tables by borough: {summary}")
+
+    def _table_columns(self, table_name: str) -> List[str]:
+        """Column names of a loaded table, empty if it does not exist"""
+        return [row[1] for row in self.conn.execute(f'PRAGMA table_info("{table_name}")').fetchall()]
+
+    def _load_lookup(self) -> Optional[pd.DataFrame]:
+        """ONS LSOA -> MSOA -> borough lookup, if available"""
+        if not self.lookup_path or not os.path.exists(self.lookup_path):
+            print(f"    ⚠️  LSOA lookup not found, building borough dimension from loaded tables only")
+            return None
+        return pd.read_csv(self.lookup_path, encoding='utf-8-sig', dtype=str)
+
+    def _build_borough_dimension(self, lookup: Optional[pd.DataFrame]):
+        """One row per borough code (plus name-only areas), keys assigned in code order"""
+        coded: Dict[str, str] = {}
+        named_codes: Dict[str, str] = {}
+        alias_codes: Dict[str, str] = {}
+        name_only: Dict[str, str] = {}
+
+        def register(code: Any, name: Any):
+            code = str(code).strip() if pd.notna(code) else ''
+            name = str(name).strip() if pd.notna(name) else ''
+            if not ONS_CODE.match(code) or code in coded or code in alias_codes:
+                return
+            # Some files re-code the same area per period (e.g. Wales in house prices): keep the first code
+            name_key = normalize_name(name) if name else None
+            if name_key in named_codes:
+                alias_codes[code] = named_codes[name_key]
+                return
+            coded[code] = name or code
+            if name_key:
+                named_codes[name_key] = code
+
+        if lookup is not None:
+            code_col, name_col = LOOKUP_COLUMNS['borough']
+            for code, name in lookup[[code_col, name_col]].drop_duplicates().itertuples(index=False):
+                register(code, name)
+
+        pairs = self._distinct_identifiers('borough')
+        for (code, name), has_code in pairs:
+            register(code, name)
+        # Name-only areas (e.g. free-text borough_name) are added once no code source knows them
+        for (code, name), has_code in pairs:
+            name = str(name).strip() if pd.notna(name) else ''
+            key = normalize_name(name)
+            if not has_code and name and not re.match(r'^[\d,.\s]*$', name) and key not in named_codes:
+                name_only.setdefault(key, name)
+
+        rows = [(code, coded[code], normalize_name(coded[code])) for code in sorted(coded)]
+        rows += [(None, name_only[key], key) for key in sorted(name_only)]
+        dim = pd.DataFrame(rows, columns=['borough_code', 'borough_name', 'name_key'])
+        dim.insert(0, 'borough_key', range(1, len(dim) + 1))
+        self._write_dimension('dim_borough', dim, 'borough_key')
+
+        index = {'codes': {}, 'names': {}}
+        for key, code, name, name_key in dim.itertuples(index=False):
+            if code:
+                index['codes'][code] = key
+            index['names'].setdefault(name_key, key)
+        for alias, code in alias_codes.items():
+            index['codes'][alias] = index['codes'][code]
+        self.indexes['borough'] = index
+        print(f"    🗺️  dim_borough: {len(coded)} coded areas, {len(name_only)} name-only areas")
+
+    def _build_area_dimensions(self, lookup: pd.DataFrame):
+        """dim_msoa and dim_lsoa from the ONS lookup, each pointing at its parent keys"""
+        borough_codes = self.indexes['borough']['codes']
+        lad_col = LOOKUP_COLUMNS['borough'][0]
+
+        msoa_code, msoa_name = LOOKUP_COLUMNS['msoa']
+        msoa = lookup[[msoa_code, msoa_name, lad_col]].drop_duplicates(msoa_code).sort_values(msoa_code)
+        dim_msoa = pd.DataFrame({
+            'msoa_key': range(1, len(msoa) + 1),
+            'msoa_code': msoa[msoa_code].values,
+            'msoa_name': msoa[msoa_name].values,
+            'borough_key': msoa[lad_col].map(borough_codes).values,
+        })
+        self._write_dimension('dim_msoa', dim_msoa, 'msoa_key')
+        msoa_keys = dict(zip(dim_msoa['msoa_code'], dim_msoa['msoa_key']))
+
+        lsoa_code, lsoa_name = LOOKUP_COLUMNS['lsoa']
+        lsoa = lookup[[lsoa_code, lsoa_name, msoa_code, lad_col]].drop_duplicates(lsoa_code).sort_values(lsoa_code)
+        dim_lsoa = pd.DataFrame({
+            'lsoa_key': range(1, len(lsoa) + 1),
+            'lsoa_code': lsoa[lsoa_code].values,
+            'lsoa_name': lsoa[lsoa_name].values,
+            'msoa_key': lsoa[msoa_code].map(msoa_keys).values,
+            'borough_key': lsoa[lad_col].map(borough_codes).values,
+        })
+        self._write_dimension('dim_lsoa', dim_lsoa, 'lsoa_key')
+
+        for level, dim in (('msoa', dim_msoa), ('lsoa', dim_lsoa)):
+            self.indexes[level] = {
+                'codes': dict(zip(dim[f'{level}_code'], dim[f'{level}_key'])),
+                'names': {normalize_name(n): k for n, k in zip(dim[f'{level}_name'], dim[f'{level}_key'])},
+            }
+        print(f"    🗺️  dim_msoa: {len(dim_msoa)} rows, dim_lsoa: {len(dim_lsoa)} rows")
+
+    def _write_dimension(self, table_name: str, dim: pd.DataFrame, key_column: str):
+        """Store a dimension with its surrogate key as INTEGER PRIMARY KEY"""
+        self.conn.execute(f'DROP TABLE IF EXISTS "{table_name}"')
+        dim.to_sql(table_name, self.conn, index=False, dtype={key_column: 'INTEGER PRIMARY KEY'})
+
+    def _distinct_identifiers(self, level: str) -> List[Tuple[Tuple[Any, Any], bool]]:
+        """Distinct (code, name) pairs for a level across loaded tables, with whether a code column exists"""
+        pairs = []
+        for table_name, levels in self.identifiers.items():
+            if level not in levels:
+                continue
+            columns = set(self._table_columns(table_name))
+            code_col, name_col = levels[level]
+            code_sql = f'"{code_col}"' if code_col in columns else 'NULL'
+            name_sql = f'"{name_col}"' if name_col in columns else 'NULL'
+            if code_sql == 'NULL' and name_sql == 'NULL':
+                continue
+            for code, name in self.conn.execute(f'SELECT DISTINCT {code_sql}, {name_sql} FROM "{table_name}"'):
+                pairs.append(((code, name), code_sql != 'NULL'))
+        return pairs
+
+    def resolve(self, level: str, code: Any = None, name: Any = None) -> Optional[int]:
+        """Surrogate key for an identifier pair, preferring the code over the name"""
+        index = self.indexes.get(level)
+        if index is None:
+            return None
+        if code is not None and pd.notna(code) and str(code).strip() in index['codes']:
+            return index['codes'][str(code).strip()]
+        if name is not None and pd.notna(name):
+            return index['names'].get(normalize_name(name))
+        return None
+
+    def _store_keys(self, table_name: str, mapped: Dict[str, List[str]]):
+        """Store {table}__keys: each row's {level}_key per mapped level, keyed by the source rowid
+
+        Identifiers are resolved once per distinct tuple; rows then get their keys through
+        temporary mappings, so the string matching happens at build time only.
+        """
+        keys_table = f'{table_name}__keys'
+        source = row_source(self.conn, table_name)
+        key_items, joins, map_tables = [], [], []
+        for i, (level, id_cols) in enumerate(mapped.items()):
+            key_column = f'{level}_key'
+            map_table = f'_{table_name}__{level}_map'
+            id_sql = ', '.join(f'"{c}"' for c in id_cols)
+            distinct = pd.read_sql_query(
+                f'SELECT {id_sql}, COUNT(*) AS _rows FROM "{table_name}" GROUP BY {id_sql}', self.conn
+            )
+            has_code = self.identifiers[table_name][level][0] in id_cols
+            code_values = distinct[id_cols[0]] if has_code else [None] * len(distinct)
+            name_values = distinct[id_cols[-1]] if not has_code or len(id_cols) > 1 else [None] * len(distinct)
+            distinct[key_column] = [self.resolve(level, c, n) for c, n in zip(code_values, name_values)]
+
+            self.conn.execute(f'DROP TABLE IF EXISTS "{map_table}"')
+            distinct[id_cols + [key_column]].to_sql(map_table, self.conn, index=False, dtype={key_column: 'INTEGER'})
+            self.conn.execute(f'CREATE INDEX "idx_{map_table}" ON "{map_table}" ({id_sql})')
+            map_tables.append(map_table)
+            key_items.append(f'm{i}."{key_column}"')
+            id_match = ' AND '.join(f'm{i}."{c}" IS t."{c}"' for c in id_cols)
+            joins.append(f'LEFT JOIN "{map_table}" m{i} ON {id_match}')
+
+            total = int(distinct['_rows'].sum())
+            matched = int(distinct.loc[distinct[key_column].notna(), '_rows'].sum())
+            self.coverage.setdefault(table_name, {})[level] = matched / total if total else 0.0
+
+        key_columns = [f'{level}_key' for level in mapped]
+        self.conn.execute(f'DROP TABLE IF EXISTS "{keys_table}"')
+        self.conn.execute(
+            f'CREATE TABLE "{keys_table}" (_rowid INTEGER PRIMARY KEY, '
+            f'{", ".join(f"{c} INTEGER" for c in key_columns)})'
+        )
+        self.conn.execute(
+            f'INSERT INTO "{keys_table}" SELECT t._rowid, {", ".join(key_items)} FROM {source} t {" ".join(joins)}'
+        )
+        for map_table in map_tables:
+            self.conn.execute(f'DROP TABLE "{map_table}"')
+        for key_column in key_columns:
+            self.conn.execute(f'CREATE INDEX "idx_{keys_table}_{key_column}" ON "{keys_table}" ({key_column})')
+
+    def _create_geo_view(self, table_name: str, levels: List[str]):
+        """{table}__geo: the table's rows plus one *_key column per mapped level, joined on the rowid
+
+        The join is a primary-key lookup, and a LEFT JOIN on a unique key that a query reads no
+        column from is dropped by SQLite, so the view costs nothing for queries that do not use keys.
+        """
+        columns = ', '.join(f't."{c}"' for c in self._table_columns(table_name))
+        keys = ', '.join(f'k."{level}_key"' for level in levels)
+        self.conn.execute(f'DROP VIEW IF EXISTS "{table_name}__geo"')
+        self.conn.execute(
+            f'CREATE VIEW "{table_name}__geo" AS SELECT {columns}, {keys} '
+            f'FROM {row_source(self.conn, table_name)} t LEFT JOIN "{table_name}__keys" k ON k._rowid = t._rowid'
+        )
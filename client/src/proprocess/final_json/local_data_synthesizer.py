@@ -0,0 +1,331 @@
+#!/usr/bin/env python3
+"""
+Local Statistical Data Synthesizer
+Fits simple per-column distributions from the tables loaded into the executor's
+SQLite database and samples fallback records offline (no LLM / network calls).
+"""
+
+import re
+import zlib
+import sqlite3
+import threading
+import numpy as np
+import pandas as pd
+from typing import List, Dict, Any, Optional
+
+from dictionary_encoding import row_source
+
+# Aliases the Layer2 prompts use for each output role
+TIME_ALIASES = {'time', 'date', 'year', 'month', 'period'}
+CATEGORY_ALIASES = {'category', 'series', 'dimension', 'group', 'label', 'x_bin', 'y_bin', 'borough', 'area'}
+AGGREGATE_PATTERN = re.compile(r'\b(COUNT|SUM|AVG|MIN|MAX)\s*\(', re.IGNORECASE)
+TEMPORAL_NAME_HINTS = ('date', 'year', 'month', 'time', 'period')
+
+
+class LocalDataSynthesizer:
+    """Samples realistic fallback records from distributions fitted on the loaded tables"""
+
+    def __init__(self, conn: sqlite3.Connection, seed: int = 42, profile_sample_rows: int = 20000,
+                 max_categories: int = 500):
+        self.conn = conn
+        self.seed = seed
+        self.profile_sample_rows = profile_sample_rows
+        self.max_categories = max_categories
+        self.profiles: Dict[str, Dict[str, Any]] = {}
+        # Parallel executor runs would otherwise fit the same large table once per worker
+        self._fit_locks: Dict[str, threading.Lock] = {}
+        self._fit_locks_guard = threading.Lock()
+
+    def fit_table(self, table_name: str) -> Optional[Dict[str, Any]]:
+        """Fit (and cache) per-column distributions for a table"""
+        if table_name in self.profiles:
+            return self.profiles[table_name]
+        with self._fit_locks_guard:
+            table_lock = self._fit_locks.setdefault(table_name, threading.Lock())
+        with table_lock:
+            if table_name in self.profiles:
+                return self.profiles[table_name]
+            return self._fit_table(table_name)
+
+    def _fit_table(self, table_name: str) -> Optional[Dict[str, Any]]:
+        """Sample a table and fit its column distributions into the profile cache"""
+        try:
+            row_count = self.conn.execute(f'SELECT COUNT(*) FROM "{table_name}"').fetchone()[0]
+        except sqlite3.Error:
+            return None
+
+        if row_count == 0:
+            return None
+
+        # Stride sample over rowid so sorted CSVs (e.g. by borough) stay representative
+        stride = max(1, row_count // self.profile_sample_rows)
+        sample_df = pd.read_sql_query(
+            f'SELECT * FROM {row_source(self.conn, table_name)} WHERE _rowid % {stride} = 0', self.conn
+        )
+        sample_df = sample_df.drop(columns='_rowid')
+
+        columns = {}
+        for col in sample_df.columns:
+            series = sample_df[col].dropna()
+            if series.empty:
+                continue
+            columns[col] = self._fit_column(table_name, col, series, row_count)
+
+        profile = {
+            'row_count': row_count,
+            'columns': columns,
+            'temporal': [c for c, p in columns.items() if p['kind'] == 'temporal'],
+            'categorical': [c for c, p in columns.items() if p['kind'] == 'categorical'],
+            'numeric': [c for c, p in columns.items() if p['kind'] == 'numeric'],
+        }
+        self.profiles[table_name] = profile
+        return profile
+
+    def _fit_column(self, table_name: str, col: str, series: pd.Series, row_count: int) -> Dict[str, Any]:
+        """Fit a single column as temporal, categorical or numeric"""
+        is_numeric = pd.api.types.is_numeric_dtype(series)
+        if not is_numeric:
+            # Many London CSVs store numbers as text with thousands separators
+            coerced = pd.to_numeric(series.astype(str).str.replace(',', '', regex=False), errors='coerce')
+            if coerced.notna().mean() >= 0.9:
+                series, is_numeric = coerced.dropna(), True
+        looks_temporal = any(hint in col.lower() for hint in TEMPORAL_NAME_HINTS)
+
+        if looks_temporal and series.nunique() <= self.max_categories:
+            # Temporal trend: row counts per period with a linear fit
+            counts = self._exact_counts(table_name, col)
+            periods = sorted(counts.keys(), key=lambda v: str(v))
+            period_counts = np.array([counts[p] for p in periods], dtype=float)
+            if len(periods) > 1:
+                slope, intercept = np.polyfit(np.arange(len(periods)), period_counts, 1)
+            else:
+                slope, intercept = 0.0, float(period_counts[0])
+            return {
+                'kind': 'temporal',
+                'periods': periods,
+                'counts': period_counts,
+                'trend': (float(slope), float(intercept)),
+            }
+
+        if not is_numeric:
+            if series.nunique() > self.max_categories:
+                values = series.value_counts().head(self.max_categories)
+                frequencies = dict(zip(values.index, (values.values * row_count / len(series))))
+            else:
+                frequencies = self._exact_counts(table_name, col)
+            values = list(frequencies.keys())
+            weights = np.array(list(frequencies.values()), dtype=float)
+            return {
+                'kind': 'categorical',
+                'values': values,
+                'counts': weights,
+                'probabilities': weights / weights.sum(),
+            }
+
+        return {
+            'kind': 'numeric',
+            'quantiles': np.quantile(series.astype(float), np.linspace(0, 1, 21)),
+            'is_integer': bool((series.astype(float) % 1 == 0).all()),
+        }
+
+    def _exact_counts(self, table_name: str, col: str) -> Dict[Any, float]:
+        """Exact value frequencies for a low-cardinality column"""
+        rows = self.conn.execute(
+            f'SELECT "{col}", COUNT(*) FROM "{table_name}" WHERE "{col}" IS NOT NULL GROUP BY "{col}"'
+        ).fetchall()
+        return {value: float(count) for value, count in rows}
+
+    def synthesize(self, table_name: Optional[str], sql_query: str, columns: List[str], min_records: int,
+                   is_time_series: bool = False, proposition_id: str = '') -> Optional[List[Dict[str, Any]]]:
+        """Sample records shaped like the SQL's output columns"""
+        if not table_name:
+            table_name = self._extract_from_table(sql_query)
+        profile = self.fit_table(table_name) if table_name else None
+        if not profile:
+            return None
+
+        # Seed per proposition so re-runs reproduce the same fallback data
+        rng = np.random.default_rng([self.seed, zlib.crc32(proposition_id.encode('utf-8'))])
+        expressions = self._extract_select_expressions(sql_query)
+        group_by_cols = self._extract_group_by_columns(sql_query, profile)
+
+        # Resolve each output column to a role and a source column
+        plan = []
+        for alias in columns:
+            expr = expressions.get(alias.lower(), alias)
+            plan.append((alias, expr, self._resolve_source_column(alias, expr, profile)))
+
+        # The leading key (time or category) decides how many distinct rows we can produce
+        key_alias, key_source = None, None
+        for alias, expr, source in plan:
+            if AGGREGATE_PATTERN.search(expr):
+                continue
+            if source and profile['columns'][source]['kind'] in ('temporal', 'categorical'):
+                key_alias, key_source = alias, source
+                break
+
+        n_records = min_records
+        key_values = None
+        if key_source:
+            key_profile = profile['columns'][key_source]
+            if key_profile['kind'] == 'temporal':
+                periods = key_profile['periods']
+                n_records = max(min_records, min(len(periods), 12)) if is_time_series else min_records
+                start = 0 if len(periods) <= n_records else int(rng.integers(0, len(periods) - n_records + 1))
+                indices = [(start + i) % len(periods) for i in range(n_records)]
+                key_values = [periods[i] for i in indices]
+            else:
+                values = key_profile['values']
+                n_unique = min(len(values), n_records)
+                indices = rng.choice(len(values), size=n_unique, replace=False, p=key_profile['probabilities'])
+                key_values = [values[i] for i in indices]
+                # Repeat categories when fewer distinct values exist than records needed
+                while len(key_values) < n_records:
+                    key_values.append(values[int(rng.choice(len(values), p=key_profile['probabilities']))])
+
+        records = [{} for _ in range(n_records)]
+        for alias, expr, source in plan:
+            if alias == key_alias:
+                column_values = key_values
+            else:
+                column_values = self._sample_column(alias, expr, source, profile, n_records, rng,
+                                                    key_source, key_values, group_by_cols)
+            for record, value in zip(records, column_values):
+                record[alias] = value
+
+        return records
+
+    def _sample_column(self, alias: str, expr: str, source: Optional[str], profile: Dict[str, Any],
+                       n: int, rng: np.random.Generator, key_source: Optional[str], key_values: Optional[list],
+                       group_by_cols: List[str]) -> list:
+        """Sample n values for a single output column"""
+        aggregate = AGGREGATE_PATTERN.search(expr)
+        agg_name = aggregate.group(1).upper() if aggregate else None
+        col_profile = profile['columns'].get(source) if source else None
+
+        # COUNT(*) per group is exactly the frequency of the group key
+        if agg_name == 'COUNT':
+            return self._sample_counts(profile, n, rng, key_source, key_values, group_by_cols)
+
+        # Aggregates over text columns still need a numeric measure
+        if agg_name and col_profile and col_profile['kind'] != 'numeric':
+            col_profile = None
+            if profile['numeric']:
+                source = profile['numeric'][0]
+
+        if col_profile is None:
+            if agg_name and profile['numeric']:
+                col_profile = profile['columns'][profile['numeric'][0]]
+            elif alias.lower() in TIME_ALIASES and profile['temporal']:
+                col_profile = profile['columns'][profile['temporal'][0]]
+            elif alias.lower() in CATEGORY_ALIASES and profile['categorical']:
+                col_profile = profile['columns'][profile['categorical'][0]]
+            elif profile['numeric']:
+                col_profile = profile['columns'][profile['numeric'][0]]
+            else:
+                return self._sample_counts(profile, n, rng, key_source, key_values, group_by_cols)
+
+        if col_profile['kind'] == 'categorical':
+            indices = rng.choice(len(col_profile['values']), size=n, p=col_profile['probabilities'])
+            return [col_profile['values'][i] for i in indices]
+
+        if col_profile['kind'] == 'temporal':
+            periods = col_profile['periods']
+            return [periods[i % len(periods)] for i in range(n)]
+
+        # Numeric: inverse-CDF sampling through the fitted quantiles
+        values = np.interp(rng.random(n), np.linspace(0, 1, 21), col_profile['quantiles'])
+        if agg_name == 'SUM':
+            values = values * self._mean_group_size(profile, key_source, group_by_cols)
+
+        # Follow the fitted temporal trend when rows are keyed by period
+        key_profile = profile['columns'].get(key_source) if key_source else None
+        if key_profile and key_profile['kind'] == 'temporal' and key_values is not None:
+            slope, intercept = key_profile['trend']
+            mean_count = key_profile['counts'].mean()
+            positions = {period: i for i, period in enumerate(key_profile['periods'])}
+            if mean_count > 0:
+                factors = [max(0.0, slope * positions.get(v, 0) + intercept) / mean_count for v in key_values]
+                values = np.sort(values) if slope >= 0 else np.sort(values)[::-1]
+                values = values * np.array(factors)
+        if col_profile['is_integer'] or agg_name == 'SUM':
+            return [int(round(v)) for v in values]
+        return [round(float(v), 2) for v in values]
+
+    def _sample_counts(self, profile: Dict[str, Any], n: int, rng: np.random.Generator,
+                       key_source: Optional[str], key_values: Optional[list], group_by_cols: List[str]) -> list:
+        """Group counts consistent with the fitted key frequencies"""
+        if key_source and key_values is not None:
+            key_profile = profile['columns'][key_source]
+            lookup_values = key_profile['periods'] if key_profile['kind'] == 'temporal' else key_profile['values']
+            lookup = dict(zip(lookup_values, key_profile['counts']))
+            # Further GROUP BY columns split the key's rows evenly on average
+            divisor = 1.0
+            for col in group_by_cols:
+                if col != key_source and col in profile['columns']:
+                    other = profile['columns'][col]
+                    divisor *= len(other.get('values', other.get('periods', [1])))
+            noise = rng.normal(1.0, 0.05, size=n)
+            return [max(0, int(round(lookup.get(v, 0) / divisor * f))) for v, f in zip(key_values, noise)]
+
+        mean_size = profile['row_count'] / max(1, n)
+        return [max(0, int(v)) for v in rng.poisson(mean_size, size=n)]
+
+    def _mean_group_size(self, profile: Dict[str, Any], key_source: Optional[str], group_by_cols: List[str]) -> float:
+        """Average number of base rows behind each output row"""
+        groups = 1
+        for col in set(group_by_cols + ([key_source] if key_source else [])):
+            col_profile = profile['columns'].get(col)
+            if col_profile and col_profile['kind'] in ('categorical', 'temporal'):
+                groups *= len(col_profile.get('values', col_profile.get('periods', [])))
+        return profile['row_count'] / max(1, groups)
+
+    def _resolve_source_column(self, alias: str, expr: str, profile: Dict[str, Any]) -> Optional[str]:
+        """Find the base table column an output expression reads from"""
+        by_lower = {c.lower(): c for c in profile['columns']}
+        for token in re.findall(r'[A-Za-z_][A-Za-z0-9_]*', expr):
+            if token.lower() in by_lower:
+                return by_lower[token.lower()]
+        return by_lower.get(alias.lower())
+
+    def _extract_select_expressions(self, sql_query: str) -> Dict[str, str]:
+        """Map lower-cased output alias -> SELECT expression"""
+        select_match = re.search(r'SELECT\s+(.+?)\s+FROM\s', sql_query, re.IGNORECASE | re.DOTALL)
+        if not select_match:
+            return {}
+
+        # Split on top-level commas only
+        parts, depth, current = [], 0, ''
+        for char in select_match.group(1):
+            if char == '(':
+                depth += 1
+            elif char == ')':
+                depth -= 1
+            if char == ',' and depth == 0:
+                parts.append(current)
+                current = ''
+            else:
+                current += char
+        parts.append(current)
+
+        expressions = {}
+        for part in parts:
+            as_match = re.match(r'(.+)\s+AS\s+"?(\w+)"?\s*$', part.strip(), re.IGNORECASE | re.DOTALL)
+            if as_match:
+                expressions[as_match.group(2).lower()] = as_match.group(1).strip()
+        return expressions
+
+    def _extract_group_by_columns(self, sql_query: str, profile: Dict[str, Any]) -> List[str]:
+        """Base columns named in the GROUP BY clause"""
+        match = re.search(r'GROUP\s+BY\s+(.+?)(?:\bHAVING\b|\bORDER\b|\bLIMIT\b|;|$)', sql_query,
+                          re.IGNORECASE | re.DOTALL)
+        if not match:
+            return []
+        by_lower = {c.lower(): c for c in profile['columns']}
+        return [by_lower[t.lower()] for t in re.findall(r'[A-Za-z_][A-Za-z0-9_]*', match.group(1))
+                if t.lower() in by_lower]
+
+    def _extract_from_table(self, sql_query: str) -> Optional[str]:
+        """First table named in a FROM clause"""
+        match = re.search(r'FROM\s+"?(\w+)"?', sql_query, re.IGNORECASE)
+        return match.group(1) if match else None
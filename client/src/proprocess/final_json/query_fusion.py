@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+Query Fusion
+Groups proposition queries that share a literal-free template and answers each group with one
+query: propositions that differ in a single equality literal run as `col IN (...)` grouped on
+that column, and the combined rows are split back per proposition. Identical queries run once.
+"""
+
+import re
+import sqlite3
+from collections import Counter, defaultdict
+from typing import List, Dict, Any, Optional, Callable, Tuple, Union
+
+import pandas as pd
+
+from sql_parsing import QUERY_SHAPE, TEMPLATE_LITERAL, split_conjuncts, query_template
+
+FUSION_KEY = '__fusion_key'
+PARAMETER = '\0param\0'
+STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+AGGREGATE_CALL = re.compile(r'\b(COUNT|SUM|AVG|TOTAL|MIN|MAX|GROUP_CONCAT)\s*\(', re.IGNORECASE)
+PARAMETER_EQUALITY = re.compile(rf'^("?\w+"?)\s*==?\s*{PARAMETER}$')
+# Window functions and subqueries see rows of other parameter values once the filter is widened
+UNSUPPORTED = re.compile(r'\b(JOIN|UNION|INTERSECT|EXCEPT|OVER|HAVING|OR)\b|\(\s*SELECT\b', re.IGNORECASE)
+
+
+class QueryFusion:
+    """Prefetches results for a batch of queries, one database query per template group"""
+
+    def __init__(self, conn: sqlite3.Connection, rewrite: Optional[Callable[[str], str]] = None):
+        self.conn = conn
+        # Applied to each fused query before it runs (e.g. the dictionary-encoding rewrite)
+        self.rewrite = rewrite
+        # Rows per (query, max_rows): the same query may be fetched with different row limits
+        self.results: Dict[Tuple[str, int], List[Dict[str, Any]]] = {}
+        self.requested: Dict[str, set] = {}
+        self.stats = {'queries': 0, 'prefetched': 0, 'database_queries': 0, 'fused_groups': 0}
+
+    def prefetch(self, queries: List[str], max_rows: Union[int, List[int]] = 100) -> int:
+        """Run every fusable group in queries and keep the per-query rows; returns queries answered
+
+        max_rows is the row cap execute_sql_query will be called with, for all queries or per query.
+        """
+        self.clear()
+        row_caps = max_rows if isinstance(max_rows, list) else [max_rows] * len(queries)
+        for sql_query, row_cap in zip(queries, row_caps):
+            self.requested.setdefault(sql_query, set()).add(row_cap)
+
+        occurrences = Counter(queries)
+        templates = defaultdict(lambda: defaultdict(list))
+        for sql_query in occurrences:
+            literals = tuple(m.group(0) for m in TEMPLATE_LITERAL.finditer(sql_query))
+            templates[query_template(sql_query)][literals].append(sql_query)
+        self.stats['queries'] = len(queries)
+
+        for members in templates.values():
+            if len(members) == 1:
+                (same_query,) = members.values()
+                if len(same_query) > 1 or occurrences[same_query[0]] > 1:
+                    self._run_identical(same_query)
+                continue
+            self._run_fused(members)
+
+        answered = sum(1 for sql_query, row_cap in zip(queries, row_caps) if (sql_query, row_cap) in self.results)
+        self.stats['prefetched'] = answered
+        if answered:
+            print(f"    🔗 Answered {answered} of {len(queries)} queries with "
+                  f"{self.stats['database_queries']} fused queries ({self.stats['fused_groups']} template groups)")
+        return answered
+
+    def has(self, sql_query: str, max_rows: int = 100) -> bool:
+        """Whether take() will answer this query without touching the database"""
+        return (sql_query, max_rows) in self.results
+
+    def take(self, sql_query: str, max_rows: int = 100) -> Optional[List[Dict[str, Any]]]:
+        """Prefetched rows for sql_query, or None if it was not fused"""
+        if (sql_query, max_rows) not in self.results:
+            return None
+        # Callers enhance rows in place, and identical queries share one result
+        return [dict(row) for row in self.results[(sql_query, max_rows)]]
+
+    def clear(self):
+        """Drop prefetched rows (they only describe the data they were read from)"""
+        self.results.clear()
+        self.requested.clear()
+        self.stats = {'queries': 0, 'prefetched': 0, 'database_queries': 0, 'fused_groups': 0}
+
+    def _run_identical(self, same_query: List[str]):
+        """Queries equal up to whitespace run once"""
+        sql_query = same_query[0]
+        match = QUERY_SHAPE.match(sql_query.strip())
+        limits = {(member, row_cap): self._row_limit(member, match, row_cap)
+                  for member in same_query for row_cap in self.requested[member]}
+        if None in limits.values():
+            return
+        if 'LIMIT' not in sql_query.upper():
+            sql_query = f"{sql_query.rstrip().rstrip(';')} LIMIT {max(limits.values())}"
+        try:
+            cursor = self.conn.execute(self.rewrite(sql_query) if self.rewrite else sql_query)
+            columns = [description[0] for description in cursor.description]
+            rows = cursor.fetchall()
+        except Exception as e:
+            print(f"    ⚠️  Shared query failed, running members individually: {e}")
+            return
+        self.stats['database_queries'] += 1
+        for key, limit in limits.items():
+            self.results[key] = self._records(rows[:limit], columns)
+
+    def _run_fused(self, members: Dict[tuple, List[str]]):
+        """One IN (...) query over the single literal position that differs between members"""
+        literal_sets = list(members)
+        varying = [i for i in range(len(literal_sets[0])) if len({literals[i] for literals in literal_sets}) > 1]
+        if len(varying) != 1:
+            return
+        position = varying[0]
+
+        plan = self._plan(members[literal_sets[0]][0], position)
+        if plan is None:
+            return
+        values = [literals[position] for literals in literal_sets]
+        key_cases = ' '.join(f'WHEN {plan["column"]} = {value} THEN {i}' for i, value in enumerate(values))
+        fused_sql = f'SELECT {plan["select"]}, CASE {key_cases} END AS "{FUSION_KEY}" FROM {plan["table"]}'
+        in_filter = f'{plan["column"]} IN ({", ".join(values)})'
+        fused_sql += f' WHERE {" AND ".join(plan["conjuncts"] + [in_filter])}'
+        fused_sql += f' GROUP BY {plan["column"]}' + (f', {plan["group"]}' if plan['group'] else '')
+        if plan['order']:
+            fused_sql += f' ORDER BY {plan["order"]}'
+
+        try:
+            cursor = self.conn.execute(self.rewrite(fused_sql) if self.rewrite else fused_sql)
+        except Exception as e:
+            print(f"    ⚠️  Fused query failed, running {len(values)} members individually: {e}")
+            return
+        columns = [description[0] for description in cursor.description]
+        key_index = columns.index(FUSION_KEY)
+        grouped = defaultdict(list)
+        for row in cursor.fetchall():
+            grouped[row[key_index]].append(row[:key_index] + row[key_index + 1:])
+        columns.pop(key_index)
+        self.stats['database_queries'] += 1
+        self.stats['fused_groups'] += 1
+
+        for i, literals in enumerate(literal_sets):
+            # Empty groups (including aggregates over no rows, which still return one row) run on their own
+            if not grouped.get(i):
+                continue
+            for member in members[literals]:
+                member_shape = QUERY_SHAPE.match(member.strip())
+                for row_cap in self.requested[member]:
+                    limit = self._row_limit(member, member_shape, row_cap)
+                    self.results[(member, row_cap)] = self._records(grouped[i][:limit], columns)
+
+    def _plan(self, sql_query: str, position: int) -> Optional[Dict[str, Any]]:
+        """Split a member query around its varying literal; None unless it is a top-level equality filter"""
+        if UNSUPPORTED.search(STRING_LITERAL.sub("''", sql_query)):
+            return None
+        literal = list(TEMPLATE_LITERAL.finditer(sql_query))[position]
+        match = QUERY_SHAPE.match((sql_query[:literal.start()] + PARAMETER + sql_query[literal.end():]).strip())
+        if not match or not match.group('where') or PARAMETER not in match.group('where'):
+            return None
+
+        # Without GROUP BY or aggregates every matching row is returned, and the fused scan would be unbounded
+        grouped = bool(match.group('group')) or bool(AGGREGATE_CALL.search(match.group('select')))
+        if not grouped or self._row_limit(sql_query, QUERY_SHAPE.match(sql_query.strip()), 1) is None:
+            return None
+
+        conjuncts, column = [], None
+        for conjunct in split_conjuncts(match.group('where')):
+            parameter = PARAMETER_EQUALITY.match(conjunct)
+            if parameter:
+                column = parameter.group(1)
+            elif PARAMETER in conjunct:
+                return None
+            else:
+                conjuncts.append(conjunct)
+        if column is None or PARAMETER in (match.group('select') + (match.group('group') or '') +
+                                           (match.group('order') or '')):
+            return None
+
+        return {
+            'select': match.group('select'),
+            'table': match.group('table'),
+            'conjuncts': conjuncts,
+            'column': column,
+            'group': match.group('group'),
+            'order': match.group('order'),
+        }
+
+    @staticmethod
+    def _row_limit(sql_query: str, match, max_rows: int) -> Optional[int]:
+        """Rows execute_sql_query would return for this query (its LIMIT, else max_rows)"""
+        if match and match.group('limit'):
+            return int(match.group('limit'))
+        # execute_sql_query skips its own LIMIT whenever the text mentions one
+        return None if 'LIMIT' in sql_query.upper() else max_rows
+
+    @staticmethod
+    def _records(rows: List[tuple], columns: List[str]) -> List[Dict[str, Any]]:
+        """Per-query DataFrame so column dtypes depend only on that query's rows"""
+        return pd.DataFrame.from_records(rows, columns=columns, coerce_float=True).to_dict('records')
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Rollup Tables
+Builds pre-aggregated count tables on the first query that can use them and rewrites eligible
+COUNT(*) / GROUP BY queries to read from them instead of scanning every base row.
+"""
+
+import re
+import sqlite3
+from typing import List, Dict, Any, Optional
+
+# The crime CSV has one row per crime; propositions reduce it to counts by borough x month x category.
+# year, month and crime_category_name are functionally dependent on that grain, so they ride along.
+ROLLUP_SPECS = {
+    'crime_data': {
+        'rollup_table': 'crime_data_rollup',
+        'grain': ['borough_name', 'date', 'crime_category'],
+        'dependent': ['year', 'month', 'crime_category_name'],
+        'count_column': 'crime_count',
+    }
+}
+
+STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+AGGREGATE_CALL = re.compile(r'\b(COUNT|SUM|AVG|TOTAL|GROUP_CONCAT|MIN|MAX)\s*\(\s*(DISTINCT\s+)?([^)]*)\)', re.IGNORECASE)
+UNSUPPORTED = re.compile(r'\b(JOIN|UNION|INTERSECT|EXCEPT|OVER)\b|\(\s*SELECT\b', re.IGNORECASE)
+
+
+class RollupManager:
+    """Creates rollup tables and routes eligible queries to them
+
+    A rollup is built the first time prepare() sees a query it can answer, so runs without
+    eligible queries never pay for it; build() creates every rollup up front.
+    """
+
+    def __init__(self, conn: sqlite3.Connection, specs: Optional[Dict[str, Dict[str, Any]]] = None):
+        self.conn = conn
+        self.specs = specs if specs is not None else ROLLUP_SPECS
+        self.rollups: Dict[str, Dict[str, Any]] = {}
+        # Base tables whose rollup cannot be built (not loaded, grain columns missing)
+        self.unavailable = set()
+
+    def build(self):
+        """Create every rollup whose base table is loaded"""
+        for base_table in self.specs:
+            if base_table not in self.rollups:
+                self._build_rollup(base_table)
+
+    def prepare(self, queries: List[str]):
+        """Build the rollups that any of the queries can be answered from
+
+        Nothing is built on a read-only connection (e.g. inside a run's write_guard).
+        """
+        if self.conn.execute('PRAGMA query_only').fetchone()[0]:
+            return
+        for sql_query in queries:
+            base_table = self._eligible_base(sql_query)
+            if base_table and base_table not in self.rollups and base_table not in self.unavailable:
+                self._build_rollup(base_table)
+
+    def _build_rollup(self, base_table: str):
+        spec = self.specs[base_table]
+        base_columns = self._table_columns(base_table)
+        if not base_columns:
+            self.unavailable.add(base_table)
+            return
+
+        dimensions = [c for c in spec['grain'] + spec['dependent'] if c in base_columns]
+        if not all(c in base_columns for c in spec['grain']):
+            print(f"    ⚠️  Skipping rollup for {base_table}: grain columns missing")
+            self.unavailable.add(base_table)
+            return
+
+        rollup_table = spec['rollup_table']
+        dim_sql = ', '.join(f'"{c}"' for c in dimensions)
+        self.conn.execute(f'DROP TABLE IF EXISTS "{rollup_table}"')
+        self.conn.execute(
+            f'CREATE TABLE "{rollup_table}" AS '
+            f'SELECT {dim_sql}, COUNT(*) AS "{spec["count_column"]}" FROM "{base_table}" GROUP BY {dim_sql}'
+        )
+        grain_sql = ', '.join(f'"{c}"' for c in spec['grain'])
+        self.conn.execute(f'CREATE INDEX "idx_{rollup_table}_grain" ON "{rollup_table}" ({grain_sql})')
+        self.conn.commit()
+
+        base_rows = self.conn.execute(f'SELECT COUNT(*) FROM "{base_table}"').fetchone()[0]
+        rollup_rows = self.conn.execute(f'SELECT COUNT(*) FROM "{rollup_table}"').fetchone()[0]
+        self.rollups[base_table] = {
+            'rollup_table': rollup_table,
+            'count_column': spec['count_column'],
+            'base_rows': base_rows,
+            'rollup_rows': rollup_rows,
+        }
+        print(f"    📦 Built {rollup_table}: {rollup_rows} rows from {base_rows} "
+              f"({base_rows / max(1, rollup_rows):.0f}x smaller)")
+
+    def _table_columns(self, table_name: str) -> List[str]:
+        """Column names of a loaded table, empty if it does not exist"""
+        return [row[1] for row in self.conn.execute(f'PRAGMA table_info("{table_name}")').fetchall()]
+
+    def _eligible_base(self, sql_query: str) -> Optional[str]:
+        """Base table whose rollup can answer the query, else None"""
+        if UNSUPPORTED.search(sql_query):
+            return None
+
+        # Identifier checks must ignore string literals such as borough names
+        code = STRING_LITERAL.sub("''", sql_query)
+        from_tables = re.findall(r'\bFROM\s+"?(\w+)"?', code, re.IGNORECASE)
+        if len(from_tables) != 1 or from_tables[0] not in self.specs:
+            return None
+        base_table = from_tables[0]
+
+        # Only COUNT(*) re-aggregates correctly (as a SUM of counts); MIN/MAX of dimensions are also safe
+        has_count = False
+        for func, distinct, arg in AGGREGATE_CALL.findall(code):
+            func = func.upper()
+            if distinct:
+                return None
+            if func == 'COUNT':
+                if arg.strip() not in ('*', '1'):
+                    return None
+                has_count = True
+            elif func not in ('MIN', 'MAX'):
+                return None
+
+        # Row-level selections would return one row per group instead of one per crime
+        grouped = re.search(r'\bGROUP\s+BY\b', code, re.IGNORECASE)
+        distinct = re.match(r'\s*SELECT\s+DISTINCT\b', code, re.IGNORECASE)
+        if not (grouped or has_count or distinct):
+            return None
+
+        spec = self.specs[base_table]
+        base_columns = {c.lower() for c in self._table_columns(base_table)}
+        dimensions = {c.lower() for c in spec['grain'] + spec['dependent']} & base_columns
+        for identifier in re.findall(r'[A-Za-z_]\w*', code):
+            name = identifier.lower()
+            if name in base_columns and name not in dimensions:
+                return None
+        return base_table
+
+    def rewrite(self, sql_query: str) -> Optional[Dict[str, str]]:
+        """Return {'sql', 'rollup_table'} if a built rollup can answer the query, else None"""
+        base_table = self._eligible_base(sql_query)
+        if base_table not in self.rollups:
+            return None
+        rollup = self.rollups[base_table]
+
+        replacement = f'COALESCE(SUM({rollup["count_column"]}), 0)'
+        count_call = re.compile(r'\bCOUNT\s*\(\s*(?:\*|1)\s*\)', re.IGNORECASE)
+        from_match = re.search(r'\bFROM\b', sql_query, re.IGNORECASE)
+        select_part, rest = sql_query[:from_match.start()], sql_query[from_match.start():]
+
+        def select_replacement(match):
+            # Unaliased COUNT(*) in the SELECT list keeps its original output column name
+            if re.match(r'\s*(,|$)', select_part[match.end():]):
+                return f'{replacement} AS "{match.group(0)}"'
+            return replacement
+
+        rewritten = count_call.sub(select_replacement, select_part) + count_call.sub(replacement, rest)
+        rewritten = re.sub(rf'\b{base_table}\b', rollup['rollup_table'], rewritten)
+        return {'sql': rewritten, 'rollup_table': rollup['rollup_table']}
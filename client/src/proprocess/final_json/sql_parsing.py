@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+SQL Parsing Helpers
+Regex-level parsing shared by the query rewriters (approximate mode, chart views, dictionary encoding,
+query fusion) for the single-table SELECT shape most proposition SQL takes.
+"""
+
+import re
+from typing import List
+
+QUERY_SHAPE = re.compile(
+    r'^SELECT\s+(?P<select>.+?)\s+FROM\s+(?P<table>\w+)'
+    r'(?:\s+WHERE\s+(?P<where>.+?))?'
+    r'(?:\s+GROUP\s+BY\s+(?P<group>.+?))?'
+    r'(?:\s+ORDER\s+BY\s+(?P<order>.+?))?'
+    r'(?:\s+LIMIT\s+(?P<limit>\d+))?\s*;?\s*$',
+    re.IGNORECASE | re.DOTALL
+)
+TEMPLATE_LITERAL = re.compile(r"'(?:[^']|'')*'|(?<![\w\"])-?\d+(?:\.\d+)?(?![\w\"])")
+
+
+def split_top_level(clause: str) -> List[str]:
+    """Split a SQL clause on commas that are not inside parentheses"""
+    parts, depth, current = [], 0, ''
+    for char in clause:
+        if char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+        if char == ',' and depth == 0:
+            parts.append(current.strip())
+            current = ''
+        else:
+            current += char
+    if current.strip():
+        parts.append(current.strip())
+    return parts
+
+
+def split_conjuncts(where: str) -> List[str]:
+    """Split a WHERE clause on top-level AND, keeping BETWEEN ... AND ... together"""
+    tokens = re.split(r'\s+AND\s+', where.strip(), flags=re.IGNORECASE)
+    conjuncts = []
+    for token in tokens:
+        if conjuncts and re.search(r'\bBETWEEN\s+\S+$', conjuncts[-1], re.IGNORECASE):
+            conjuncts[-1] += f' AND {token}'
+        else:
+            conjuncts.append(token.strip())
+    return conjuncts
+
+
+def query_template(sql_query: str) -> str:
+    """Whitespace-normalized SQL with every literal replaced by ?"""
+    return TEMPLATE_LITERAL.sub('?', re.sub(r'\s+', ' ', sql_query.strip()))
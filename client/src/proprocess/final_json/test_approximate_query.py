@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Test script for approximate mode.
+Samples every row of a small crime table, so estimates equal the exact answers, and checks that
+ORDER BY ... LIMIT keeps the same rows and order as SQLite whichever way the sort key is written.
+"""
+
+import sqlite3
+
+from approximate_query import ApproximateQueryEngine
+
+# Distinct counts per category (no ties), listed in neither alphabetical nor count order
+CATEGORY_ROWS = {'burglary': 7, 'anti-social-behaviour': 40, 'violent-crime': 31, 'bicycle-theft': 3,
+                 'vehicle-crime': 22, 'robbery': 12, 'drugs': 17, 'shoplifting': 9}
+
+ORDERED_QUERIES = [
+    "SELECT crime_category AS category, COUNT(*) AS value FROM crime_data GROUP BY crime_category ORDER BY COUNT(*) DESC LIMIT 5",
+    "SELECT crime_category AS category, COUNT(*) AS value FROM crime_data GROUP BY crime_category ORDER BY value DESC LIMIT 5",
+    "SELECT crime_category AS category, COUNT(*) AS value FROM crime_data GROUP BY crime_category ORDER BY 2 DESC LIMIT 5",
+    "SELECT crime_category, SUM(value) AS total FROM crime_data GROUP BY crime_category ORDER BY crime_category LIMIT 3",
+    "SELECT crime_category, COUNT(*) FROM crime_data GROUP BY crime_category ORDER BY COUNT( * ) ASC LIMIT 4",
+]
+
+
+def create_database():
+    """crime_data with CATEGORY_ROWS rows per category, spread over two boroughs and months"""
+    conn = sqlite3.connect(':memory:')
+    conn.execute("CREATE TABLE crime_data (_rowid INTEGER, borough_name TEXT, date TEXT, crime_category TEXT, value INTEGER)")
+    rows = []
+    for category, count in CATEGORY_ROWS.items():
+        for i in range(count):
+            rows.append((len(rows) + 1, ['Camden', 'Hackney'][i % 2], ['2022-01', '2022-02'][i % 3 == 0], category, i % 5))
+    conn.executemany("INSERT INTO crime_data VALUES (?, ?, ?, ?, ?)", rows)
+    engine = ApproximateQueryEngine(conn, sample_fraction=1.0)
+    engine.build_samples()
+    return conn, engine
+
+
+def test_order_by_limit_matches_exact():
+    conn, engine = create_database()
+    for sql_query in ORDERED_QUERIES:
+        approximate = engine.execute(sql_query)
+        assert approximate is not None, sql_query
+        rows, _ = approximate
+        cursor = conn.execute(sql_query)
+        columns = [description[0] for description in cursor.description]
+        expected = [dict(zip(columns, row)) for row in cursor.fetchall()]
+        assert rows == expected, sql_query
+
+
+def test_unresolvable_order_runs_exactly():
+    _, engine = create_database()
+    # Neither is a SELECT item, so the sample result cannot be sorted on them
+    assert engine.parse("SELECT crime_category, COUNT(*) AS value FROM crime_data "
+                        "GROUP BY crime_category ORDER BY SUM(value) DESC LIMIT 5") is None
+    assert engine.parse("SELECT COUNT(*) AS value FROM crime_data GROUP BY borough_name ORDER BY borough_name") is None
+
+
+if __name__ == "__main__":
+    test_order_by_limit_matches_exact()
+    test_unresolvable_order_runs_exactly()
+    print("✅ Approximate query tests passed")
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Test script for query fusion.
+Prefetches groups of proposition-shaped queries that differ in one filter literal and checks that
+every query QueryFusion answers gets the same rows it returns when run on its own.
+"""
+
+import random
+import sqlite3
+
+import pandas as pd
+
+from query_fusion import QueryFusion
+
+BOROUGHS = ['Camden', 'Hackney', 'Barnet', 'City of London', 'Ealing']
+# Members filtering on 'Nowhere' match no rows
+GROUPS = {
+    'group_by': [
+        f"SELECT crime_type, COUNT(*) AS crimes, SUM(value) AS total FROM crime_data "
+        f"WHERE borough_name = '{borough}' AND date BETWEEN '2022-03' AND '2022-09' GROUP BY crime_type"
+        for borough in BOROUGHS
+    ],
+    'order_by_limit': [
+        f"SELECT date AS time, SUM(value) AS value FROM crime_data WHERE borough_name = '{borough}' "
+        f"GROUP BY date ORDER BY value DESC, time LIMIT 3"
+        for borough in BOROUGHS
+    ],
+    'numeric_literal': [
+        f"SELECT borough_name, AVG(value) AS mean FROM crime_data WHERE year = {year} "
+        f"GROUP BY borough_name ORDER BY mean DESC, borough_name"
+        for year in (2022, 2023, 2031)
+    ],
+    'empty_grouped': [
+        f"SELECT crime_type, COUNT(*) AS crimes FROM crime_data WHERE borough_name = '{borough}' "
+        f"GROUP BY crime_type ORDER BY crime_type"
+        for borough in ['Camden', 'Nowhere', 'Hackney']
+    ],
+    'empty_aggregate': [
+        f"SELECT COUNT(*) AS crimes, SUM(value) AS total FROM crime_data WHERE borough_name = '{borough}'"
+        for borough in ['Camden', 'Nowhere', 'Barnet']
+    ],
+}
+
+
+def create_database():
+    """A crime-like table of 3000 rows"""
+    conn = sqlite3.connect(':memory:')
+    conn.execute("CREATE TABLE crime_data (borough_name TEXT, crime_type TEXT, date TEXT, year INTEGER, value INTEGER)")
+    rng = random.Random(11)
+    crime_types = ['Burglary', 'Robbery', 'Theft', 'Vehicle Offences']
+    months = [(f'{year}-{month:02d}', year) for year in (2022, 2023) for month in range(1, 13)]
+    rows = []
+    for _ in range(3000):
+        date, year = rng.choice(months)
+        rows.append((rng.choice(BOROUGHS), rng.choice(crime_types), date, year, rng.randint(0, 10)))
+    conn.executemany("INSERT INTO crime_data VALUES (?, ?, ?, ?, ?)", rows)
+    return conn
+
+
+def run_unfused(conn, sql_query, max_rows):
+    """Rows execute_sql_query returns for a query that was not prefetched"""
+    if 'LIMIT' not in sql_query.upper():
+        sql_query += f' LIMIT {max_rows}'
+    return pd.read_sql_query(sql_query, conn).to_dict('records')
+
+
+def test_fused_results_match_unfused():
+    conn = create_database()
+    for name, queries in GROUPS.items():
+        for max_rows in (100, 2):
+            fusion = QueryFusion(conn)
+            fusion.prefetch(queries, max_rows)
+            assert fusion.stats['database_queries'] == 1, name
+            answered = [sql_query for sql_query in queries if fusion.has(sql_query, max_rows)]
+            assert len(answered) >= len(queries) - 1, name
+            for sql_query in answered:
+                assert fusion.take(sql_query, max_rows) == run_unfused(conn, sql_query, max_rows), sql_query
+
+
+def test_members_without_rows_run_on_their_own():
+    conn = create_database()
+    for name in ('numeric_literal', 'empty_grouped', 'empty_aggregate'):
+        fusion = QueryFusion(conn)
+        fusion.prefetch(GROUPS[name])
+        answered = [sql_query for sql_query in GROUPS[name] if fusion.has(sql_query)]
+        # An aggregate over no rows still returns one row; only the query itself produces it
+        assert len(answered) == len(GROUPS[name]) - 1, name
+        assert all('Nowhere' not in sql_query and '2031' not in sql_query for sql_query in answered)
+    assert run_unfused(conn, GROUPS['empty_aggregate'][1], 100) == [{'crimes': 0, 'total': None}]
+
+
+def test_unsupported_queries_are_not_fused():
+    conn = create_database()
+    queries = [
+        # Ungrouped scans, HAVING and OR filters would change meaning or widen the scan
+        f"SELECT crime_type, value FROM crime_data WHERE borough_name = '{borough}'" for borough in BOROUGHS[:2]
+    ] + [
+        f"SELECT crime_type, COUNT(*) AS crimes FROM crime_data WHERE borough_name = '{borough}' "
+        f"GROUP BY crime_type HAVING COUNT(*) > 10" for borough in BOROUGHS[:2]
+    ] + [
+        f"SELECT COUNT(*) AS crimes FROM crime_data WHERE borough_name = '{borough}' OR value > 9"
+        for borough in BOROUGHS[:2]
+    ]
+    fusion = QueryFusion(conn)
+    assert fusion.prefetch(queries) == 0
+    assert fusion.stats['database_queries'] == 0
+
+
+if __name__ == "__main__":
+    test_fused_results_match_unfused()
+    test_members_without_rows_run_on_their_own()
+    test_unsupported_queries_are_not_fused()
+    print("✅ Query fusion tests passed")
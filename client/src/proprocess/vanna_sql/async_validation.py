@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Asynchronous Validation Engine
+Runs a blocking per-query validation function over many queries concurrently from an asyncio event
+loop. The validators make their OpenAI calls through the shared rate limiter, so with enough requests
+in flight throughput is set by the API quota rather than by round-trip latency. Results come back in
+input order; progress callbacks run on the event loop thread, one at a time.
+"""
+
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Any, Optional, Iterable
+
+from rate_limiter import shared_limiter
+from token_usage import shared_usage_log
+
+DEFAULT_MAX_CONCURRENCY = 16
+
+
+class AsyncValidationEngine:
+    """Bounded-concurrency runner for validation calls
+
+    LLM_MAX_CONCURRENCY overrides the default number of requests in flight.
+    """
+
+    def __init__(self, max_concurrency: Optional[int] = None):
+        self.max_concurrency = max_concurrency or int(os.getenv('LLM_MAX_CONCURRENCY', DEFAULT_MAX_CONCURRENCY))
+        self.limiter = shared_limiter()
+        self.usage_log = shared_usage_log()
+        self.stats = {'runs': 0, 'items': 0, 'failed': 0, 'seconds': 0.0}
+
+    async def run_async(self, items: Iterable[Any], validate: Callable[[Any], Any],
+                        on_result: Optional[Callable[[int, Any, Any], None]] = None) -> List[Any]:
+        """validate(item) for every item, at most max_concurrency at once
+
+        A call that raises yields its exception in place of a result. on_result(index, item, result)
+        is invoked as each call completes.
+        """
+        items = list(items)
+        loop = asyncio.get_running_loop()
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        started = time.time()
+
+        with ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix='validate') as pool:
+            async def run_one(index, item):
+                async with semaphore:
+                    try:
+                        result = await loop.run_in_executor(pool, validate, item)
+                    except Exception as e:
+                        result = e
+                if on_result:
+                    on_result(index, item, result)
+                return result
+
+            results = await asyncio.gather(*(run_one(i, item) for i, item in enumerate(items)))
+
+        self.stats['runs'] += 1
+        self.stats['items'] += len(items)
+        self.stats['failed'] += sum(1 for r in results if isinstance(r, Exception))
+        self.stats['seconds'] += time.time() - started
+        return list(results)
+
+    def run(self, items: Iterable[Any], validate: Callable[[Any], Any],
+            on_result: Optional[Callable[[int, Any, Any], None]] = None) -> List[Any]:
+        """Synchronous entry point for scripts; use run_async from inside a running event loop"""
+        return asyncio.run(self.run_async(items, validate, on_result))
+
+    def print_summary(self):
+        """Throughput over all runs of this engine, time spent waiting for quota and token usage"""
+        if not self.stats['runs']:
+            return
+        limits = self.limiter.summary()
+        seconds = self.stats['seconds']
+        rate = self.stats['items'] / seconds if seconds > 0 else 0
+        print(f"⚡ Ran {self.stats['items']} validation tasks in {seconds:.1f}s "
+              f"({rate:.1f}/s, up to {self.max_concurrency} in flight)")
+        print(f"🚦 Quota {limits['requests_per_minute']:.0f} req/min, {limits['tokens_per_minute']:.0f} tokens/min: "
+              f"{limits['requests']} requests, {limits['rate_limited']} rate limited, "
+              f"{limits['seconds_waited']}s waited")
+        self.usage_log.print_summary()
@@ -11,11 +11,11 @@ from typing import List, Dict, Any, Optional, Tuple
 from pathlib import Path
 from dataclasses import dataclass, asdict
 from datetime import datetime
-import time
 import traceback
 
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
-from vanna_setup import SimpleSQLValidator
+from simple_sql_test import SimpleSQLValidator, VALID_STATUSES
+from async_validation import AsyncValidationEngine
 
 @dataclass
 class BatchResult:
@@ -33,10 +33,12 @@ class BatchResult:
 class BatchProcessor:
     """Batch processing system for Layer2 SQL validation"""
     
-    def __init__(self, csv_data_dir: str, batch_size: int = 10):
+    def __init__(self, csv_data_dir: str, batch_size: int = 10, max_concurrency: Optional[int] = None):
         self.csv_data_dir = Path(csv_data_dir)
         self.batch_size = batch_size
-        self.validator = SimpleSQLValidator(csv_data_dir=str(csv_data_dir))
+        self.validator = SimpleSQLValidator()
+        # Queries of a batch are validated concurrently; the shared rate limiter paces the API calls
+        self.engine = AsyncValidationEngine(max_concurrency)
         self.batch_results: List[BatchResult] = []
         self.all_query_results: List[Dict[str, Any]] = []
         
@@ -49,7 +51,7 @@ class BatchProcessor:
         
         if by_dataset_dir.exists():
             for dataset_dir in by_dataset_dir.iterdir():
-                if dataset_dir.is_directory():
+                if dataset_dir.is_dir():
                     dataset_files = []
                     for category_file in dataset_dir.glob("*_sql.json"):
                         if '_complete.json' not in category_file.name:
@@ -83,27 +85,34 @@ class BatchProcessor:
     
     def process_single_file(self, file_path: Path) -> Tuple[int, int, int, List[Dict[str, Any]]]:
         """Process a single file and return query counts and results"""
+        queries = self._load_queries(file_path)
+        results = self.engine.run(queries, lambda query_data: self._validate_single_query(query_data, file_path))
+        return self._tally_file(file_path, queries, results)
+    
+    def _load_queries(self, file_path: Path) -> List[Dict[str, Any]]:
+        """SQL query entries of a Layer2 output file"""
         with open(file_path, 'r') as f:
             data = json.load(f)
-        
-        queries = data.get('sql_queries', [])
+        return data.get('sql_queries', [])
+    
+    def _tally_file(self, file_path: Path, queries: List[Dict[str, Any]],
+                    results: List[Any]) -> Tuple[int, int, int, List[Dict[str, Any]]]:
+        """Query counts and results of one file from its validation results"""
         query_results = []
         valid_count = 0
         fixed_count = 0
         
-        for query_data in queries:
-            try:
-                result = self._validate_single_query(query_data, file_path)
-                query_results.append(result)
-                
-                if result['is_valid']:
-                    valid_count += 1
-                
-                if result['was_fixed']:
-                    fixed_count += 1
-                    
-            except Exception as e:
-                print(f"    ⚠️  Error processing query in {file_path.name}: {e}")
+        for result in results:
+            if isinstance(result, Exception):
+                print(f"    ⚠️  Error processing query in {file_path.name}: {result}")
+                continue
+            query_results.append(result)
+            
+            if result['is_valid']:
+                valid_count += 1
+            
+            if result['was_fixed']:
+                fixed_count += 1
         
         return len(queries), valid_count, fixed_count, query_results
     
@@ -129,26 +138,23 @@ class BatchProcessor:
                 'batch_id': None
             }
         
-        # Validate with Vanna
-        validation_result = self.validator.validate_and_fix_query(
-            sql_query=sql_query,
-            dataset_name=dataset,
-            expected_columns=query_data.get('variables_needed', [])
+        # Validate with GPT-4o
+        validation_result = self.validator.validate_sql(
+            sql_query, dataset, expected_output=query_data.get('variables_needed', [])
         )
         
-        was_fixed = (validation_result.fixed_query is not None and 
-                    validation_result.fixed_query != sql_query)
+        was_fixed = validation_result['status'] == 'fixed'
         
         return {
             'proposition_id': proposition_id,
             'dataset': dataset,
             'chart_type': chart_type,
             'original_query': sql_query,
-            'validated_query': validation_result.fixed_query,
-            'is_valid': validation_result.is_valid,
+            'validated_query': validation_result['fixed_sql'],
+            'is_valid': validation_result['status'] in VALID_STATUSES,
             'was_fixed': was_fixed,
-            'errors': validation_result.errors,
-            'suggestions': validation_result.suggestions,
+            'errors': validation_result['issues_found'],
+            'suggestions': [validation_result['analysis']],
             'source_file': str(source_file),
             'batch_id': None
         }
@@ -165,26 +171,37 @@ class BatchProcessor:
         fixed_queries = 0
         batch_query_results = []
         
-        for i, file_path in enumerate(files):
-            print(f"    {i+1}/{len(files)}: {file_path.name}")
-            
+        # All queries of the batch are validated together, then tallied per file
+        file_queries = []
+        for file_path in files:
             try:
-                file_total, file_valid, file_fixed, file_results = self.process_single_file(file_path)
-                
-                # Add batch_id to each query result
-                for result in file_results:
-                    result['batch_id'] = batch_id
-                
-                total_queries += file_total
-                valid_queries += file_valid
-                fixed_queries += file_fixed
-                batch_query_results.extend(file_results)
-                
-                print(f"      ✅ {file_valid}/{file_total} valid, {file_fixed} fixed")
-                
+                file_queries.append((file_path, self._load_queries(file_path)))
             except Exception as e:
                 print(f"      ❌ Error processing {file_path.name}: {e}")
         
+        jobs = [(file_path, query_data) for file_path, queries in file_queries for query_data in queries]
+        results = self.engine.run(jobs, lambda job: self._validate_single_query(job[1], job[0]))
+        
+        position = 0
+        for i, (file_path, queries) in enumerate(file_queries):
+            print(f"    {i+1}/{len(files)}: {file_path.name}")
+            
+            file_total, file_valid, file_fixed, file_results = self._tally_file(
+                file_path, queries, results[position:position + len(queries)]
+            )
+            position += len(queries)
+            
+            # Add batch_id to each query result
+            for result in file_results:
+                result['batch_id'] = batch_id
+            
+            total_queries += file_total
+            valid_queries += file_valid
+            fixed_queries += file_fixed
+            batch_query_results.extend(file_results)
+            
+            print(f"      ✅ {file_valid}/{file_total} valid, {file_fixed} fixed")
+        
         processing_time = (datetime.now() - start_time).total_seconds()
         queries_per_second = total_queries / processing_time if processing_time > 0 else 0
         
@@ -227,10 +244,6 @@ class BatchProcessor:
                 try:
                     result = self.process_batch(batch_id, files, 'dataset')
                     self.batch_results.append(result)
-                    
-                    # Brief pause between batches
-                    if len(self.batch_results) < len(dataset_batches):
-                        time.sleep(2)
                         
                 except Exception as e:
                     print(f"❌ Error processing batch {batch_id}: {e}")
@@ -242,14 +255,11 @@ class BatchProcessor:
                 try:
                     result = self.process_batch(batch_id, files, 'chart_type')
                     self.batch_results.append(result)
-                    
-                    # Brief pause between batches
-                    if result != self.batch_results[-1]:
-                        time.sleep(2)
                         
                 except Exception as e:
                     print(f"❌ Error processing batch {batch_id}: {e}")
         
+        self.engine.print_summary()
         return self.batch_results
     
     def save_batch_results(self, output_dir: str):
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+LLM Response Cache
+Durable cache of chat-completion responses keyed by model, temperature, max tokens, system prompt
+and user prompt. Responses live in a local SQLite file shared by every script in this folder, so a
+re-run over an unchanged corpus answers byte-identical prompts without touching the network.
+Least recently used entries are evicted once the stored responses exceed a size budget.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional, Callable, Dict, Any
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.llm_cache', 'responses.sqlite')
+DEFAULT_MAX_MB = 256
+
+
+def prompt_key(model: str, temperature: Optional[float], max_tokens: Optional[int],
+               system_prompt: str, user_prompt: str) -> str:
+    """Cache key of one chat request"""
+    payload = json.dumps([model, temperature, max_tokens, system_prompt, user_prompt], ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class LLMResponseCache:
+    """Prompt-keyed response store with size-based LRU eviction
+
+    LLM_CACHE_PATH / LLM_CACHE_MAX_MB override the location and budget; LLM_CACHE=off disables it.
+    """
+
+    def __init__(self, path: Optional[str] = None, max_mb: Optional[float] = None, enabled: Optional[bool] = None):
+        self.path = path or os.getenv('LLM_CACHE_PATH') or DEFAULT_CACHE_PATH
+        self.max_bytes = int((max_mb if max_mb is not None else float(os.getenv('LLM_CACHE_MAX_MB', DEFAULT_MAX_MB)))
+                             * 1024 * 1024)
+        self.enabled = enabled if enabled is not None else os.getenv('LLM_CACHE', 'on').lower() not in ('off', '0', 'false')
+        self.stats = {'hits': 0, 'misses': 0, 'evicted': 0}
+        self._lock = threading.Lock()
+        self._conn = None
+        if self.enabled:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute('PRAGMA journal_mode = WAL')
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS responses ('
+                'key TEXT PRIMARY KEY, model TEXT, temperature REAL, response TEXT, bytes INTEGER, '
+                'created_at REAL, last_used_at REAL, hits INTEGER DEFAULT 0)'
+            )
+            self._conn.execute('CREATE INDEX IF NOT EXISTS idx_responses_last_used ON responses (last_used_at)')
+            self._conn.commit()
+
+    def get(self, key: str) -> Optional[str]:
+        """Stored response for key, or None"""
+        if not self.enabled:
+            return None
+        with self._lock:
+            row = self._conn.execute('SELECT response FROM responses WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                self.stats['misses'] += 1
+                return None
+            self._conn.execute('UPDATE responses SET last_used_at = ?, hits = hits + 1 WHERE key = ?',
+                               (time.time(), key))
+            self._conn.commit()
+            self.stats['hits'] += 1
+            return row[0]
+
+    def put(self, key: str, response: str, model: str = '', temperature: Optional[float] = None):
+        """Store a response, then evict least recently used entries beyond the size budget"""
+        if not self.enabled or response is None:
+            return
+        size = len(response.encode('utf-8'))
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO responses (key, model, temperature, response, bytes, created_at, last_used_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)', (key, model, temperature, response, size, now, now)
+            )
+            total = self._conn.execute('SELECT COALESCE(SUM(bytes), 0) FROM responses').fetchone()[0]
+            if total > self.max_bytes:
+                evicted = 0
+                for old_key, old_size in self._conn.execute(
+                        'SELECT key, bytes FROM responses WHERE key != ? ORDER BY last_used_at', (key,)).fetchall():
+                    if total <= self.max_bytes:
+                        break
+                    self._conn.execute('DELETE FROM responses WHERE key = ?', (old_key,))
+                    total -= old_size
+                    evicted += 1
+                self.stats['evicted'] += evicted
+            self._conn.commit()
+
+    def complete(self, call: Callable[[], Optional[str]], model: str, system_prompt: str, user_prompt: str,
+                 temperature: Optional[float] = None, max_tokens: Optional[int] = None) -> Optional[str]:
+        """Cached response for this request, else call() (the network request) and remember its answer"""
+        key = prompt_key(model, temperature, max_tokens, system_prompt, user_prompt)
+        cached = self.get(key)
+        if cached is not None:
+            return cached
+        response = call()
+        if response is not None:
+            self.put(key, response, model, temperature)
+        return response
+
+    def summary(self) -> Dict[str, Any]:
+        """Hit/miss counts for this process plus the stored entry count and size"""
+        if not self.enabled:
+            return {'enabled': False}
+        with self._lock:
+            entries, size = self._conn.execute('SELECT COUNT(*), COALESCE(SUM(bytes), 0) FROM responses').fetchone()
+        return {'enabled': True, 'path': self.path, 'entries': entries, 'bytes': size, **self.stats}
+
+
+_shared_cache = None
+_shared_lock = threading.Lock()
+
+
+def shared_cache() -> LLMResponseCache:
+    """Process-wide cache instance used by VannaSQL and SimpleSQLValidator"""
+    global _shared_cache
+    with _shared_lock:
+        if _shared_cache is None:
+            _shared_cache = LLMResponseCache()
+        return _shared_cache
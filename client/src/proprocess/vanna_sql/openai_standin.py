@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+"""
+OpenAI Stand-in Server
+Local HTTP server speaking the OpenAI chat-completions API. It answers from recorded responses
+keyed exactly like the LLM response cache, so any cache file from an earlier run can be replayed.
+It can add latency drawn from a configurable distribution and inject rate-limit (429) and server
+(500) errors. Latency and errors are decided by a seeded hash of the prompt and its attempt number,
+so a run is reproducible whatever the thread interleaving. In record mode, misses are forwarded to
+the real API and stored.
+
+Point the pipeline at it with LLM_BASE_URL (VannaSQL, SimpleSQLValidator) or --llm-base-url
+(execute_sql_queries.py):
+
+    python openai_standin.py --port 8787 --latency normal:0.8:0.2 --rate-limit-rate 0.05 --seed 7
+    LLM_BASE_URL=http://127.0.0.1:8787/v1 LLM_CACHE=off python three_layer_integrator.py
+"""
+
+import argparse
+import json
+import os
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional, Dict, Any, Tuple
+
+from llm_cache import LLMResponseCache, prompt_key
+
+
+def parse_latency(spec: str):
+    """Latency sampler from "fixed:S", "uniform:LO:HI", "normal:MEAN:SD", "lognormal:MU:SIGMA" or "exp:MEAN" (seconds)"""
+    kind, *params = (spec or 'fixed:0').split(':')
+    values = [float(p) for p in params]
+    samplers = {
+        'fixed': lambda rng: values[0],
+        'uniform': lambda rng: rng.uniform(values[0], values[1]),
+        'normal': lambda rng: rng.gauss(values[0], values[1]),
+        'lognormal': lambda rng: rng.lognormvariate(values[0], values[1]),
+        'exp': lambda rng: rng.expovariate(1.0 / values[0]) if values[0] > 0 else 0.0,
+    }
+    if kind not in samplers:
+        raise ValueError(f"Unknown latency distribution '{kind}' (expected one of {', '.join(samplers)})")
+    sampler = samplers[kind]
+    return lambda rng: max(0.0, sampler(rng))
+
+
+class OpenAIStandin:
+    """Replaying /v1/chat/completions endpoint with latency and error injection"""
+
+    def __init__(self, store_path: Optional[str] = None, host: str = '127.0.0.1', port: int = 8787,
+                 latency: str = 'fixed:0', rate_limit_rate: float = 0.0, error_rate: float = 0.0,
+                 retry_after: float = 1.0, seed: int = 0, record: bool = False,
+                 upstream: str = 'https://api.openai.com/v1', miss_response: Optional[str] = None):
+        self.store = LLMResponseCache(path=store_path, enabled=True)
+        self.host = host
+        self.port = port
+        self.latency_spec = latency
+        self.sample_latency = parse_latency(latency)
+        self.rate_limit_rate = rate_limit_rate
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.seed = seed
+        self.record = record
+        self.upstream = upstream.rstrip('/')
+        self.miss_response = miss_response
+        self.stats = {'requests': 0, 'replayed': 0, 'recorded': 0, 'missed': 0, 'rate_limited': 0,
+                      'server_errors': 0, 'in_flight': 0, 'max_in_flight': 0, 'latency_seconds': 0.0}
+        self._attempts: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}/v1"
+
+    def start(self) -> str:
+        """Serve from a background thread; returns the base URL"""
+        self._server = ThreadingHTTPServer((self.host, self.port), self._handler_class())
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, name='openai-standin', daemon=True)
+        self._thread.start()
+        return self.base_url
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def serve_forever(self):
+        self._server = ThreadingHTTPServer((self.host, self.port), self._handler_class())
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        print(f"🧪 OpenAI stand-in on {self.base_url} (latency {self.latency_spec}, "
+              f"429 rate {self.rate_limit_rate}, 500 rate {self.error_rate}, seed {self.seed}"
+              f"{', recording' if self.record else ''})")
+        print(f"   export LLM_BASE_URL={self.base_url}")
+        try:
+            self._server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self._server.server_close()
+            print(f"📊 {json.dumps(self.summary())}")
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self.stats)
+        stats['latency_seconds'] = round(stats['latency_seconds'], 3)
+        return stats
+
+    def _count(self, key: str, amount: float = 1):
+        with self._lock:
+            self.stats[key] += amount
+
+    def complete(self, body: Dict[str, Any], authorization: Optional[str]) -> Tuple[int, Dict[str, Any], Dict[str, str]]:
+        """Status, JSON body and extra headers for one chat-completions request"""
+        messages = body.get('messages', [])
+        system_prompt = next((m.get('content', '') for m in messages if m.get('role') == 'system'), '')
+        user_prompt = next((m.get('content', '') for m in reversed(messages) if m.get('role') == 'user'), '')
+        model = body.get('model', 'gpt-4o')
+        key = prompt_key(model, body.get('temperature'), body.get('max_tokens'), system_prompt, user_prompt)
+
+        with self._lock:
+            attempt = self._attempts.get(key, 0)
+            self._attempts[key] = attempt + 1
+        rng = random.Random(f"{self.seed}:{key}:{attempt}")
+
+        delay = self.sample_latency(rng)
+        time.sleep(delay)
+        self._count('latency_seconds', delay)
+
+        roll = rng.random()
+        if roll < self.rate_limit_rate:
+            self._count('rate_limited')
+            return 429, _error('Rate limit reached for gpt-4o (stand-in)', 'requests', 'rate_limit_exceeded'), \
+                {'Retry-After': str(self.retry_after)}
+        if roll < self.rate_limit_rate + self.error_rate:
+            self._count('server_errors')
+            return 500, _error('The server had an error while processing your request (stand-in)', 'server_error'), {}
+
+        content = self.store.get(key)
+        if content is not None:
+            self._count('replayed')
+        elif self.record:
+            status, upstream_body = self._forward(body, authorization)
+            if status != 200:
+                return status, upstream_body, {}
+            content = upstream_body['choices'][0]['message']['content']
+            self.store.put(key, content, model, body.get('temperature'))
+            self._count('recorded')
+        elif self.miss_response is not None:
+            content = self.miss_response
+            self._count('missed')
+        else:
+            self._count('missed')
+            return 404, _error('No recorded response for this prompt (stand-in)', 'invalid_request_error',
+                               'recording_not_found'), {}
+
+        prompt_tokens = (len(system_prompt) + len(user_prompt)) // 4
+        completion_tokens = len(content) // 4
+        return 200, {
+            'id': f"chatcmpl-standin-{key[:12]}",
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': model,
+            'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': content}, 'finish_reason': 'stop'}],
+            'usage': {'prompt_tokens': prompt_tokens, 'completion_tokens': completion_tokens,
+                      'total_tokens': prompt_tokens + completion_tokens},
+        }, {}
+
+    def _forward(self, body: Dict[str, Any], authorization: Optional[str]) -> Tuple[int, Dict[str, Any]]:
+        """Send a request to the real API (record mode)"""
+        authorization = authorization or f"Bearer {os.getenv('OPENAI_API_KEY', '')}"
+        request = urllib.request.Request(
+            f"{self.upstream}/chat/completions", data=json.dumps(body).encode('utf-8'),
+            headers={'Content-Type': 'application/json', 'Authorization': authorization}, method='POST'
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=120) as response:
+                return response.status, json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            return e.code, json.loads(e.read() or b'{}')
+
+    def _handler_class(self):
+        standin = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                if self.path.rstrip('/').endswith('/models'):
+                    self._send(200, {'object': 'list', 'data': [{'id': 'gpt-4o', 'object': 'model', 'owned_by': 'standin'}]})
+                elif self.path.rstrip('/').endswith('/stats'):
+                    self._send(200, standin.summary())
+                else:
+                    self._send(404, _error(f'Unknown path {self.path}', 'invalid_request_error'))
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                try:
+                    body = json.loads(self.rfile.read(length) or b'{}')
+                except ValueError:
+                    self._send(400, _error('Request body is not JSON', 'invalid_request_error'))
+                    return
+                if not self.path.rstrip('/').endswith('/chat/completions'):
+                    self._send(404, _error(f'Unknown path {self.path}', 'invalid_request_error'))
+                    return
+
+                with standin._lock:
+                    standin.stats['requests'] += 1
+                    standin.stats['in_flight'] += 1
+                    standin.stats['max_in_flight'] = max(standin.stats['max_in_flight'], standin.stats['in_flight'])
+                try:
+                    status, payload, headers = standin.complete(body, self.headers.get('Authorization'))
+                finally:
+                    standin._count('in_flight', -1)
+                self._send(status, payload, headers)
+
+            def _send(self, status, payload, headers=None):
+                data = json.dumps(payload).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def _error(message: str, error_type: str, code: Optional[str] = None) -> Dict[str, Any]:
+    return {'error': {'message': message, 'type': error_type, 'param': None, 'code': code}}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='OpenAI-compatible stand-in server replaying recorded responses')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8787)
+    parser.add_argument('--store', default=None,
+                       help='Recorded responses, an LLM cache file [default: LLM_CACHE_PATH or .llm_cache/responses.sqlite]')
+    parser.add_argument('--latency', default='fixed:0',
+                       help='fixed:S, uniform:LO:HI, normal:MEAN:SD, lognormal:MU:SIGMA or exp:MEAN seconds [default: fixed:0]')
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0,
+                       help='Fraction of requests answered with 429 [default: 0]')
+    parser.add_argument('--error-rate', type=float, default=0.0,
+                       help='Fraction of requests answered with 500 [default: 0]')
+    parser.add_argument('--retry-after', type=float, default=1.0,
+                       help='Retry-After seconds sent with 429 responses [default: 1]')
+    parser.add_argument('--seed', type=int, default=0,
+                       help='Seed for latency and error injection [default: 0]')
+    parser.add_argument('--record', action='store_true',
+                       help='Forward prompts without a recording to the real API and store the answers')
+    parser.add_argument('--upstream', default='https://api.openai.com/v1',
+                       help='API to record from [default: https://api.openai.com/v1]')
+    parser.add_argument('--miss-response',
+                       help='Answer prompts without a recording with this text instead of a 404')
+
+    args = parser.parse_args()
+    OpenAIStandin(
+        store_path=args.store,
+        host=args.host,
+        port=args.port,
+        latency=args.latency,
+        rate_limit_rate=args.rate_limit_rate,
+        error_rate=args.error_rate,
+        retry_after=args.retry_after,
+        seed=args.seed,
+        record=args.record,
+        upstream=args.upstream,
+        miss_response=args.miss_response
+    ).serve_forever()
+
+
+if __name__ == '__main__':
+    main()
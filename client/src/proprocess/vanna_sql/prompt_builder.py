@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+Prompt Builder
+System prompts and user prompts for the GPT-4o requests of the validation pipeline. Instructions
+that are the same for every request (date-format rules, the review checklist, the answer format)
+live in the system prompts, so each user prompt carries only the query, its expected output (first
+rows) and a schema block compacted to LLM_CONTEXT_TOKENS.
+"""
+
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+from schema_registry import SchemaRegistry, compact_value, table_for_dataset
+from token_usage import count_tokens
+
+DEFAULT_CONTEXT_TOKENS = 500
+# Expected-output rows shown per query
+EXAMPLE_ROWS = 2
+
+DATE_FORMAT_RULES = """CRITICAL DATE/TIME FORMAT VALIDATION:
+1. Each dataset has DIFFERENT date/time formats - use the DATE FORMAT and YEARS ARE COLUMNS lines of the dataset info, DO NOT assume!
+2. NEVER change date filtering unless you're certain the current format is wrong for the actual data
+3. If the date column has "2022-01" format (YYYY-MM): WHERE date BETWEEN '2022-01' AND '2023-12'
+4. If the date column has full dates: WHERE date BETWEEN '2022-01-01' AND '2023-12-31'
+5. If using a year column (integer): WHERE year BETWEEN 2022 AND 2023
+6. Common mistake: changing BETWEEN '2022-01' AND '2023-12' to BETWEEN '2022-01-01' AND '2023-12-31' when data has YYYY-MM format"""
+
+REVIEW_CHECKLIST = """Check every query for, in this order:
+1. **FIRST PRIORITY**: date/time format compatibility with the actual data
+2. Wrong table names (should match the dataset's table)
+3. Wrong column names (check against the available columns)
+4. Syntax errors (GROUP BY, aggregation functions, etc.; the engine is SQLite)
+5. Logic errors (incorrect aggregations, wrong filters)
+6. Missing or incorrect data types
+A SQLite error, when given, comes from compiling the query against the dataset schema.
+A corrected query must use the dataset's table and column names, date filtering that matches the
+ACTUAL data format, and produce the query's expected output structure."""
+
+VALIDATION_SYSTEM_PROMPT = f"""You are an expert SQL reviewer for SQLite tables loaded from London datasets.
+
+{DATE_FORMAT_RULES}
+
+{REVIEW_CHECKLIST}
+
+Return your response in this format:
+ISSUES FOUND: [list any issues, or "None" if query is correct - be specific about date format]
+CORRECTED SQL: [provide fixed SQL query only if needed]"""
+
+BATCH_VALIDATION_SYSTEM_PROMPT = f"""You are an expert SQL reviewer for SQLite tables loaded from London datasets.
+Answer with a JSON array only, no prose.
+
+{DATE_FORMAT_RULES}
+
+{REVIEW_CHECKLIST}
+
+Respond with one object per query:
+[{{"proposition_id": "...", "issues": ["..."], "corrected_sql": "..."}}]
+Use "issues": [] and "corrected_sql": null for a query that is correct."""
+
+MEAN_SQL_SYSTEM_PROMPT = """You are an expert SQL developer writing SQLite queries for London datasets.
+Given a chart's main query, write the query for the mean line drawn on that chart. The mean query should:
+1. Calculate the average of the main numeric value being analyzed in the proposition
+2. Use the same filtering conditions as the main query (time period, geographic filters, etc.)
+3. Return a single mean/average value that represents the overall average for this metric
+4. Be compatible with the main query's data scope and filtering
+5. Use appropriate column names based on the proposition context
+Return only the SQL query, no explanations."""
+
+REPAIR_SYSTEM_PROMPT = f"""You are an expert SQL developer repairing SQLite queries over London datasets.
+A query failed (or returned no rows) when it was executed against the real data. Using the error
+and the table schema, return a corrected query that runs and answers the same question. Change only
+what the error requires; keep the output column aliases.
+
+{DATE_FORMAT_RULES}
+
+Return only the SQL query, no explanations."""
+
+BATCH_REPAIR_SYSTEM_PROMPT = f"""You are an expert SQL developer repairing SQLite queries over London datasets.
+Each query failed (or returned no rows) when it was executed against the real data. Using its error
+and the table schema, write a corrected query that runs and answers the same question. Change only
+what the error requires; keep the output column aliases. Answer with a JSON array only, no prose.
+
+{DATE_FORMAT_RULES}
+
+Respond with one object per query:
+[{{"proposition_id": "...", "sql": "..."}}]"""
+
+
+def context_budget() -> int:
+    """Tokens allowed for the schema block of one prompt"""
+    return int(os.getenv('LLM_CONTEXT_TOKENS', DEFAULT_CONTEXT_TOKENS))
+
+
+def compact_example(example: Any, max_rows: int = EXAMPLE_ROWS) -> str:
+    """Expected output structure: the first max_rows rows plus a count of the rest"""
+    if not isinstance(example, list):
+        return compact_value(example) if example else 'Not specified'
+    if not example:
+        return 'Not specified'
+    rows = [{key: compact_value(value) for key, value in row.items()} if isinstance(row, dict) else compact_value(row)
+            for row in example[:max_rows]]
+    more = f" (+{len(example) - max_rows} more rows like these)" if len(example) > max_rows else ""
+    return f"{rows}{more}"
+
+
+def dataset_context(registry: SchemaRegistry, dataset_paths: Dict[str, str], dataset: str,
+                    max_tokens: Optional[int] = None) -> str:
+    """Schema block for a proposition dataset, within the context budget ("" for unknown datasets)"""
+    table_name = table_for_dataset(dataset)
+    if table_name not in dataset_paths:
+        return ""
+    return registry.describe(table_name, max_tokens=max_tokens or context_budget()) or "Could not load dataset schema"
+
+
+def proposition_block(proposition: Dict[str, Any], engine_error: Optional[str] = None) -> str:
+    """The per-query part of a validation prompt"""
+    variables_needed = proposition.get('variables_needed', [])
+    lines = [
+        f"SQL: {proposition.get('sql_query', '')}",
+        f"Expected output structure: {compact_example(proposition.get('example', []))}",
+        f"Required variables: {', '.join(variables_needed) if variables_needed else 'Not specified'}",
+        f"Purpose: {proposition.get('reworded_proposition', '') or 'Not specified'}",
+    ]
+    if engine_error:
+        lines.append(f"SQLite error: {engine_error}")
+    return '\n'.join(lines)
+
+
+def validation_prompt(proposition: Dict[str, Any], schema: str,
+                      engine_error: Optional[str] = None) -> Tuple[str, str]:
+    """(system, user) prompts validating one proposition query"""
+    dataset = proposition.get('dataset', '')
+    user_prompt = (f"Dataset: {dataset} (table {table_for_dataset(dataset)})\n"
+                   f"DATASET INFO:\n{schema}\n\n"
+                   f"QUERY:\n{proposition_block(proposition, engine_error)}")
+    return VALIDATION_SYSTEM_PROMPT, user_prompt
+
+
+def batch_validation_prompt(propositions: List[Dict[str, Any]], schema: str,
+                            engine_errors: Optional[Dict[str, str]] = None) -> Tuple[str, str]:
+    """(system, user) prompts validating several propositions of one dataset"""
+    engine_errors = engine_errors or {}
+    dataset = propositions[0].get('dataset', '')
+    items = []
+    for number, proposition in enumerate(propositions, 1):
+        proposition_id = proposition.get('proposition_id', '')
+        items.append(f"[{number}] proposition_id: {proposition_id}\n"
+                     f"{proposition_block(proposition, engine_errors.get(proposition_id))}")
+    user_prompt = (f"Dataset: {dataset} (table {table_for_dataset(dataset)}), {len(propositions)} queries\n"
+                   f"DATASET INFO:\n{schema}\n\n"
+                   f"QUERIES:\n" + '\n\n'.join(items))
+    return BATCH_VALIDATION_SYSTEM_PROMPT, user_prompt
+
+
+def mean_sql_prompt(proposition_description: str, dataset: str, main_sql: str) -> Tuple[str, str]:
+    """(system, user) prompts for the mean query of a *_with_mean chart"""
+    user_prompt = (f"Proposition: \"{proposition_description}\"\n"
+                   f"Dataset: {dataset}\n"
+                   f"Table name: {table_for_dataset(dataset)}\n"
+                   f"Main query: {main_sql}")
+    return MEAN_SQL_SYSTEM_PROMPT, user_prompt
+
+
+def repair_block(item: Dict[str, Any]) -> str:
+    """The per-query part of a repair prompt: the failing SQL, its execution error and its purpose"""
+    lines = [f"SQL: {item.get('sql_query', '')}", f"Error: {item.get('error', '')}"]
+    if item.get('question'):
+        lines.append(f"Purpose: {item['question']}")
+    return '\n'.join(lines)
+
+
+def repair_prompt(item: Dict[str, Any], schema: str) -> Tuple[str, str]:
+    """(system, user) prompts repairing one failed query"""
+    return REPAIR_SYSTEM_PROMPT, f"TABLE SCHEMA:\n{schema}\n\nFAILED QUERY:\n{repair_block(item)}"
+
+
+def batch_repair_prompt(items: List[Dict[str, Any]], schema: str) -> Tuple[str, str]:
+    """(system, user) prompts repairing several failed queries on the same table"""
+    blocks = [f"[{number}] proposition_id: {item.get('proposition_id', '')}\n{repair_block(item)}"
+              for number, item in enumerate(items, 1)]
+    user_prompt = f"TABLE SCHEMA:\n{schema}\n\nFAILED QUERIES:\n" + '\n\n'.join(blocks)
+    return BATCH_REPAIR_SYSTEM_PROMPT, user_prompt
+
+
+def prompt_tokens(system_prompt: str, user_prompt: str) -> int:
+    """Tokens a request will send, counted before sending"""
+    return count_tokens(system_prompt) + count_tokens(user_prompt)
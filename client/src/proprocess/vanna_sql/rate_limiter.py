@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+API Rate Limiter
+Token buckets for the OpenAI quota (requests and tokens per minute) shared by every thread of a
+process, plus exponential backoff when the API still answers with a rate-limit error. Requests wait
+for quota instead of failing, so concurrent validation runs as fast as the account allows.
+"""
+
+import os
+import random
+import threading
+import time
+from typing import Callable, Optional, Dict, Any
+
+from token_usage import count_tokens
+
+DEFAULT_REQUESTS_PER_MINUTE = 500
+DEFAULT_TOKENS_PER_MINUTE = 30000
+DEFAULT_MAX_RETRIES = 6
+
+
+def estimate_tokens(system_prompt: str, user_prompt: str, max_tokens: Optional[int] = None) -> int:
+    """Quota a request may use: prompt tokens plus the completion budget"""
+    return count_tokens(system_prompt) + count_tokens(user_prompt) + (max_tokens or 500)
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    """True for a 429 / rate-limit response from the OpenAI client or Vanna"""
+    if type(error).__name__ == 'RateLimitError':
+        return True
+    if getattr(error, 'status_code', None) == 429 or getattr(getattr(error, 'response', None), 'status_code', None) == 429:
+        return True
+    message = str(error).lower()
+    return 'error code: 429' in message or 'rate limit' in message or 'rate_limit' in message
+
+
+def retry_after(error: Exception) -> Optional[float]:
+    """Seconds the server asked us to wait, if the response carries a Retry-After header"""
+    headers = getattr(getattr(error, 'response', None), 'headers', None) or {}
+    try:
+        return float(headers.get('retry-after') or headers.get('Retry-After'))
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """Thread-safe bucket refilled continuously at per_minute / 60 units per second"""
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self.level = self.capacity
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def acquire(self, amount: float = 1) -> float:
+        """Block until amount units are available and take them; returns the seconds waited"""
+        # A request larger than the whole bucket only has to wait for a full one
+        amount = min(float(amount), self.capacity)
+        waited = 0.0
+        while True:
+            with self._lock:
+                self._refill()
+                if self.level >= amount:
+                    self.level -= amount
+                    return waited
+                wait = (amount - self.level) / self.rate
+            time.sleep(wait)
+            waited += wait
+
+    def drain(self):
+        """Empty the bucket after the server rejected a request, so other threads back off too"""
+        with self._lock:
+            self._refill()
+            self.level = 0.0
+
+
+class RateLimiter:
+    """Requests-per-minute and tokens-per-minute quota with backoff retries on rate-limit errors
+
+    LLM_RPM / LLM_TPM / LLM_MAX_RETRIES override the defaults (OpenAI tier 1 limits for gpt-4o).
+    """
+
+    def __init__(self, requests_per_minute: Optional[float] = None, tokens_per_minute: Optional[float] = None,
+                 max_retries: Optional[int] = None, base_delay: float = 1.0, max_delay: float = 60.0):
+        self.requests = TokenBucket(requests_per_minute or float(os.getenv('LLM_RPM', DEFAULT_REQUESTS_PER_MINUTE)))
+        self.tokens = TokenBucket(tokens_per_minute or float(os.getenv('LLM_TPM', DEFAULT_TOKENS_PER_MINUTE)))
+        self.max_retries = max_retries if max_retries is not None else int(os.getenv('LLM_MAX_RETRIES', DEFAULT_MAX_RETRIES))
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.stats = {'requests': 0, 'rate_limited': 0, 'seconds_waited': 0.0}
+        self._stats_lock = threading.Lock()
+
+    def call(self, request: Callable[[], Any], tokens: int = 1) -> Any:
+        """Run request() once quota is available, retrying with exponential backoff while rate limited"""
+        for attempt in range(self.max_retries + 1):
+            waited = self.requests.acquire(1) + self.tokens.acquire(tokens)
+            self._count('seconds_waited', waited)
+            self._count('requests')
+            try:
+                return request()
+            except Exception as e:
+                if not is_rate_limit_error(e) or attempt == self.max_retries:
+                    raise
+                self._count('rate_limited')
+                self.requests.drain()
+                delay = retry_after(e) or min(self.max_delay, self.base_delay * 2 ** attempt)
+                delay *= 1 + random.random() * 0.25
+                print(f"    ⏳ Rate limited, retrying in {delay:.1f}s ({attempt + 1}/{self.max_retries})")
+                time.sleep(delay)
+                self._count('seconds_waited', delay)
+
+    def _count(self, key: str, amount: float = 1):
+        with self._stats_lock:
+            self.stats[key] += amount
+
+    def summary(self) -> Dict[str, Any]:
+        """Quota settings and counters for this process"""
+        with self._stats_lock:
+            stats = dict(self.stats)
+        stats['seconds_waited'] = round(stats['seconds_waited'], 2)
+        return {'requests_per_minute': self.requests.capacity, 'tokens_per_minute': self.tokens.capacity, **stats}
+
+
+_shared_limiter = None
+_shared_lock = threading.Lock()
+
+
+def shared_limiter() -> RateLimiter:
+    """Process-wide limiter, so every client and thread draws on the same quota"""
+    global _shared_limiter
+    with _shared_lock:
+        if _shared_limiter is None:
+            _shared_limiter = RateLimiter()
+        return _shared_limiter
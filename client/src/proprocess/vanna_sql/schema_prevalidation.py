@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Schema Pre-validation
+Compiles each proposition query against an empty SQLite database that has the same tables and
+columns as the London CSVs (taken from the schema registry). Unknown tables, unknown columns,
+missing functions and syntax errors are reported by the engine without any API call. Two mistakes
+compile but return no rows, so they are checked separately: a double-quoted name that is not a
+column (SQLite reads it as a string) and a date literal in a format the column does not use (e.g.
+'2022-01-15' against YYYY-MM data). Only queries failing a check need the model, and the error goes
+into the prompt.
+"""
+
+import re
+import sqlite3
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from schema_registry import SchemaRegistry, detect_date_format
+
+CODE_FENCE = re.compile(r'```(?:sql)?', re.IGNORECASE)
+STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+QUOTED_NAME = re.compile(r'"((?:[^"]|"")+)"')
+ALIAS = re.compile(r'\bAS\s+"((?:[^"]|"")+)"|"((?:[^"]|"")+)"\s+AS\s*\(', re.IGNORECASE)
+LITERAL = r"'(?:[^']|'')*'"
+# Month-style literals are compatible with financial-year columns ("2005-06")
+COMPATIBLE_FORMATS = {'YYYY-MM': 'YYYY-YY (financial year)'}
+
+
+def clean_column_name(column: str) -> str:
+    """Column name as the SQL executor loads it (spaces, dashes and slashes become underscores)"""
+    return column.strip().replace(' ', '_').replace('-', '_').replace('/', '_')
+
+
+class SchemaDatabase:
+    """In-memory SQLite database with one empty table per dataset"""
+
+    def __init__(self, registry: SchemaRegistry):
+        self.conn = sqlite3.connect(':memory:', check_same_thread=False)
+        self.columns: Dict[str, List[str]] = {}
+        self.date_formats: Dict[str, Dict[str, str]] = {}
+        self.missing: List[str] = []
+        self._lock = threading.Lock()
+
+        for table_name in registry.dataset_paths:
+            entry = registry.get(table_name)
+            if entry is None:
+                self.missing.append(table_name)
+                continue
+            columns = [clean_column_name(c) for c in entry['columns']]
+            definitions = ', '.join(f'"{c}" {entry["types"][raw]}' for c, raw in zip(columns, entry['columns']))
+            self.conn.execute(f'CREATE TABLE "{table_name}" ({definitions})')
+            self.columns[table_name] = columns
+            self.date_formats[table_name] = {clean_column_name(c): info['format']
+                                             for c, info in entry.get('date_formats', {}).items()}
+
+        self.conn.execute('PRAGMA query_only = ON')
+
+    def check(self, sql_query: str) -> Tuple[bool, Optional[str]]:
+        """(True, None) if the query compiles against the schema and passes the checks, else (False, error)"""
+        if any(table_name in (sql_query or '') for table_name in self.missing):
+            # A table whose CSV could not be read would fail for the wrong reason
+            return False, None
+        sql = CODE_FENCE.sub('', sql_query or '').strip().rstrip(';').strip()
+        if not sql:
+            return False, 'empty query'
+        with self._lock:
+            try:
+                self.conn.execute(f'EXPLAIN {sql}').fetchall()
+            except (sqlite3.Error, sqlite3.Warning) as e:
+                return False, str(e)
+        tables = [t for t in self.columns if re.search(rf'(?<![\w.]){re.escape(t)}(?!\w)', sql)]
+        error = self._unknown_quoted_name(sql, tables) or self._date_literal_mismatch(sql, tables)
+        return (False, error) if error else (True, None)
+
+    def _unknown_quoted_name(self, sql: str, tables: List[str]) -> Optional[str]:
+        """Error for a "quoted" name that is no column, table or alias: SQLite compiles it as a string"""
+        code = STRING_LITERAL.sub("''", sql)
+        known = set(tables) | {c for t in tables for c in self.columns[t]}
+        known |= {name for m in ALIAS.finditer(code) for name in m.groups() if name}
+        for m in QUOTED_NAME.finditer(code):
+            if m.group(1) not in known:
+                return f'no such column: "{m.group(1)}" (a double-quoted unknown name is read as a string)'
+        return None
+
+    def _date_literal_mismatch(self, sql: str, tables: List[str]) -> Optional[str]:
+        """Error for a date literal compared with a column whose values use another format"""
+        for table_name in tables:
+            for column, column_format in self.date_formats[table_name].items():
+                comparison = re.compile(
+                    rf'(?<![\w.])"?{re.escape(column)}"?\s*'
+                    rf'(?:(?:==|=|!=|<>|<=|>=|<|>)\s*({LITERAL})'
+                    rf'|(?:NOT\s+)?BETWEEN\s+({LITERAL})\s+AND\s+({LITERAL})'
+                    rf'|(?:NOT\s+)?IN\s*\(([^)]*)\))',
+                    re.IGNORECASE
+                )
+                for m in comparison.finditer(sql):
+                    literals = [l for l in m.groups()[:3] if l] + STRING_LITERAL.findall(m.group(4) or '')
+                    for literal in literals:
+                        value = literal[1:-1].replace("''", "'")
+                        literal_format = detect_date_format(column, [value])
+                        if literal_format and column_format not in (literal_format,
+                                                                    COMPATIBLE_FORMATS.get(literal_format)):
+                            return (f"date literal {literal} does not match the {column_format} format of "
+                                    f"{table_name}.{column}: the query returns no rows")
+        return None
+
+
+_shared_databases: Dict[int, SchemaDatabase] = {}
+_shared_lock = threading.Lock()
+
+
+def shared_schema_database(registry: SchemaRegistry) -> SchemaDatabase:
+    """Schema database of a registry, built once per process"""
+    with _shared_lock:
+        if id(registry) not in _shared_databases:
+            _shared_databases[id(registry)] = SchemaDatabase(registry)
+        return _shared_databases[id(registry)]
@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+"""
+Schema Registry
+Column names, types, a few sample rows and the observed date formats of every London dataset, read
+once from the CSV header plus a small sample (or from london_metadata.json when the CSV is not on
+disk). Entries are kept in memory and in .llm_cache/schema_registry.json, keyed by the source file's
+size and modification time, so validation prompts and the schema pre-validation database never parse
+a full CSV and a changed file is re-read on the next run.
+"""
+
+import json
+import math
+import os
+import re
+import threading
+from typing import Dict, Any, List, Optional
+
+import pandas as pd
+
+from token_usage import count_tokens
+
+DEFAULT_REGISTRY_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.llm_cache', 'schema_registry.json')
+METADATA_PATH = '../../../public/data/london_metadata.json'
+
+# Rows read per CSV for types and date formats; prompts show the first SAMPLE_ROWS of them
+TYPE_SAMPLE_ROWS = 200
+SAMPLE_ROWS = 3
+# Sample values longer than this are cut in prompts
+MAX_VALUE_CHARS = 40
+
+# Dataset file mappings (matching layer2.js table naming convention)
+DATASET_PATHS = {
+    'crime_data': '../../../public/dataset/london/crime-rates/london_crime_data_2022_2023.csv',
+    'ethnicity_data': '../../../public/dataset/london/ethnicity/Ethnic group.csv',
+    'birth_country_data': '../../../public/dataset/london/country-of-births/cob-borough.csv',
+    'population_data': '../../../public/dataset/london/population/population 1801 to 2021.csv',
+    'income_data': '../../../public/dataset/london/income/income-of-tax-payers.csv',
+    'house_price_data': '../../../public/dataset/london/house-prices/land-registry-house-prices-borough.csv',
+    'education_data': '../../../public/dataset/london/schools-colleges/2022-2023_england_school_information.csv',
+    'vehicle_data': '../../../public/dataset/london/vehicles/vehicles-licensed-type-borough_2023.csv',
+    'restaurant_data': '../../../public/dataset/london/restaurants/licensed-restaurants-cafes-borough_Restaurants-units.csv',
+    'rent_data': '../../../public/dataset/london/private-rent/voa-average-rent-borough_Raw-data.csv',
+    'gym_data': '../../../public/dataset/london/gyms/london_gym_facilities_2024.csv',
+    'library_data': '../../../public/dataset/london/libraries/libraries-by-areas-chart.csv'
+}
+
+# Proposition dataset name -> table name
+DATASET_TABLES = {
+    'crime-rates': 'crime_data',
+    'ethnicity': 'ethnicity_data',
+    'population': 'population_data',
+    'income': 'income_data',
+    'house-prices': 'house_price_data',
+    'country-of-births': 'birth_country_data',
+    'schools-colleges': 'education_data',
+    'vehicles': 'vehicle_data',
+    'restaurants': 'restaurant_data',
+    'private-rent': 'rent_data',
+    'gyms': 'gym_data',
+    'libraries': 'library_data'
+}
+
+DATE_FORMATS = [
+    (re.compile(r'^\d{4}-\d{2}-\d{2}[ T]\d{2}:\d{2}'), 'YYYY-MM-DD HH:MM:SS'),
+    (re.compile(r'^\d{4}-\d{2}-\d{2}$'), 'YYYY-MM-DD'),
+    (re.compile(r'^\d{4}-\d{2}$'), 'YYYY-MM'),
+    (re.compile(r'^\d{2}/\d{2}/\d{4}$'), 'DD/MM/YYYY'),
+    (re.compile(r'^[A-Z][a-z]{2}-\d{2}$'), 'Mon-YY'),
+    (re.compile(r'^Year ending [A-Z][a-z]{2} \d{4}$'), 'Year ending Mon YYYY'),
+    (re.compile(r'^\d{4}$'), 'YYYY'),
+]
+# Wide tables with one column per year or financial year ("1801", "1999-00")
+YEAR_COLUMN = re.compile(r'^\d{4}(-\d{2})?$')
+
+
+def table_for_dataset(dataset: str) -> str:
+    """Table name of a proposition dataset name ("crime-rates" -> "crime_data")"""
+    return DATASET_TABLES.get(dataset, dataset + '_data')
+
+
+def source_version(path: str) -> Optional[str]:
+    """Cheap change marker of a source file: size and modification time, None if it is missing"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return f"{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def detect_date_format(column: str, values: List[Any]) -> Optional[str]:
+    """Date format every sampled value of a column follows, if any"""
+    values = [str(v).strip() for v in values if v is not None and not (isinstance(v, float) and math.isnan(v))]
+    if not values:
+        return None
+    if all(isinstance(v, str) and v.isdigit() for v in values) and not re.search(r'year|date', column, re.IGNORECASE):
+        return None  # Plain numbers only count as years in a year/date column
+    for pattern, name in DATE_FORMATS:
+        if all(pattern.match(v) for v in values):
+            if name == 'YYYY-MM' and any(int(v[5:7]) > 12 for v in values):
+                return 'YYYY-YY (financial year)'
+            return name
+    return None
+
+
+def _year_columns(columns) -> List[str]:
+    """Year-named columns of a wide table (a single year-like header is a misread data row)"""
+    years = [str(c) for c in columns if YEAR_COLUMN.match(str(c))]
+    return years if len(years) >= 3 else []
+
+
+def _sqlite_type(dtype) -> str:
+    if pd.api.types.is_integer_dtype(dtype) or pd.api.types.is_bool_dtype(dtype):
+        return 'INTEGER'
+    if pd.api.types.is_float_dtype(dtype):
+        return 'REAL'
+    return 'TEXT'
+
+
+def compact_value(value) -> str:
+    """Sample value as prompt text, long strings cut to MAX_VALUE_CHARS"""
+    text = '' if value is None else str(value)
+    return text if len(text) <= MAX_VALUE_CHARS else text[:MAX_VALUE_CHARS - 1] + '…'
+
+
+def _json_safe(value):
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    if hasattr(value, 'item'):
+        return value.item()
+    return value
+
+
+class SchemaRegistry:
+    """Per-table schema entries, built lazily and persisted across runs"""
+
+    def __init__(self, dataset_paths: Optional[Dict[str, str]] = None, path: Optional[str] = None,
+                 metadata_path: str = METADATA_PATH):
+        self.dataset_paths = dataset_paths or DATASET_PATHS
+        self.path = path or os.getenv('SCHEMA_REGISTRY_PATH') or DEFAULT_REGISTRY_PATH
+        self.metadata_path = metadata_path
+        self.stats = {'hits': 0, 'from_csv': 0, 'from_metadata': 0}
+        self._lock = threading.Lock()
+        self._metadata_files = None
+        try:
+            with open(self.path, 'r') as f:
+                self.entries: Dict[str, Dict[str, Any]] = json.load(f)
+        except (OSError, ValueError):
+            self.entries = {}
+
+    def get(self, table_name: str) -> Optional[Dict[str, Any]]:
+        """Schema entry of a table, read from its source only when the stored one is stale"""
+        csv_path = self.dataset_paths.get(table_name)
+        if csv_path is None:
+            return None
+        version = source_version(csv_path) or f"metadata:{source_version(self.metadata_path)}"
+        with self._lock:
+            entry = self.entries.get(table_name)
+            if entry and entry['version'] == version and entry['csv_path'] == csv_path:
+                self.stats['hits'] += 1
+                return entry
+
+            entry = self._read_csv(csv_path) if not version.startswith('metadata:') else self._read_metadata(csv_path)
+            if entry is None:
+                return None
+            entry.update({'table': table_name, 'csv_path': csv_path, 'version': version})
+            self.entries[table_name] = entry
+            self._save()
+            return entry
+
+    def _read_csv(self, csv_path: str) -> Optional[Dict[str, Any]]:
+        try:
+            sample = pd.read_csv(csv_path, nrows=TYPE_SAMPLE_ROWS)
+        except Exception as e:
+            print(f"⚠️  Could not read schema of {csv_path}: {e}")
+            return None
+        self.stats['from_csv'] += 1
+        date_formats = {}
+        for column in sample.columns:
+            if pd.api.types.is_float_dtype(sample[column].dtype):
+                continue
+            date_format = detect_date_format(column, sample[column].dropna().tolist())
+            if date_format:
+                date_formats[column] = {'format': date_format, 'example': str(sample[column].dropna().iloc[0])}
+        return {
+            'source': 'csv',
+            'columns': list(sample.columns),
+            'types': {column: _sqlite_type(dtype) for column, dtype in sample.dtypes.items()},
+            'sample_rows': [{k: _json_safe(v) for k, v in row.items()}
+                            for row in sample.head(SAMPLE_ROWS).to_dict('records')],
+            'date_formats': date_formats,
+            'year_columns': _year_columns(sample.columns),
+        }
+
+    def _read_metadata(self, csv_path: str) -> Optional[Dict[str, Any]]:
+        """Entry from london_metadata.json, for datasets whose CSV is not checked out"""
+        if self._metadata_files is None:
+            try:
+                with open(self.metadata_path, 'r') as f:
+                    metadata = json.load(f)
+                self._metadata_files = {file['path']: file.get('file_summary', {})
+                                        for category in metadata.get('categories', []) for file in category.get('files', [])}
+            except (OSError, ValueError) as e:
+                print(f"⚠️  Could not load {self.metadata_path}: {e}")
+                self._metadata_files = {}
+        summary = next((s for p, s in self._metadata_files.items() if csv_path.endswith(p)), None)
+        if not summary or not summary.get('column_names'):
+            return None
+        self.stats['from_metadata'] += 1
+        column_types = summary.get('column_types', {})
+        date_formats = {}
+        for column, examples in summary.get('value_examples', {}).items():
+            date_format = detect_date_format(column, examples)
+            if date_format:
+                date_formats[column] = {'format': date_format, 'example': str(examples[0])}
+        return {
+            'source': 'metadata',
+            'columns': summary['column_names'],
+            'types': {column: 'REAL' if column_types.get(column) == 'numeric' else 'TEXT'
+                      for column in summary['column_names']},
+            'sample_rows': summary.get('data_sample', [])[:SAMPLE_ROWS],
+            'date_formats': date_formats,
+            'year_columns': _year_columns(summary['column_names']),
+        }
+
+    def _save(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.entries, f, indent=2, default=str)
+        os.replace(tmp_path, self.path)
+
+    def describe(self, table_name: str, sample_rows: bool = True, max_tokens: Optional[int] = None) -> Optional[str]:
+        """Schema text for a validation prompt: columns, date formats and (optionally) sample rows
+
+        Sample rows are listed as values in column order, without repeating the column names, and
+        only as many as fit in max_tokens (the columns and formats are always kept).
+        """
+        entry = self.get(table_name)
+        if entry is None:
+            return None
+        lines = [f"Available columns: {', '.join(entry['columns'])}"]
+        if entry['date_formats']:
+            formats = ', '.join(f"{column} is {info['format']} (e.g. \"{info['example']}\")"
+                                for column, info in entry['date_formats'].items())
+            lines.append(f"DATE FORMAT: {formats}")
+        if entry['year_columns']:
+            lines.append(f"YEARS ARE COLUMNS: {entry['year_columns'][0]} to {entry['year_columns'][-1]} "
+                         f"({len(entry['year_columns'])} columns), not a date column")
+        if sample_rows and entry['sample_rows']:
+            rows = []
+            for row in entry['sample_rows']:
+                values = [row.get(column) for column in entry['columns']] if isinstance(row, dict) else [row]
+                rows.append(' | '.join(compact_value(v) for v in values))
+                if max_tokens and count_tokens('\n'.join(lines + ["Sample rows (values in column order):"] + rows)) > max_tokens:
+                    rows.pop()
+                    break
+            if rows:
+                lines.append("Sample rows (values in column order):")
+                lines.extend(rows)
+        return '\n'.join(lines)
+
+
+_shared_registries: Dict[tuple, SchemaRegistry] = {}
+_shared_lock = threading.Lock()
+
+
+def shared_registry(dataset_paths: Optional[Dict[str, str]] = None) -> SchemaRegistry:
+    """Registry for these dataset paths (the London datasets by default), one per process"""
+    dataset_paths = dataset_paths or DATASET_PATHS
+    key = tuple(sorted(dataset_paths.items()))
+    with _shared_lock:
+        if key not in _shared_registries:
+            _shared_registries[key] = SchemaRegistry(dataset_paths)
+        return _shared_registries[key]
@@ -9,6 +9,11 @@ import os
 from datetime import datetime
 from dotenv import load_dotenv
 
+from llm_cache import shared_cache
+from rate_limiter import shared_limiter, estimate_tokens
+from schema_registry import shared_registry, table_for_dataset
+from token_usage import shared_usage_log
+
 # Load environment variables
 load_dotenv('../../../.env.local')
 
@@ -19,17 +24,32 @@ except ImportError:
     print("OpenAI not available, using mock responses")
     openai_available = False
 
+VALIDATOR_SYSTEM_PROMPT = "You are a SQL expert. Analyze SQL queries and provide corrections."
+# validate_sql statuses whose fixed_sql can be used as is
+VALID_STATUSES = ('valid', 'fixed', 'mock_valid')
+
 class SimpleSQLValidator:
     """Simple SQL validator using OpenAI directly"""
     
     def __init__(self):
-        if openai_available and os.getenv('OPENAI_API_KEY'):
-            self.client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
+        # Responses to prompts sent before are read from the local cache instead of the API
+        self.llm_cache = shared_cache()
+        self.rate_limiter = shared_limiter()
+        self.usage_log = shared_usage_log()
+        self.schema_registry = shared_registry()
+        # LLM_BASE_URL points the client at another endpoint (e.g. openai_standin.py)
+        base_url = os.getenv('LLM_BASE_URL') or None
+        if openai_available and (os.getenv('OPENAI_API_KEY') or base_url):
+            self.client = OpenAI(api_key=os.getenv('OPENAI_API_KEY') or 'sk-standin', base_url=base_url)
             self.available = True
         else:
             self.available = False
             print("⚠️  OpenAI API not available - will use mock validation")
     
+    def get_config(self):
+        """Validator settings recorded in result files"""
+        return {'validator': 'SimpleSQLValidator', 'model': 'gpt-4o', 'api_available': self.available}
+    
     def validate_sql(self, sql_query, dataset, expected_output):
         """Validate SQL query using OpenAI"""
         
@@ -43,21 +63,15 @@ class SimpleSQLValidator:
             }
         
         try:
-            # Dataset schema info (simplified)
-            schema_info = {
-                'crime-rates': 'Columns: area_name, borough_name, lsoa_code, crime_category, crime_category_name, year, month, date. DATE FORMAT: "2022-01" (YYYY-MM)',
-                'house-prices': 'Columns: borough, area, date, price, property_type. DATE FORMAT: Check actual data',
-                'population': 'Columns: area, borough, year, population_count, demographic_info. DATE FORMAT: year column (integer)',
-                'vehicles': 'Columns: borough, vehicle_type, registration_count, year, date. DATE FORMAT: Check actual data',
-                'private-rent': 'Columns: borough, area, date, average_rent, property_size. DATE FORMAT: Check actual data'
-            }
+            # Dataset schema info from the shared registry (CSV header and observed date formats)
+            schema_info = self.schema_registry.describe(table_for_dataset(dataset), sample_rows=False)
             
             prompt = f"""
             CRITICAL: You are analyzing SQL for {dataset} dataset. Before suggesting any fixes, you MUST carefully examine the actual data format.
             
             SQL Query to Analyze: {sql_query}
             
-            Dataset Schema: {schema_info.get(dataset, 'Schema unknown')}
+            Dataset Schema: {schema_info or 'Schema unknown'}
             
             Expected Output: {expected_output}
             
@@ -90,17 +104,23 @@ class SimpleSQLValidator:
             ANALYSIS: [brief explanation focusing on date format validation]
             """
             
-            response = self.client.chat.completions.create(
-                model="gpt-4o",
-                messages=[
-                    {"role": "system", "content": "You are a SQL expert. Analyze SQL queries and provide corrections."},
-                    {"role": "user", "content": prompt}
-                ],
-                max_tokens=1000,
-                temperature=0.1
-            )
+            def request():
+                response = self.client.chat.completions.create(
+                    model="gpt-4o",
+                    messages=[
+                        {"role": "system", "content": VALIDATOR_SYSTEM_PROMPT},
+                        {"role": "user", "content": prompt}
+                    ],
+                    max_tokens=1000,
+                    temperature=0.1
+                )
+                return response
             
-            analysis = response.choices[0].message.content
+            tokens = estimate_tokens(VALIDATOR_SYSTEM_PROMPT, prompt, 1000)
+            request = self.usage_log.track('simple_validate', "gpt-4o", request)
+            analysis = self.llm_cache.complete(lambda: self.rate_limiter.call(request, tokens),
+                                               model="gpt-4o", system_prompt=VALIDATOR_SYSTEM_PROMPT,
+                                               user_prompt=prompt, temperature=0.1, max_tokens=1000)
             
             # Parse response
             status = "valid"
@@ -260,6 +280,10 @@ def main():
     print(f"⚠️  Needs Fix: {needs_fix}")
     print(f"❌ Errors: {errors}")
     print(f"🔄 Mock Valid: {mock_valid}")
+    cache = validator.llm_cache.summary()
+    if cache['enabled']:
+        print(f"💾 LLM cache: {cache['hits']} hits, {cache['misses']} API calls")
+    validator.usage_log.print_summary()
     
     # Save detailed results
     output_data = {
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+SQL Repair Loop
+Execute-error-repair for proposition queries that fail against the real data. Each failing query is
+sent to the model with its concrete SQLite error and the table schema; the candidate fix is executed
+again and, if it still fails, goes back with the new error, up to max_attempts rounds. Queries of the
+same table are repaired in one request, and requests run concurrently through AsyncValidationEngine.
+Only queries that failed are sent, so no model call is spent on queries that already run.
+"""
+
+import os
+from typing import Callable, Dict, Any, List, Optional
+
+from async_validation import AsyncValidationEngine
+from prompt_builder import dataset_context
+
+DEFAULT_MAX_ATTEMPTS = 2
+DEFAULT_BATCH_SIZE = 8
+
+
+class SQLRepairLoop:
+    """Bounded repair rounds over failed queries
+
+    execute(sql) returns None when the query runs and returns rows, else the error to show the
+    model. It is called from the calling thread only. schema(dataset) returns the schema block of
+    a dataset's table [default: from the VannaSQL schema registry]. REPAIR_BATCH_SIZE overrides the
+    default number of queries per request.
+    """
+
+    def __init__(self, vanna_sql, execute: Callable[[str], Optional[str]],
+                 schema: Optional[Callable[[str], str]] = None, max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+                 batch_size: Optional[int] = None, max_concurrency: Optional[int] = None):
+        self.vanna_sql = vanna_sql
+        self.execute = execute
+        self.schema = schema or (lambda dataset: dataset_context(vanna_sql.schema_registry, vanna_sql.dataset_paths,
+                                                                 dataset))
+        self.max_attempts = max_attempts
+        self.batch_size = batch_size or int(os.getenv('REPAIR_BATCH_SIZE', DEFAULT_BATCH_SIZE))
+        self.engine = AsyncValidationEngine(max_concurrency)
+        self.stats = {'failing': 0, 'repaired': 0, 'attempts': 0}
+
+    def repair(self, items: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+        """
+        Repair failed queries
+
+        Args:
+            items (list): Dicts with proposition_id, dataset, sql_query, error and (optionally) question
+
+        Returns:
+            dict: proposition_id -> {"sql": fixed SQL or None, "attempts": n, "error": last error or None}
+        """
+        outcomes = {item['proposition_id']: {'sql': None, 'attempts': 0, 'error': item['error']} for item in items}
+        pending = [dict(item) for item in items]
+        self.stats['failing'] += len(items)
+
+        for attempt in range(1, self.max_attempts + 1):
+            if not pending:
+                break
+            print(f"\n🔧 Repair round {attempt}/{self.max_attempts}: {len(pending)} failing queries")
+
+            # One request per table and chunk; chunks run concurrently
+            by_dataset = {}
+            for item in pending:
+                by_dataset.setdefault(item.get('dataset', ''), []).append(item)
+            groups = [group[start:start + self.batch_size]
+                      for group in by_dataset.values() for start in range(0, len(group), self.batch_size)]
+            fixes = {}
+            for group_fixes in self.engine.run(groups, self._fix_group):
+                if isinstance(group_fixes, Exception):
+                    print(f"⚠️  Repair request failed: {group_fixes}")
+                    continue
+                fixes.update(group_fixes)
+
+            # Candidates are executed here, on the caller's thread and connection
+            still_failing = []
+            for item in pending:
+                proposition_id = item['proposition_id']
+                fixed_sql = fixes.get(str(proposition_id))
+                outcome = outcomes[proposition_id]
+                outcome['attempts'] = attempt
+                self.stats['attempts'] += 1
+                if not fixed_sql or fixed_sql.strip() == item['sql_query'].strip():
+                    continue  # No new candidate: another round would ask the same question
+                error = self.execute(fixed_sql)
+                if error is None:
+                    outcome.update({'sql': fixed_sql, 'error': None})
+                    self.stats['repaired'] += 1
+                    print(f"✅ Repaired {proposition_id} (round {attempt})")
+                else:
+                    outcome['error'] = error
+                    still_failing.append({**item, 'sql_query': fixed_sql, 'error': error})
+            pending = still_failing
+
+        return outcomes
+
+    def _fix_group(self, items: List[Dict[str, Any]]) -> Dict[str, str]:
+        dataset = items[0].get('dataset', '')
+        return self.vanna_sql.fix_sql_batch(items, self.schema(dataset))
+
+    def print_summary(self):
+        if not self.stats['failing']:
+            return
+        print(f"🔧 Repaired {self.stats['repaired']} of {self.stats['failing']} failing queries "
+              f"({self.stats['attempts']} repair attempts, at most {self.max_attempts} rounds)")
+        self.engine.print_summary()
+
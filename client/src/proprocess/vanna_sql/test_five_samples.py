@@ -61,13 +61,7 @@ def main():
     # Train Vanna on the datasets present in our sample
     datasets_to_train = list(set([prop['dataset'] for prop in propositions]))
     print(f"\n📚 Training Vanna on datasets: {datasets_to_train}")
-    
-    for dataset in datasets_to_train:
-        try:
-            print(f"  Training on {dataset}...")
-            vanna.train_on_csv(dataset, sample_size=300)
-        except Exception as e:
-            print(f"  ⚠️  Warning: Could not train on {dataset}: {str(e)}")
+    vanna.train_datasets(datasets_to_train, sample_size=300)
     
     # Validate each proposition
     print(f"\n🔍 Validating {len(propositions)} propositions...")
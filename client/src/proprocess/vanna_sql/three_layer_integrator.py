@@ -16,6 +16,9 @@ import traceback
 
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 from vanna_setup import VannaSQL
+from prompt_builder import mean_sql_prompt
+from schema_prevalidation import CODE_FENCE
+from schema_registry import table_for_dataset
 
 @dataclass
 class ConsolidatedProposition:
@@ -172,77 +175,32 @@ class ThreeLayerIntegrator:
         main_sql = layer2_query.get('sql_query', '')
         proposition_description = layer1_prop.get('reworded_proposition', '')
         
-        # Get dataset table mapping
-        dataset_table_mapping = {
-            'crime-rates': 'crime_data',
-            'ethnicity': 'ethnicity_data', 
-            'population': 'population_data',
-            'income': 'income_data',
-            'house-prices': 'house_price_data',
-            'country-of-births': 'birth_country_data',
-            'schools-colleges': 'education_data',
-            'vehicles': 'vehicle_data',
-            'restaurants': 'restaurant_data',
-            'private-rent': 'rent_data',
-            'gyms': 'gym_data',
-            'libraries': 'library_data'
-        }
-        
-        table_name = dataset_table_mapping.get(dataset, dataset + '_data')
+        table_name = table_for_dataset(dataset)
         
-        # Check if Vanna client is available
-        if self.vanna_sql.vn is None:
-            print(f"⚠️  Vanna client not available for mean SQL generation, using fallback")
-            # Fallback simple mean query
-            try:
-                # Extract main value column from the original SQL (usually 'value' or similar)
-                if 'AS value' in main_sql.upper():
-                    fallback_sql = f"SELECT AVG(sub.value) as mean_value FROM ({main_sql.rstrip(';')}) as sub;"
-                else:
-                    # Generic fallback
-                    fallback_sql = f"SELECT AVG(value) as mean_value FROM {table_name};"
-                
-                return fallback_sql
-            except:
-                return None
+        # Check if a client is available
+        if self.vanna_sql.vn is None and not self.vanna_sql.use_direct_openai:
+            print(f"⚠️  No client available for mean SQL generation, using fallback")
+            return self.fallback_mean_sql(main_sql, table_name)
         
         try:
-            # Generate mean calculation query using Vanna
-            mean_prompt = f"""
-            Generate a SQL query to calculate the mean/average value for this proposition: "{proposition_description}"
-            
-            Dataset: {dataset}
-            Table name: {table_name}
-            Original main query: {main_sql}
-            
-            The mean query should:
-            1. Calculate the average of the main numeric value being analyzed in the proposition
-            2. Use the same filtering conditions as the main query (time period, geographic filters, etc.)
-            3. Return a single mean/average value that represents the overall average for this metric
-            4. Be compatible with the main query's data scope and filtering
-            5. Use appropriate column names based on the proposition context
-            
-            Return only the SQL query, no explanations.
-            """
-            
-            mean_sql = self.vanna_sql.vn.generate_sql(mean_prompt)
-            return mean_sql.strip()
+            # The instructions are the shared system prompt; only the proposition goes in the user prompt
+            system_prompt, user_prompt = mean_sql_prompt(proposition_description, dataset, main_sql)
+            mean_sql = self.vanna_sql.complete_chat(system_prompt, user_prompt, max_tokens=300, label='mean_sql')
+            if not mean_sql:
+                return self.fallback_mean_sql(main_sql, table_name)
+            return CODE_FENCE.sub('', mean_sql).strip()
             
         except Exception as e:
             print(f"⚠️  Error generating mean SQL query: {e}")
-            
-            # Fallback simple mean query
-            try:
-                # Extract main value column from the original SQL (usually 'value' or similar)
-                if 'AS value' in main_sql.upper():
-                    fallback_sql = f"SELECT AVG(sub.value) as mean_value FROM ({main_sql.rstrip(';')}) as sub;"
-                else:
-                    # Generic fallback
-                    fallback_sql = f"SELECT AVG(value) as mean_value FROM {table_name};"
-                
-                return fallback_sql
-            except:
-                return None
+            return self.fallback_mean_sql(main_sql, table_name)
+    
+    def fallback_mean_sql(self, main_sql: str, table_name: str) -> str:
+        """Simple mean query without a model call"""
+        # Average the main query's value column (usually 'value') if it has one
+        if 'AS value' in main_sql.upper():
+            return f"SELECT AVG(sub.value) as mean_value FROM ({main_sql.rstrip(';')}) as sub;"
+        # Generic fallback
+        return f"SELECT AVG(value) as mean_value FROM {table_name};"
     
     def validate_and_consolidate_proposition(self, prop_id: str, layer1_prop: Dict[str, Any], 
                                            layer2_query: Dict[str, Any]) -> ConsolidatedProposition:
@@ -424,6 +382,11 @@ class ThreeLayerIntegrator:
         print(f"📉 With Threshold (Boolean): {with_threshold}")
         print(f"🔧 With Both Mean SQL & Threshold: {with_both}")
         
+        cache = self.vanna_sql.llm_cache.summary()
+        if cache['enabled']:
+            print(f"💾 LLM cache: {cache['hits']} hits, {cache['misses']} API calls ({cache['entries']} responses stored)")
+        self.vanna_sql.usage_log.print_summary()
+        
         # Chart type breakdown
         chart_type_counts = {}
         for prop in self.consolidated_results:
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Token Usage
+Local token counting for prompts (tiktoken when installed, about 4 characters per token otherwise),
+used to size prompts and for the rate limiter's budget before a request is sent, and a per-call log of
+the API requests the validators send. Every request attempt is written to .llm_cache/usage.jsonl with
+its call site, model, the prompt and completion tokens the API reported and latency, and the run
+summaries print the totals per call site. Cache hits send nothing and are not logged.
+"""
+
+import json
+import os
+import threading
+import time
+from typing import Callable, Dict, Any, Optional
+
+DEFAULT_USAGE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.llm_cache', 'usage.jsonl')
+
+_encoding = None
+_encoding_loaded = False
+_encoding_lock = threading.Lock()
+
+
+def _get_encoding():
+    """gpt-4o tokenizer, or None if tiktoken (or its encoding file) is not available"""
+    global _encoding, _encoding_loaded
+    if _encoding_loaded:
+        return _encoding
+    with _encoding_lock:
+        if not _encoding_loaded:
+            try:
+                import tiktoken
+                _encoding = tiktoken.encoding_for_model('gpt-4o')
+            except Exception:
+                _encoding = None
+            _encoding_loaded = True
+    return _encoding
+
+
+def count_tokens(text: Optional[str]) -> int:
+    """Tokens in text as gpt-4o counts them (estimated from its length without tiktoken)"""
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is None:
+        return (len(text) + 3) // 4
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+class UsageLog:
+    """Tokens and latency of each API request, on disk and totalled per call site
+
+    LLM_USAGE_LOG overrides the log file; LLM_USAGE_LOG=off keeps the totals in memory only.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        setting = path or os.getenv('LLM_USAGE_LOG') or DEFAULT_USAGE_PATH
+        self.path = None if setting.lower() in ('off', '0', 'false') else setting
+        self.totals: Dict[str, Dict[str, float]] = {}
+        self._lock = threading.Lock()
+        if self.path:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+
+    def track(self, label: str, model: str, request: Callable[[], Any]) -> Callable[[], Optional[str]]:
+        """request wrapped so that each attempt is timed and recorded under label
+
+        request returns the API response; the wrapper returns its reply text. Chat completion
+        responses are logged with the prompt and completion tokens the API reports in
+        response.usage. Clients that return only text (Vanna) report no usage, so their requests
+        are logged without token counts rather than with local estimates.
+        """
+        def tracked():
+            started = time.time()
+            try:
+                response = request()
+            except Exception as e:
+                self.record(label, model, None, None, time.time() - started, error=type(e).__name__)
+                raise
+            if response is None or isinstance(response, str):
+                self.record(label, model, None, None, time.time() - started)
+                return response
+            usage = getattr(response, 'usage', None)
+            if usage is None:
+                self.record(label, model, None, None, time.time() - started)
+            else:
+                self.record(label, model, usage.prompt_tokens, usage.completion_tokens, time.time() - started)
+            return response.choices[0].message.content
+
+        return tracked
+
+    def record(self, label: str, model: str, prompt_tokens: Optional[int], completion_tokens: Optional[int],
+               seconds: float, error: Optional[str] = None):
+        """One request; token counts are None when the API reported none"""
+        entry = {'time': round(time.time(), 3), 'label': label, 'model': model, 'prompt_tokens': prompt_tokens,
+                 'completion_tokens': completion_tokens, 'seconds': round(seconds, 3), 'error': error}
+        with self._lock:
+            totals = self.totals.setdefault(label, {'calls': 0, 'errors': 0, 'unreported': 0, 'prompt_tokens': 0,
+                                                    'completion_tokens': 0, 'seconds': 0.0})
+            totals['calls'] += 1
+            totals['errors'] += 1 if error else 0
+            if prompt_tokens is None:
+                totals['unreported'] += 1
+            else:
+                totals['prompt_tokens'] += prompt_tokens
+                totals['completion_tokens'] += completion_tokens
+            totals['seconds'] += seconds
+            if self.path:
+                with open(self.path, 'a') as f:
+                    f.write(json.dumps(entry) + '\n')
+
+    def summary(self) -> Dict[str, Any]:
+        """Totals per call site for this process"""
+        with self._lock:
+            return {label: dict(totals) for label, totals in self.totals.items()}
+
+    def print_summary(self):
+        totals = self.summary()
+        if not totals:
+            return
+        calls = sum(t['calls'] for t in totals.values())
+        unreported = sum(t['unreported'] for t in totals.values())
+        prompt = sum(t['prompt_tokens'] for t in totals.values())
+        completion = sum(t['completion_tokens'] for t in totals.values())
+        print(f"🧮 Tokens: {prompt} prompt + {completion} completion over {calls} API requests"
+              + (f" ({unreported} without reported usage)" if unreported else ""))
+        for label, t in sorted(totals.items()):
+            reported = t['calls'] - t['unreported']
+            tokens = (f"{t['prompt_tokens'] / reported:.0f} prompt + {t['completion_tokens'] / reported:.0f} "
+                      f"completion tokens" if reported else "no reported tokens")
+            print(f"   {label}: {t['calls']} requests, {tokens} and {t['seconds'] / t['calls']:.2f}s each")
+
+
+_shared_log = None
+_shared_lock = threading.Lock()
+
+
+def shared_usage_log() -> UsageLog:
+    """Process-wide usage log used by VannaSQL and SimpleSQLValidator"""
+    global _shared_log
+    with _shared_lock:
+        if _shared_log is None:
+            _shared_log = UsageLog()
+        return _shared_log
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Training Manifest
+Records which dataset versions have been trained into which Vanna store, so train_on_csv and
+train_all_datasets skip datasets that are already there. LocalVanna keeps its ChromaDB collection in a
+persistent directory (.llm_cache/vanna_chroma) and the manifest lives in that same directory: deleting
+the store also forgets what was trained into it. A dataset is retrained when its CSV's size or
+modification time, the sample size or the training format changes.
+"""
+
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from typing import Dict, Any, Optional
+
+import pandas as pd
+
+from schema_registry import source_version
+
+DEFAULT_CHROMA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.llm_cache', 'vanna_chroma')
+MANIFEST_NAME = 'training_manifest.json'
+# Bump when what train_on_csv sends to vn.train changes, so existing stores are retrained
+TRAINING_FORMAT = 1
+
+
+def chroma_path() -> str:
+    """Persistent ChromaDB directory for LocalVanna (VANNA_CHROMA_PATH overrides it)"""
+    return os.getenv('VANNA_CHROMA_PATH') or DEFAULT_CHROMA_PATH
+
+
+def dataset_fingerprint(csv_path: str, sample_size: int) -> Optional[str]:
+    """What a training run of this CSV depends on; None if the file is missing"""
+    version = source_version(csv_path)
+    if version is None:
+        return None
+    return f"{version}:{sample_size}:v{TRAINING_FORMAT}"
+
+
+def count_rows(csv_path: str) -> int:
+    """Data rows of a CSV from its line breaks, without parsing it"""
+    lines = 0
+    with open(csv_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            lines += block.count(b'\n')
+    return max(lines - 1, 0)
+
+
+def sample_csv(csv_path: str, sample_size: int, seed: int = 42) -> pd.DataFrame:
+    """A seeded random sample of sample_size rows; skipped rows are never built into a frame"""
+    total = count_rows(csv_path)
+    if total <= sample_size:
+        return pd.read_csv(csv_path)
+    keep = set(random.Random(seed).sample(range(1, total + 1), sample_size))
+    return pd.read_csv(csv_path, skiprows=lambda line: line > 0 and line not in keep)
+
+
+class TrainingManifest:
+    """store -> table -> fingerprint of the dataset version trained into that store"""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or os.path.join(chroma_path(), MANIFEST_NAME)
+        self._lock = threading.Lock()
+        self.entries: Dict[str, Dict[str, Dict[str, Any]]] = self._load()
+
+    def _load(self) -> Dict[str, Dict[str, Dict[str, Any]]]:
+        try:
+            with open(self.path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def is_trained(self, store: str, table_name: str, fingerprint: Optional[str]) -> bool:
+        with self._lock:
+            entry = self.entries.get(store, {}).get(table_name)
+        return fingerprint is not None and entry is not None and entry['fingerprint'] == fingerprint
+
+    def fingerprint(self) -> str:
+        """Short hash of everything trained so far; changes whenever a dataset is (re)trained"""
+        with self._lock:
+            payload = json.dumps(self.entries, sort_keys=True)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:16]
+
+    def record(self, store: str, table_name: str, fingerprint: str, rows: int):
+        with self._lock:
+            # Entries other processes recorded since this one loaded the file are kept
+            self.entries = {**self.entries, **self._load()}
+            self.entries.setdefault(store, {})[table_name] = {
+                'fingerprint': fingerprint, 'rows': rows, 'trained_at': time.time()
+            }
+            self._save()
+
+    def _save(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.entries, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+
+_shared_manifest = None
+_shared_lock = threading.Lock()
+
+
+def shared_training_manifest() -> TrainingManifest:
+    """Process-wide training manifest used by VannaSQL"""
+    global _shared_manifest
+    with _shared_lock:
+        if _shared_manifest is None:
+            _shared_manifest = TrainingManifest()
+        return _shared_manifest
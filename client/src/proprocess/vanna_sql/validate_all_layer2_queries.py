@@ -15,7 +15,8 @@ from pathlib import Path
 
 # Add the current directory to path to import vanna_setup
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
-from vanna_setup import SimpleSQLValidator
+from simple_sql_test import SimpleSQLValidator, VALID_STATUSES
+from async_validation import AsyncValidationEngine
 
 @dataclass
 class SQLQueryResult:
@@ -38,7 +39,7 @@ class Layer2SQLValidator:
     def __init__(self, layer2_output_dir: str, csv_data_dir: str):
         self.layer2_output_dir = Path(layer2_output_dir)
         self.csv_data_dir = Path(csv_data_dir)
-        self.validator = SimpleSQLValidator(csv_data_dir=str(csv_data_dir))
+        self.validator = SimpleSQLValidator()
         self.results: List[SQLQueryResult] = []
         
         # Statistics tracking
@@ -85,7 +86,7 @@ class Layer2SQLValidator:
         
         # Iterate through dataset directories
         for dataset_dir in by_dataset_dir.iterdir():
-            if dataset_dir.is_directory():
+            if dataset_dir.is_dir():
                 dataset_name = dataset_dir.name
                 print(f"  📊 Loading {dataset_name} queries...")
                 
@@ -192,17 +193,15 @@ class Layer2SQLValidator:
             if not sql_query or sql_query.strip() == '':
                 validation_errors.append("Empty or missing SQL query")
             else:
-                # Validate with Vanna
-                validation_result = self.validator.validate_and_fix_query(
-                    sql_query=sql_query,
-                    dataset_name=dataset,
-                    expected_columns=query_data.get('variables_needed', [])
+                # Validate with GPT-4o
+                validation_result = self.validator.validate_sql(
+                    sql_query, dataset, expected_output=query_data.get('variables_needed', [])
                 )
                 
-                is_valid = validation_result.is_valid
-                validated_query = validation_result.fixed_query if validation_result.fixed_query else sql_query
-                validation_errors = validation_result.errors
-                vanna_suggestions = validation_result.suggestions
+                is_valid = validation_result['status'] in VALID_STATUSES
+                validated_query = validation_result['fixed_sql'] or sql_query
+                validation_errors = validation_result['issues_found']
+                vanna_suggestions = [validation_result['analysis']]
                 
         except Exception as e:
             validation_errors.append(f"Validation error: {str(e)}")
@@ -262,8 +261,8 @@ class Layer2SQLValidator:
         elif 'underused_charts' in result.source_file:
             self.stats['by_source']['underused_charts'] += 1
     
-    def validate_all_queries(self, batch_size: int = 5) -> List[SQLQueryResult]:
-        """Validate all loaded queries with batch processing"""
+    def validate_all_queries(self, max_concurrency: Optional[int] = None) -> List[SQLQueryResult]:
+        """Validate all loaded queries concurrently, paced by the shared API rate limiter"""
         queries = self.load_all_queries()
         
         if not queries:
@@ -273,34 +272,24 @@ class Layer2SQLValidator:
         print(f"\n🔍 Starting validation of {len(queries)} SQL queries...")
         print("=" * 60)
         
-        # Process in batches
-        for i in range(0, len(queries), batch_size):
-            batch = queries[i:i + batch_size]
-            batch_num = (i // batch_size) + 1
-            total_batches = (len(queries) + batch_size - 1) // batch_size
-            
-            print(f"\n📦 Processing batch {batch_num}/{total_batches} ({len(batch)} queries)...")
-            
-            for j, query_data in enumerate(batch):
-                try:
-                    result = self.validate_single_query(query_data)
-                    self.results.append(result)
-                    self.update_statistics(result)
-                    
-                    # Progress indicator
-                    status = "✅" if result.is_valid else "❌"
-                    fixed_indicator = "🔧" if result.validated_query != result.original_query else ""
-                    print(f"  {status} {fixed_indicator} {result.proposition_id} ({result.processing_time:.2f}s)")
-                    
-                except Exception as e:
-                    self.stats['processing_errors'] += 1
-                    print(f"❌ Error processing query {i + j + 1}: {e}")
-                    traceback.print_exc()
+        engine = AsyncValidationEngine(max_concurrency)
+        
+        def report(index: int, query_data: Dict[str, Any], result: Any):
+            if isinstance(result, Exception):
+                self.stats['processing_errors'] += 1
+                print(f"❌ Error processing query {index + 1}: {result}")
+                traceback.print_exception(type(result), result, result.__traceback__)
+                return
+            self.update_statistics(result)
             
-            # Brief pause between batches for rate limiting
-            if i + batch_size < len(queries):
-                import time
-                time.sleep(1)
+            # Progress indicator
+            status = "✅" if result.is_valid else "❌"
+            fixed_indicator = "🔧" if result.validated_query != result.original_query else ""
+            print(f"  {status} {fixed_indicator} {result.proposition_id} ({result.processing_time:.2f}s)")
+        
+        results = engine.run(queries, self.validate_single_query, report)
+        self.results.extend(r for r in results if not isinstance(r, Exception))
+        engine.print_summary()
         
         return self.results
     
@@ -382,7 +371,7 @@ def main():
         validator = Layer2SQLValidator(layer2_output_dir, csv_data_dir)
         
         # Run validation
-        results = validator.validate_all_queries(batch_size=5)
+        results = validator.validate_all_queries()
         
         # Save results
         validator.save_validation_results(output_file)
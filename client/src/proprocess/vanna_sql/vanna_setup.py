@@ -1,8 +1,21 @@
 import os
 import pandas as pd
 import json
+import hashlib
+import threading
+import time
 from dotenv import load_dotenv
 
+from llm_cache import shared_cache
+from rate_limiter import shared_limiter, estimate_tokens
+from async_validation import AsyncValidationEngine
+from schema_prevalidation import CODE_FENCE, shared_schema_database
+from schema_registry import DATASET_PATHS, DATASET_TABLES, shared_registry
+from prompt_builder import (validation_prompt, batch_validation_prompt, repair_prompt, batch_repair_prompt,
+                            dataset_context, prompt_tokens)
+from token_usage import shared_usage_log
+from training_manifest import shared_training_manifest, chroma_path, dataset_fingerprint, sample_csv
+
 # Load environment variables
 load_dotenv('../../../.env.local')
 
@@ -35,26 +48,65 @@ try:
 except ImportError:
     OPENAI_AVAILABLE = False
 
+SQL_SYSTEM_PROMPT = "You are an expert SQL developer. Generate only valid SQL queries based on user requests."
+# Model every client's chat request goes to; chat responses are cached under it
+CHAT_MODEL = 'gpt-4o'
+
+# Client health results, shared by every process using this folder
+CLIENT_HEALTH_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.llm_cache', 'client_health.json')
+CLIENT_HEALTH_TTL = float(os.getenv('VANNA_HEALTH_TTL', 6 * 3600))
+_client_health_lock = threading.Lock()
+
+def _read_client_health():
+    try:
+        with open(CLIENT_HEALTH_PATH, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def _write_client_health(cache):
+    with _client_health_lock:
+        os.makedirs(os.path.dirname(CLIENT_HEALTH_PATH), exist_ok=True)
+        tmp_path = f"{CLIENT_HEALTH_PATH}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(cache, f, indent=2)
+        os.replace(tmp_path, CLIENT_HEALTH_PATH)
+
+def _parse_json_array(response):
+    """The JSON array in a model reply, tolerating code fences and surrounding text"""
+    if not response:
+        raise ValueError("empty response")
+    start, end = response.find('['), response.rfind(']')
+    if start < 0 or end < start:
+        raise ValueError("no JSON array in response")
+    entries = json.loads(response[start:end + 1])
+    if not isinstance(entries, list):
+        raise ValueError("response is not a JSON array")
+    return entries
+
 class VannaSQL:
-    def __init__(self):
-        """Initialize Vanna with multiple fallback approaches"""
+    def __init__(self, warm_up=None, base_url=None):
+        """Initialize Vanna with multiple fallback approaches
+        
+        Construction makes no network request: the client is chosen and health-checked on first use.
+        warm_up=True (or VANNA_WARMUP=on) does that in a background thread right away.
+        base_url (or LLM_BASE_URL) points the OpenAI client at another endpoint.
+        """
+        
+        # Byte-identical prompts from earlier runs are answered from the local response cache
+        self.llm_cache = shared_cache()
+        # API calls wait for requests/tokens-per-minute quota and back off when rate limited
+        self.rate_limiter = shared_limiter()
+        # Tokens and latency of every API request, per call site
+        self.usage_log = shared_usage_log()
+        # Dataset versions already trained into each Vanna store
+        self.training_manifest = shared_training_manifest()
         
         # Always set dataset paths first
         # Dataset file mappings (matching layer2.js table naming convention)
-        self.dataset_paths = {
-            'crime_data': '../../../public/dataset/london/crime-rates/london_crime_data_2022_2023.csv',
-            'ethnicity_data': '../../../public/dataset/london/ethnicity/Ethnic group.csv',
-            'birth_country_data': '../../../public/dataset/london/country-of-births/cob-borough.csv',
-            'population_data': '../../../public/dataset/london/population/population 1801 to 2021.csv',
-            'income_data': '../../../public/dataset/london/income/income-of-tax-payers.csv',
-            'house_price_data': '../../../public/dataset/london/house-prices/land-registry-house-prices-borough.csv',
-            'education_data': '../../../public/dataset/london/schools-colleges/2022-2023_england_school_information.csv',
-            'vehicle_data': '../../../public/dataset/london/vehicles/vehicles-licensed-type-borough_2023.csv',
-            'restaurant_data': '../../../public/dataset/london/restaurants/licensed-restaurants-cafes-borough_Restaurants-units.csv',
-            'rent_data': '../../../public/dataset/london/private-rent/voa-average-rent-borough_Raw-data.csv',
-            'gym_data': '../../../public/dataset/london/gyms/london_gym_facilities_2024.csv',
-            'library_data': '../../../public/dataset/london/libraries/libraries-by-areas-chart.csv'
-        }
+        self.dataset_paths = dict(DATASET_PATHS)
+        # Columns, sample rows and date formats per table, read once and kept on disk
+        self.schema_registry = shared_registry(self.dataset_paths)
         
         # Try to get API key from environment
         api_key = os.getenv('OPENAI_API_KEY')
@@ -70,154 +122,248 @@ class VannaSQL:
             except:
                 pass
         
-        if not api_key:
-            print("❌ OPENAI_API_KEY not found in environment or .env.local")
-            self.vn = None
-            self.api_key = None
-            self.use_direct_openai = False
-            return
+        # LLM_BASE_URL points the OpenAI clients at another endpoint (e.g. openai_standin.py)
+        self.base_url = base_url or os.getenv('LLM_BASE_URL') or None
         
         self.api_key = api_key
-        print(f"✅ Found OpenAI API key: {api_key[:10]}...")
+        if self.base_url:
+            print(f"🧪 Using OpenAI-compatible endpoint {self.base_url}")
+            self.api_key = api_key or 'sk-standin'
+        elif api_key:
+            print(f"✅ Found OpenAI API key: {api_key[:10]}...")
+        else:
+            print("❌ OPENAI_API_KEY not found in environment or .env.local")
         
-        # Try Vanna Remote first
-        self.vn = None
-        if VANNA_REMOTE_AVAILABLE:
-            try:
-                print("🔄 Trying VannaDefault (remote)...")
-                vn = VannaDefault(model='gpt-4o', api_key=api_key)
-                
-                # Test it with a simple query
-                test_sql = vn.generate_sql("SELECT 1")
-                self.vn = vn
-                self.use_direct_openai = False
-                print("✅ VannaDefault initialized successfully")
-                return
-            except Exception as e:
-                print(f"⚠️  VannaDefault failed: {e}")
+        # No client is built or probed here; the first use selects one (see _select_client)
+        self._client_lock = threading.Lock()
+        self._client_selected = False
+        self._vn = None
+        self._use_direct_openai = False
+        self._openai_client = None
+        self.client_kind = None
         
-        # Try Local Vanna
-        if VANNA_LOCAL_AVAILABLE:
-            try:
-                print("🔄 Trying LocalVanna...")
-                vn = LocalVanna(config={'api_key': api_key, 'model': 'gpt-4o'})
-                self.vn = vn
-                self.use_direct_openai = False
-                print("✅ LocalVanna initialized successfully")
-                return
-            except Exception as e:
-                print(f"⚠️  LocalVanna failed: {e}")
+        if warm_up is None:
+            warm_up = os.getenv('VANNA_WARMUP', 'off').lower() in ('1', 'on', 'true')
+        if warm_up:
+            threading.Thread(target=self._select_client, name='vanna-warmup', daemon=True).start()
+    
+    @property
+    def vn(self):
+        self._select_client()
+        return self._vn
+    
+    @property
+    def use_direct_openai(self):
+        self._select_client()
+        return self._use_direct_openai
+    
+    @property
+    def openai_client(self):
+        self._select_client()
+        return self._openai_client
+    
+    def _select_client(self):
+        """Pick the first client that passes its health check, once per instance
         
-        # Fallback to direct OpenAI API
-        if OPENAI_AVAILABLE:
-            try:
-                print("🔄 Using direct OpenAI API...")
-                from openai import OpenAI
-                
-                # Initialize OpenAI client with new format
-                self.openai_client = OpenAI(api_key=api_key)
-                
-                # Test the API
-                response = self.openai_client.chat.completions.create(
-                    model="gpt-4o",
-                    messages=[{"role": "user", "content": "Hello"}],
-                    max_tokens=10
-                )
-                
-                self.vn = None  # We'll handle this directly
-                self.use_direct_openai = True
-                print("✅ Direct OpenAI API initialized successfully")
+        Order: VannaDefault (remote), LocalVanna, direct OpenAI, legacy OpenAI. Health results are
+        cached on disk for CLIENT_HEALTH_TTL seconds, so later processes skip the probe requests.
+        """
+        if self._client_selected:
+            return
+        with self._client_lock:
+            if self._client_selected:
                 return
-            except Exception as e:
-                print(f"⚠️  Direct OpenAI failed: {e}")
-                # Try legacy format
+            
+            for kind in self._candidate_clients():
                 try:
-                    print("🔄 Trying legacy OpenAI format...")
-                    import openai as openai_legacy
-                    openai_legacy.api_key = api_key
-                    
-                    # Test the legacy API
-                    response = openai_legacy.ChatCompletion.create(
-                        model="gpt-4o",
-                        messages=[{"role": "user", "content": "Hello"}],
-                        max_tokens=10
-                    )
-                    
-                    self.vn = None
-                    self.use_direct_openai = True
-                    self.openai_client = None  # Use legacy format
-                    print("✅ Legacy OpenAI API initialized successfully")
-                    return
-                except Exception as legacy_error:
-                    print(f"⚠️  Legacy OpenAI also failed: {legacy_error}")
-        
-        # All methods failed
-        print("❌ All initialization methods failed")
-        self.vn = None
-        self.use_direct_openai = False
+                    client = self._build_client(kind)
+                except Exception as e:
+                    print(f"⚠️  {kind} could not be created: {e}")
+                    continue
+                # A redirected endpoint is not probed: its errors are part of the test setup
+                if not self.base_url and not self.health_check(kind, client):
+                    continue
+                
+                if kind in ('VannaDefault', 'LocalVanna'):
+                    self._vn = client
+                else:
+                    self._use_direct_openai = True
+                    self._openai_client = client
+                self.client_kind = kind
+                print(f"✅ {kind} selected for SQL generation")
+                break
+            else:
+                if self.api_key:
+                    print("❌ All initialization methods failed")
+            
+            self._client_selected = True
+    
+    def _candidate_clients(self):
+        """Client kinds importable in this environment, in order of preference"""
+        if not self.api_key:
+            return []
+        if self.base_url:
+            # Vanna clients talk to their own endpoints, so only the direct client can be redirected
+            return ['OpenAI'] if OPENAI_AVAILABLE else []
+        candidates = []
+        if VANNA_REMOTE_AVAILABLE:
+            candidates.append('VannaDefault')
+        if VANNA_LOCAL_AVAILABLE:
+            candidates.append('LocalVanna')
+        if OPENAI_AVAILABLE:
+            candidates += ['OpenAI', 'OpenAI (legacy)']
+        return candidates
+    
+    def _build_client(self, kind):
+        """Construct a client without any network request"""
+        if kind == 'VannaDefault':
+            return VannaDefault(model='gpt-4o', api_key=self.api_key)
+        if kind == 'LocalVanna':
+            # Persistent store: what earlier runs trained is still there (see training_manifest.py)
+            return LocalVanna(config={'api_key': self.api_key, 'model': 'gpt-4o', 'path': chroma_path()})
+        if kind == 'OpenAI':
+            from openai import OpenAI
+            return OpenAI(api_key=self.api_key, base_url=self.base_url)
+        import openai as openai_legacy
+        openai_legacy.api_key = self.api_key
+        return None  # Legacy calls go through the module
+    
+    def _probe_client(self, kind, client):
+        """One minimal live request against a client; raises if it does not work"""
+        if kind == 'VannaDefault':
+            client.generate_sql("SELECT 1")
+        elif kind == 'OpenAI':
+            client.chat.completions.create(
+                model="gpt-4o",
+                messages=[{"role": "user", "content": "Hello"}],
+                max_tokens=10
+            )
+        elif kind == 'OpenAI (legacy)':
+            import openai as openai_legacy
+            openai_legacy.ChatCompletion.create(
+                model="gpt-4o",
+                messages=[{"role": "user", "content": "Hello"}],
+                max_tokens=10
+            )
+        # LocalVanna has no remote endpoint of its own to check
+    
+    def health_check(self, kind, client, refresh=False):
+        """Whether a client works, from the health cache when a fresh entry exists"""
+        key = f"{kind}:{hashlib.sha256(self.api_key.encode('utf-8')).hexdigest()[:16]}"
+        cache = _read_client_health()
+        entry = cache.get(key)
+        if entry and not refresh and time.time() - entry['checked_at'] < CLIENT_HEALTH_TTL:
+            if not entry['ok']:
+                print(f"⚠️  {kind} skipped (failed health check {int(time.time() - entry['checked_at'])}s ago)")
+            return entry['ok']
+        
+        print(f"🔄 Checking {kind}...")
+        try:
+            self.rate_limiter.call(lambda: self._probe_client(kind, client), estimate_tokens("", "Hello", 10))
+            entry = {'ok': True, 'checked_at': time.time()}
+        except Exception as e:
+            print(f"⚠️  {kind} failed: {e}")
+            if 'Connection' in type(e).__name__ or 'Timeout' in type(e).__name__:
+                return False  # Offline or unreachable: try again next process rather than remember it
+            entry = {'ok': False, 'error': str(e), 'checked_at': time.time()}
+        
+        cache = _read_client_health()
+        cache[key] = entry
+        _write_client_health(cache)
+        return entry['ok']
+    
     def generate_sql_direct(self, prompt):
         """Generate SQL using direct OpenAI API when Vanna is not available"""
         if not self.use_direct_openai or not OPENAI_AVAILABLE:
             return None
         
         try:
-            if hasattr(self, 'openai_client') and self.openai_client:
-                # Use new OpenAI client format
-                response = self.openai_client.chat.completions.create(
-                    model="gpt-4o",
-                    messages=[
-                        {"role": "system", "content": "You are an expert SQL developer. Generate only valid SQL queries based on user requests."},
-                        {"role": "user", "content": prompt}
-                    ],
-                    max_tokens=500,
-                    temperature=0.1
-                )
-                return response.choices[0].message.content.strip()
-            else:
-                # Use legacy format
-                import openai as openai_legacy
-                response = openai_legacy.ChatCompletion.create(
-                    model="gpt-4o",
-                    messages=[
-                        {"role": "system", "content": "You are an expert SQL developer. Generate only valid SQL queries based on user requests."},
-                        {"role": "user", "content": prompt}
-                    ],
-                    max_tokens=500,
-                    temperature=0.1
-                )
-                return response.choices[0].message.content.strip()
-                
+            return self.complete_chat(SQL_SYSTEM_PROMPT, prompt, max_tokens=500, label='generate_sql')
         except Exception as e:
             print(f"❌ Direct OpenAI SQL generation failed: {e}")
             return None
     
-    def train_on_csv(self, dataset_name, csv_path=None, sample_size=1000):
+    def complete_chat(self, system_prompt, user_prompt, max_tokens=500, temperature=0.1, label='chat'):
+        """
+        One chat completion through the response cache and rate limiter; None if no client works
+        
+        Unlike vanna_generate, the reply is returned as written (no SQL extraction), so this is
+        the call to use for structured responses. Every client sends the same gpt-4o chat, so the
+        cache is keyed by the prompt alone and checked before a client is selected: cache hits need
+        no client and no network. API requests are logged under label.
+        """
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt}
+        ]
+        tokens = estimate_tokens(system_prompt, user_prompt, max_tokens)
+        
+        def call():
+            # Only a cache miss selects (and, if due, health-checks) a client
+            if self.use_direct_openai:
+                model = "gpt-4o"
+                
+                def request():
+                    if self.openai_client:
+                        # Use new OpenAI client format
+                        response = self.openai_client.chat.completions.create(
+                            model="gpt-4o", messages=messages, max_tokens=max_tokens, temperature=temperature
+                        )
+                    else:
+                        # Use legacy format
+                        import openai as openai_legacy
+                        response = openai_legacy.ChatCompletion.create(
+                            model="gpt-4o", messages=messages, max_tokens=max_tokens, temperature=temperature
+                        )
+                    return response
+            elif self.vn is not None:
+                model = f"vanna:{type(self.vn).__name__}:gpt-4o:chat"
+                
+                def request():
+                    return self.vn.submit_prompt([self.vn.system_message(system_prompt),
+                                                  self.vn.user_message(user_prompt)])
+            else:
+                return None
+            reply = self.rate_limiter.call(self.usage_log.track(label, model, request), tokens)
+            return reply.strip() if reply else reply
+        
+        return self.llm_cache.complete(call, model=CHAT_MODEL, system_prompt=system_prompt, user_prompt=user_prompt,
+                                       temperature=temperature, max_tokens=max_tokens)
+    
+    def vanna_generate(self, prompt, label='generate_sql'):
+        """self.vn.generate_sql through the response cache; None if no Vanna client works
+
+        Vanna builds the system prompt from its trained context itself, so entries are keyed by the
+        question and the training manifest's fingerprint: retraining gives new keys. The cache is
+        checked before a client is selected.
         """
-        Train Vanna on a CSV dataset
+        model = f"vanna:{self.training_manifest.fingerprint()}:gpt-4o"
+        tokens = estimate_tokens("", prompt)
+        
+        def call():
+            if self.vn is None:
+                return None
+            request = self.usage_log.track(label, f"vanna:{type(self.vn).__name__}:gpt-4o",
+                                           lambda: self.vn.generate_sql(prompt))
+            return self.rate_limiter.call(request, tokens)
+        
+        return self.llm_cache.complete(call, model=model, system_prompt="", user_prompt=prompt)
+    
+    def train_on_csv(self, dataset_name, csv_path=None, sample_size=1000, force=False):
+        """
+        Train Vanna on a CSV dataset, unless this version of it is already in the Vanna store
         
         Args:
             dataset_name (str): Name of the dataset (e.g. 'crime-rates' or 'crime_data')
             csv_path (str): Optional path to CSV file (uses dataset_paths if not provided)
             sample_size (int): Number of rows to sample for training
+            force (bool): Train even if the training manifest already has this dataset version
+            
+        Returns:
+            str: 'trained', 'skipped' (already trained), 'unavailable' (no Vanna client) or 'failed'
         """
         try:
-            # Map dataset name to table name if needed
-            dataset_to_table = {
-                'crime-rates': 'crime_data',
-                'ethnicity': 'ethnicity_data', 
-                'population': 'population_data',
-                'income': 'income_data',
-                'house-prices': 'house_price_data',
-                'country-of-births': 'birth_country_data',
-                'schools-colleges': 'education_data',
-                'vehicles': 'vehicle_data',
-                'restaurants': 'restaurant_data',
-                'private-rent': 'rent_data',
-                'gyms': 'gym_data',
-                'libraries': 'library_data'
-            }
-            
-            table_name = dataset_to_table.get(dataset_name, dataset_name)
+            table_name = DATASET_TABLES.get(dataset_name, dataset_name)
             
             # Get CSV path
             if csv_path is None:
@@ -225,46 +371,85 @@ class VannaSQL:
                     raise ValueError(f"Dataset '{table_name}' not found in dataset_paths")
                 csv_path = self.dataset_paths[table_name]
             
+            # Only train if Vanna client is available
+            if self.vn is None:
+                print(f"⚠️  Vanna client not available, skipping training for {dataset_name}")
+                return 'unavailable'
+            
+            store = self._training_store()
+            fingerprint = dataset_fingerprint(csv_path, sample_size)
+            if fingerprint is None:
+                raise FileNotFoundError(f"No such file: {csv_path}")
+            if not force and self.training_manifest.is_trained(store, table_name, fingerprint):
+                print(f"⏭️  {dataset_name} already trained into {self.client_kind}, skipping")
+                return 'skipped'
+            
             print(f"📊 Loading dataset: {dataset_name} (table: {table_name})")
             print(f"📂 File path: {csv_path}")
             
-            # Load CSV data
-            df = pd.read_csv(csv_path)
-            print(f"✅ Loaded {len(df)} rows, {len(df.columns)} columns")
+            # Only the sampled rows are parsed into a frame
+            df_sample = sample_csv(csv_path, sample_size)
+            print(f"✅ Sampled {len(df_sample)} rows, {len(df_sample.columns)} columns for training")
             
-            # Sample data if too large
-            if len(df) > sample_size:
-                df_sample = df.sample(n=sample_size, random_state=42)
-                print(f"📉 Sampled {sample_size} rows for training")
-            else:
-                df_sample = df
+            print(f"🎓 Training Vanna on {dataset_name}...")
             
-            # Only train if Vanna client is available
-            if self.vn is not None:
-                print(f"🎓 Training Vanna on {dataset_name}...")
-                
-                # Train on data structure and sample content
-                self.vn.train(
-                    df=df_sample,
-                    documentation=f"This is the {table_name} dataset with columns: {', '.join(df.columns.tolist())}"
-                )
-                print(f"✅ Training completed for {dataset_name}")
-            else:
-                print(f"⚠️  Vanna client not available, skipping training for {dataset_name}")
+            # Train on data structure and sample content
+            self.vn.train(
+                df=df_sample,
+                documentation=f"This is the {table_name} dataset with columns: {', '.join(df_sample.columns.tolist())}"
+            )
+            self.training_manifest.record(store, table_name, fingerprint, len(df_sample))
+            print(f"✅ Training completed for {dataset_name}")
+            return 'trained'
                 
         except Exception as e:
             print(f"❌ Error training on {dataset_name}: {str(e)}")
+            return 'failed'
     
-    def train_all_datasets(self, sample_size=500):
-        """Train Vanna on all available datasets"""
-        print("🚀 Training Vanna on all London datasets...")
+    def train_datasets(self, dataset_names, sample_size=500, max_concurrency=None, force=False):
+        """
+        Train Vanna on several datasets, concurrently; datasets already in the store are skipped
         
-        for dataset_name in self.dataset_paths.keys():
-            print(f"\n--- Training on {dataset_name} ---")
-            self.train_on_csv(dataset_name, sample_size=sample_size)
+        Args:
+            dataset_names (list): Dataset or table names
+            sample_size (int): Number of rows to sample per dataset
+            max_concurrency (int): Datasets trained at once [default: VANNA_TRAIN_CONCURRENCY or 4]
+            force (bool): Retrain datasets the training manifest already has
             
+        Returns:
+            dict: dataset name -> train_on_csv status
+        """
+        dataset_names = list(dataset_names)
+        if self.vn is None:
+            print("⚠️  Vanna client not available, skipping training")
+            return {name: 'unavailable' for name in dataset_names}
+        
+        engine = AsyncValidationEngine(max_concurrency or int(os.getenv('VANNA_TRAIN_CONCURRENCY', 4)))
+        statuses = engine.run(dataset_names, lambda name: self.train_on_csv(name, sample_size=sample_size, force=force))
+        statuses = {name: 'failed' if isinstance(status, Exception) else status
+                    for name, status in zip(dataset_names, statuses)}
+        
+        counts = {}
+        for status in statuses.values():
+            counts[status] = counts.get(status, 0) + 1
+        print(f"🎓 Vanna training: {counts.get('trained', 0)} trained, {counts.get('skipped', 0)} already trained, "
+              f"{counts.get('failed', 0)} failed")
+        return statuses
+    
+    def train_all_datasets(self, sample_size=500, max_concurrency=None, force=False):
+        """Train Vanna on all available datasets"""
+        print("🚀 Training Vanna on all London datasets...")
+        self.train_datasets(self.dataset_paths.keys(), sample_size=sample_size,
+                            max_concurrency=max_concurrency, force=force)
         print("\n✅ All datasets training completed!")
     
+    def _training_store(self):
+        """Identity of the store vn.train writes to, as the training manifest keys it"""
+        if self.client_kind == 'LocalVanna':
+            return f"LocalVanna:{os.path.abspath(chroma_path())}"
+        # VannaDefault trains into the remote model of this API key
+        return f"{self.client_kind}:gpt-4o:{hashlib.sha256((self.api_key or '').encode()).hexdigest()[:12]}"
+    
     def ask_sql(self, question, dataset_context=""):
         """
         Ask Vanna to generate SQL for a natural language question
@@ -284,14 +469,14 @@ class VannaSQL:
                 
             print(f"🤔 Question: {full_question}")
             
-            # Try Vanna first if available
-            if self.vn is not None:
-                try:
-                    sql = self.vn.generate_sql(full_question)
+            # Try Vanna first (a cached answer needs no client)
+            try:
+                sql = self.vanna_generate(full_question)
+                if sql is not None:
                     print(f"📝 Generated SQL (Vanna):\n{sql}")
                     return sql
-                except Exception as e:
-                    print(f"⚠️  Vanna generate_sql failed: {e}")
+            except Exception as e:
+                print(f"⚠️  Vanna generate_sql failed: {e}")
             
             # Try direct OpenAI if available
             if self.use_direct_openai:
@@ -328,17 +513,37 @@ class VannaSQL:
         try:
             dataset = proposition_data.get('dataset', '')
             original_sql = proposition_data.get('sql_query', '')
-            expected_output = proposition_data.get('example', [])
             proposition_id = proposition_data.get('proposition_id', '')
-            variables_needed = proposition_data.get('variables_needed', [])
-            description = proposition_data.get('reworded_proposition', '')
             
             print(f"🔍 Validating SQL for proposition: {proposition_id}")
             print(f"📊 Dataset: {dataset}")
             print(f"📝 Original SQL: {original_sql}")
             
-            # Check if any client is available
-            if self.vn is None and not self.use_direct_openai:
+            # Queries that compile against the local schema need no model call
+            prevalidated, engine_error = self._prevalidate(proposition_data)
+            if prevalidated:
+                print("✅ Validation completed - Status: valid (compiles against local schema)")
+                return prevalidated
+            if engine_error:
+                print(f"❌ SQLite: {engine_error}")
+            
+            # Shared instructions are in the system prompt; the schema block is kept within budget
+            system_prompt, user_prompt = validation_prompt(
+                proposition_data,
+                dataset_context(self.schema_registry, self.dataset_paths, dataset),
+                engine_error
+            )
+            print(f"📏 Prompt: {prompt_tokens(system_prompt, user_prompt)} tokens")
+            
+            # Get SQL validation response (Vanna's submit_prompt or direct OpenAI)
+            response = None
+            try:
+                response = self.complete_chat(system_prompt, user_prompt, max_tokens=500, label='validate')
+            except Exception as e:
+                print(f"⚠️  SQL validation request failed: {e}")
+            
+            if response is None and self.vn is None and not self.use_direct_openai:
+                # Not cached and no client to ask
                 print("⚠️  No SQL validation client available, skipping validation")
                 return {
                     "proposition_id": proposition_id,
@@ -349,106 +554,6 @@ class VannaSQL:
                     "issues_found": ["No SQL validation client available"],
                     "validation_response": "Skipped - No validation client initialized"
                 }
-            
-            # Get actual dataset schema info
-            dataset_info = ""
-            
-            # Map dataset name to table name (matching layer2.js convention)
-            dataset_to_table = {
-                'crime-rates': 'crime_data',
-                'ethnicity': 'ethnicity_data', 
-                'population': 'population_data',
-                'income': 'income_data',
-                'house-prices': 'house_price_data',
-                'country-of-births': 'birth_country_data',
-                'schools-colleges': 'education_data',
-                'vehicles': 'vehicle_data',
-                'restaurants': 'restaurant_data',
-                'private-rent': 'rent_data',
-                'gyms': 'gym_data',
-                'libraries': 'library_data'
-            }
-            
-            table_name = dataset_to_table.get(dataset, dataset + '_data')
-            
-            if table_name in self.dataset_paths:
-                try:
-                    import pandas as pd
-                    df = pd.read_csv(self.dataset_paths[table_name])
-                    columns = df.columns.tolist()
-                    sample_data = df.head(3).to_dict('records')
-                    dataset_info = f"Available columns: {', '.join(columns)}\nSample data: {sample_data}"
-                except:
-                    dataset_info = "Could not load dataset schema"
-            
-            # Create validation prompt
-            validation_prompt = f"""
-            CRITICAL: You are validating SQL for the {dataset} dataset. Before suggesting any fixes, you MUST carefully examine the actual data format in this specific dataset.
-            
-            ORIGINAL SQL QUERY:
-            {original_sql}
-            
-            DATASET INFO:
-            {dataset_info}
-            
-            EXPECTED OUTPUT STRUCTURE:
-            {expected_output}
-            
-            REQUIRED VARIABLES:
-            {', '.join(variables_needed) if variables_needed else 'Not specified'}
-            
-            QUERY PURPOSE:
-            {description if description else 'Not specified'}
-            
-            CRITICAL DATE/TIME FORMAT VALIDATION:
-            1. Each dataset has DIFFERENT date/time formats - DO NOT assume!
-            2. For crime-rates dataset: date column contains "2022-01" format (YYYY-MM), NOT full dates like "2022-01-01"
-            3. For other datasets: You MUST check what the actual date format is before suggesting changes
-            4. NEVER change date filtering unless you're certain the current format is wrong for the actual data
-            5. Common mistake: changing BETWEEN '2022-01' AND '2023-12' to BETWEEN '2022-01-01' AND '2023-12-31' when data has YYYY-MM format
-            
-            Please analyze this SQL query and check for:
-            1. **FIRST PRIORITY**: Verify date/time format compatibility with actual data
-            2. Wrong table names (should match actual dataset structure)
-            3. Wrong column names (check against available columns)
-            4. Syntax errors (GROUP BY, aggregation functions, etc.)
-            5. Logic errors (incorrect aggregations, wrong filters)
-            6. Missing or incorrect data types
-            
-            EXAMPLES OF CORRECT DATE FILTERING:
-            - If date column has "2022-01" format: WHERE date BETWEEN '2022-01' AND '2023-12'
-            - If date column has full dates: WHERE date BETWEEN '2022-01-01' AND '2023-12-31'  
-            - If using year column (integer): WHERE year BETWEEN 2022 AND 2023
-            
-            If issues are found, provide a corrected SQL query that:
-            - Uses correct table/column names for the {dataset} dataset
-            - Uses date filtering that matches the ACTUAL data format
-            - Produces the expected output structure: {expected_output}
-            - Handles the data appropriately for this dataset
-            - Follows proper SQL syntax
-            
-            Return your response in this format:
-            ISSUES FOUND: [list any issues, or "None" if query is correct - be specific about date format]
-            CORRECTED SQL: [provide fixed SQL query only if needed]
-            """
-            
-            # Get SQL validation response
-            response = None
-            
-            if self.vn is not None:
-                # Use Vanna client
-                try:
-                    response = self.vn.generate_sql(validation_prompt)
-                except Exception as e:
-                    print(f"⚠️  Vanna generate_sql failed: {e}")
-            
-            if response is None and self.use_direct_openai:
-                # Use direct OpenAI API
-                try:
-                    response = self.generate_sql_direct(validation_prompt)
-                except Exception as e:
-                    print(f"⚠️  Direct OpenAI failed: {e}")
-            
             if response is None:
                 # All methods failed
                 return {
@@ -490,7 +595,8 @@ class VannaSQL:
                 "original_sql": original_sql,
                 "fixed_sql": fixed_sql,
                 "issues_found": issues_found,
-                "validation_response": response
+                "validation_response": response,
+                "validated_by": "llm"
             }
             
             print(f"✅ Validation completed - Status: {status}")
@@ -513,7 +619,88 @@ class VannaSQL:
                 "error": str(e)
             }
 
-    def fix_sql_with_context(self, original_sql, error_message, question=""):
+    def _prevalidate(self, proposition_data):
+        """(valid result, None) if the query passes the local schema checks, else (None, SQLite or check error)"""
+        original_sql = proposition_data.get('sql_query', '')
+        compiles, engine_error = shared_schema_database(self.schema_registry).check(original_sql)
+        if not compiles:
+            return None, engine_error
+        return {
+            "proposition_id": proposition_data.get('proposition_id', ''),
+            "dataset": proposition_data.get('dataset', ''),
+            "status": "valid",
+            "original_sql": original_sql,
+            "fixed_sql": original_sql,
+            "issues_found": [],
+            "validation_response": "Pre-validated: compiles against the local dataset schema, names and date literals match",
+            "validated_by": "schema"
+        }, None
+    
+    def validate_proposition_batch(self, propositions, engine_errors=None):
+        """
+        Validate several propositions of one dataset with a single request
+        
+        The schema and the date-format rules are stated once and the model answers with a JSON
+        array keyed by proposition_id. Propositions the reply does not cover (or all of them, if
+        the reply cannot be parsed) are validated one by one with validate_proposition_sql.
+        
+        Args:
+            propositions (list): Proposition dictionaries, all from the same dataset
+            engine_errors (dict): Optional proposition_id -> SQLite error from pre-validation
+            
+        Returns:
+            list: Validation results, in input order
+        """
+        dataset = propositions[0].get('dataset', '')
+        system_prompt, batch_prompt = batch_validation_prompt(
+            propositions, dataset_context(self.schema_registry, self.dataset_paths, dataset), engine_errors
+        )
+        
+        print(f"📦 Validating {len(propositions)} {dataset} propositions in one request")
+        entries = {}
+        try:
+            response = self.complete_chat(system_prompt, batch_prompt, max_tokens=min(4000, 300 * len(propositions)),
+                                          label='validate_batch')
+            entries = {str(entry.get('proposition_id')): entry for entry in _parse_json_array(response)
+                       if isinstance(entry, dict)}
+        except Exception as e:
+            print(f"⚠️  Batched validation failed, validating one by one: {e}")
+        
+        results = []
+        for proposition in propositions:
+            proposition_id = proposition.get('proposition_id', '')
+            entry = entries.get(str(proposition_id))
+            if entry is None:
+                results.append(self.validate_proposition_sql(proposition))
+                continue
+            
+            original_sql = proposition.get('sql_query', '')
+            issues = entry.get('issues') or []
+            issues_found = [str(issue) for issue in (issues if isinstance(issues, list) else [issues])]
+            fixed_sql = (entry.get('corrected_sql') or original_sql).strip()
+            
+            if not issues_found:
+                status = "valid"
+                fixed_sql = original_sql
+            elif fixed_sql != original_sql:
+                status = "fixed"
+            else:
+                status = "needs_attention"
+            
+            results.append({
+                "proposition_id": proposition_id,
+                "dataset": proposition.get('dataset', ''),
+                "status": status,
+                "original_sql": original_sql,
+                "fixed_sql": fixed_sql,
+                "issues_found": issues_found,
+                "validation_response": json.dumps(entry),
+                "validated_by": "llm_batch"
+            })
+        
+        return results
+
+    def fix_sql_with_context(self, original_sql, error_message, question="", schema=None, dataset=""):
         """
         Fix SQL query using error context
         
@@ -521,26 +708,29 @@ class VannaSQL:
             original_sql (str): The SQL query that failed
             error_message (str): Error message from execution
             question (str): Original question/intent
+            schema (str): Schema block of the queried table [default: from the schema registry]
+            dataset (str): Dataset name, used for the schema block when none is given
             
         Returns:
-            str: Fixed SQL query
+            str: Fixed SQL query, or None if no client is available or the request failed
         """
         try:
-            fix_prompt = f"""
-            The following SQL query failed with an error:
-            
-            Original SQL: {original_sql}
-            Error: {error_message}
-            Original Question: {question}
-            
-            Please provide a corrected SQL query that fixes this error.
-            """
+            if schema is None:
+                schema = dataset_context(self.schema_registry, self.dataset_paths, dataset)
+            system_prompt, user_prompt = repair_prompt(
+                {'sql_query': original_sql, 'error': error_message, 'question': question}, schema
+            )
             
             print(f"🔧 Attempting to fix SQL query...")
             print(f"❌ Original error: {error_message}")
             
-            # Use Vanna to generate a fixed query
-            fixed_sql = self.vn.generate_sql(fix_prompt)
+            fixed_sql = self.complete_chat(system_prompt, user_prompt, max_tokens=500, label='fix_sql')
+            if fixed_sql is None and self.vn is None and not self.use_direct_openai:
+                print("⚠️  No client available to fix SQL")
+                return None
+            if not fixed_sql:
+                return None
+            fixed_sql = CODE_FENCE.sub('', fixed_sql).strip()
             print(f"✅ Fixed SQL:\n{fixed_sql}")
             
             return fixed_sql
@@ -548,30 +738,111 @@ class VannaSQL:
         except Exception as e:
             print(f"❌ Error fixing SQL: {str(e)}")
             return None
+    
+    def fix_sql_batch(self, items, schema):
+        """
+        Fix several failed queries on the same table with a single request
+        
+        Args:
+            items (list): Dicts with proposition_id, sql_query, error and (optionally) question
+            schema (str): Schema block of the table the queries read
+            
+        Returns:
+            dict: proposition_id -> fixed SQL; items the reply does not cover are fixed one by one
+        """
+        fixes = {}
+        if len(items) > 1:
+            system_prompt, user_prompt = batch_repair_prompt(items, schema)
+            try:
+                response = self.complete_chat(system_prompt, user_prompt, max_tokens=min(4000, 300 * len(items)),
+                                              label='fix_sql_batch')
+                fixes = {str(entry.get('proposition_id')): CODE_FENCE.sub('', entry['sql']).strip()
+                         for entry in _parse_json_array(response) if isinstance(entry, dict) and entry.get('sql')}
+            except Exception as e:
+                print(f"⚠️  Batched SQL repair failed, fixing one by one: {e}")
+        
+        for item in items:
+            proposition_id = str(item.get('proposition_id', ''))
+            if proposition_id not in fixes:
+                fixes[proposition_id] = self.fix_sql_with_context(item.get('sql_query', ''), item.get('error', ''),
+                                                                  item.get('question', ''), schema=schema)
+        return fixes
 
-    def batch_validate_propositions(self, propositions_list):
+    def batch_validate_propositions(self, propositions_list, max_concurrency=None, batch_size=None):
         """
-        Validate multiple propositions at once
+        Validate multiple propositions concurrently
         
         Args:
             propositions_list (list): List of proposition dictionaries
+            max_concurrency (int): Requests in flight at once (LLM_MAX_CONCURRENCY by default)
+            batch_size (int): Propositions of one dataset per request (VALIDATION_BATCH_SIZE,
+                default 8); 1 sends one request per proposition
             
         Returns:
-            list: List of validation results
+            list: List of validation results, in input order
         """
         print(f"🚀 Starting batch validation of {len(propositions_list)} propositions...")
         
-        results = []
-        for i, proposition in enumerate(propositions_list):
-            print(f"\n--- Processing {i+1}/{len(propositions_list)} ---")
-            result = self.validate_proposition_sql(proposition)
-            results.append(result)
+        engine = AsyncValidationEngine(max_concurrency)
+        batch_size = batch_size or int(os.getenv('VALIDATION_BATCH_SIZE', 8))
+        
+        def error_result(proposition, error):
+            return {
+                "proposition_id": proposition.get('proposition_id', ''),
+                "dataset": proposition.get('dataset', ''),
+                "status": "error",
+                "original_sql": proposition.get('sql_query', ''),
+                "fixed_sql": None,
+                "issues_found": [f"Validation error: {str(error)}"],
+                "error": str(error)
+            }
+        
+        if batch_size <= 1:
+            def report(index, proposition, result):
+                status = result['status'] if isinstance(result, dict) else 'error'
+                print(f"--- {index + 1}/{len(propositions_list)} {proposition.get('proposition_id', '')}: {status} ---")
+            
+            results = []
+            for proposition, result in zip(propositions_list, engine.run(propositions_list, self.validate_proposition_sql, report)):
+                if isinstance(result, Exception):
+                    result = error_result(proposition, result)
+                results.append(result)
+        else:
+            # Queries that compile locally are done; the rest go to the model in per-dataset groups
+            results = [None] * len(propositions_list)
+            engine_errors = {}
+            pending = {}
+            for index, proposition in enumerate(propositions_list):
+                prevalidated, engine_error = self._prevalidate(proposition)
+                if prevalidated:
+                    results[index] = prevalidated
+                else:
+                    engine_errors[proposition.get('proposition_id', '')] = engine_error
+                    pending.setdefault(proposition.get('dataset', ''), []).append(index)
+            
+            groups = [indices[i:i + batch_size] for indices in pending.values()
+                      for i in range(0, len(indices), batch_size)]
+            
+            def validate_group(indices):
+                return self.validate_proposition_batch([propositions_list[i] for i in indices], engine_errors)
+            
+            def report(number, indices, group_results):
+                print(f"--- group {number + 1}/{len(groups)}: {len(indices)} propositions ---")
+            
+            for indices, group_results in zip(groups, engine.run(groups, validate_group, report)):
+                for position, index in enumerate(indices):
+                    if isinstance(group_results, Exception):
+                        results[index] = error_result(propositions_list[index], group_results)
+                    else:
+                        results[index] = group_results[position]
             
         # Summary
         valid = len([r for r in results if r['status'] == 'valid'])
         fixed = len([r for r in results if r['status'] == 'fixed'])
         errors = len([r for r in results if r['status'] == 'error'])
         needs_attention = len([r for r in results if r['status'] == 'needs_attention'])
+        prevalidated = len([r for r in results if r.get('validated_by') == 'schema'])
+        batched = len([r for r in results if r.get('validated_by') == 'llm_batch'])
         
         print(f"\n📊 BATCH VALIDATION SUMMARY:")
         print(f"Total: {len(results)}")
@@ -579,6 +850,13 @@ class VannaSQL:
         print(f"Fixed: {fixed}")
         print(f"Errors: {errors}")
         print(f"Needs Attention: {needs_attention}")
+        print(f"Valid without LLM call (compiled locally): {prevalidated}")
+        if batch_size > 1:
+            print(f"Validated in batched requests: {batched}")
+        cache = self.llm_cache.summary()
+        if cache['enabled']:
+            print(f"LLM cache: {cache['hits']} hits, {cache['misses']} misses ({cache['entries']} stored)")
+        engine.print_summary()
         
         return results
 
@@ -127,12 +127,8 @@ class VannaPropositionFixer:
         # First, train Vanna on key datasets
         print("\n📚 Training Vanna on key datasets...")
         key_datasets = ['crime-rates', 'house-prices', 'ethnicity', 'population', 'vehicles']
-        
-        for dataset in key_datasets:
-            try:
-                self.vanna.train_on_csv(dataset, sample_size=300)
-            except Exception as e:
-                print(f"⚠️  Warning: Could not train on {dataset}: {str(e)}")
+        # Concurrent; datasets already trained into the Vanna store are skipped
+        self.vanna.train_datasets(key_datasets, sample_size=300)
         
         # Find all proposition files
         proposition_files = self.find_proposition_files()